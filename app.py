@@ -2,14 +2,27 @@
 # Gabinete Personal — app.py (completo, bonito, sqlite3 + assets/)
 # ===========================================
 from __future__ import annotations
-import io, csv, sqlite3
-from zipfile import ZipFile, ZIP_DEFLATED
+import json, sqlite3, time
 from pathlib import Path
-from datetime import datetime
 from typing import List, Dict, Any
 
 import streamlit as st
-from PIL import Image
+
+import archive
+import backup
+import banners
+# pandas y export/zipfile (Panel docente) y rizoma/NumPy (Fase 4) se importan en
+# su página: el resto de las páginas no paga esos ~0.6 s en el arranque en frío
+import drafts
+import gabinete_db as gdb
+import media
+import metrics
+import storage
+from gabinete_db import get_pool
+from media import save_audio
+from write_queue import Deferred, get_write_queue
+
+rerun_started = time.perf_counter()   # ver end_rerun()
 
 # ---------------- Config ----------------
 APP_TITLE = "Gabinete Personal – Metodologías del Pensamiento Creativo"
@@ -17,95 +30,96 @@ APP_DESC  = "Captura tu arte-objeto, reflexiona, sube imágenes y audio/Suno y c
 st.set_page_config(page_title=APP_TITLE, page_icon="🗝️", layout="wide")
 
 BASE_DIR   = Path(__file__).parent
-DATA_DIR   = BASE_DIR / "data"
-DB_PATH    = DATA_DIR / "gabinete.db"
+DATA_DIR   = gdb.DATA_DIR
+DB_PATH    = gdb.DB_PATH
 UPLOADS    = DATA_DIR / "uploads"
 IMG_DIR    = UPLOADS / "images"
 AUDIO_DIR  = UPLOADS / "audio"
 ASSETS_DIR = BASE_DIR / "assets"
 
-for p in [DATA_DIR, UPLOADS, IMG_DIR, AUDIO_DIR]:
-    p.mkdir(parents=True, exist_ok=True)
+@st.cache_resource(show_spinner=False)
+def bootstrap() -> gdb.ConnectionPool:
+    """Una sola vez por proceso (no en cada rerun): carpetas, esquema, copias programadas y banners."""
+    for p in [DATA_DIR, UPLOADS, IMG_DIR, AUDIO_DIR]:
+        p.mkdir(parents=True, exist_ok=True)
+    backup.get_scheduler()
+    banners.get_manifest()
+    return get_pool()
+
+bootstrap()
 
 # Clave para el panel docente (puedes cambiarla en Secrets si quieres)
 ADMIN_KEY = st.secrets.get("ADMIN_KEY", "regina-demo")
 
 # ---------- util imágenes ----------
 def img_asset(name: str):
-    """Pinta una imagen de /assets si existe y no rompe si falta."""
+    """Pinta una imagen de /assets si existe y no rompe si falta.
+
+    Se sirve como archivo estático versionado (AVIF/WebP por ancho, ver banners.py):
+    el servidor no la relee en cada rerun.
+    """
     p = ASSETS_DIR / name
-    if p.exists():
+    if not p.exists():
+        st.warning(f"Falta assets/{name}")
+    elif tag := banners.picture(name):
+        st.markdown(tag, unsafe_allow_html=True)
+    else:
         st.image(str(p), use_container_width=True)
+
+# ---------- util audio ----------
+def audio_player(stream) -> str:
+    """Reproductor HTML liviano: el navegador pide el audio (por rangos) solo al dar play."""
+    parts = ["<div class='player'>"]
+    if stream["peaks"]:
+        n = len(stream["peaks"])
+        heights = [max(p, 6) / 255 * 40 for p in stream["peaks"]]
+        bars = "".join(f"<rect x='{i}' y='{(40 - h) / 2:.1f}' width='.7' height='{h:.1f}'/>"
+                       for i, h in enumerate(heights))
+        parts.append(f"<svg viewBox='0 0 {n} 40' preserveAspectRatio='none'>{bars}</svg>")
+    parts.append(f"<audio controls preload='none' src='{media.stream_url(stream['stream'])}'></audio>")
+    if stream["duration"]:
+        m, s = divmod(round(stream["duration"]), 60)
+        parts.append(f"<span class='meta'>{m}:{s:02d}</span>")
+    parts.append("</div>")
+    return "".join(parts)
+
+# ---------- migración de media (ver storage.Migrator) ----------
+@st.cache_resource(show_spinner=False)
+def migrations() -> Dict[str, Any]:
+    """Migración en curso del proceso (la ven todas las sesiones del Panel docente)."""
+    return {}
+
+@st.fragment(run_every=2)
+def migration_progress() -> None:
+    m = migrations().get("run")
+    if m is None:
+        return
+    s = m.stats()
+    done = s["copied"] + s["skipped"] + s["missing"] + s["failed"]
+    st.progress(done / max(s["total"], 1),
+                text=f"{done}/{s['total']} archivos · {s['bytes'] / 1e6:.1f} MB copiados"
+                     + (" · listo" if s["done"] else ""))
+    if s["failed"]:
+        st.caption(f"{s['failed']} archivo(s) con error; vuelve a copiar para reintentarlos.")
+
+# ---------- descargas grandes (ver export.serve) ----------
+def download_link(where, label: str, path: Path) -> None:
+    """Enlace al archivo servido desde el disco: la sesión nunca lo tiene entero en memoria."""
+    import export
+    url = export.serve(path)
+    if url:
+        where.link_button(label, url)
     else:
-        st.warning(f"Falta assets/{name}")
+        where.warning(f"{path.name} pesa {path.stat().st_size / 1e6:,.0f} MB, más de lo que entrega "
+                      f"Streamlit ({export.MAX_SERVED // 2**20} MB): cópialo del servidor, {path}.")
 
-def parse_tags(s: str) -> list[str]:
-    return [t.strip() for t in (s or "").split(",") if t.strip()]
-
-# ---------- DB sqlite3 ----------
-SCHEMA = """
-CREATE TABLE IF NOT EXISTS entries (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    created_at TEXT NOT NULL,
-    student_name TEXT NOT NULL,
-    email TEXT NOT NULL,
-    grp TEXT NOT NULL,
-    artifact_title TEXT NOT NULL,
-    artifact_desc TEXT NOT NULL,
-    tags TEXT DEFAULT '',
-    reflection_q1 TEXT DEFAULT '',
-    reflection_q2 TEXT DEFAULT '',
-    reflection_q3 TEXT DEFAULT '',
-    image_urls TEXT DEFAULT '',
-    audio_url TEXT DEFAULT '',
-    suno_link TEXT DEFAULT ''
-);
-"""
-def db():
-    con = sqlite3.connect(DB_PATH)
-    con.row_factory = sqlite3.Row
-    return con
-with db() as con:
-    con.executescript(SCHEMA)
-
-def insert_entry(row: Dict[str, Any]) -> None:
-    with db() as con:
-        con.execute(
-            """INSERT INTO entries
-            (created_at, student_name, email, grp, artifact_title, artifact_desc, tags,
-             reflection_q1, reflection_q2, reflection_q3, image_urls, audio_url, suno_link)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (
-                datetime.utcnow().isoformat(),
-                row["student_name"], row["email"], row["group"],
-                row["artifact_title"], row["artifact_desc"], row.get("tags",""),
-                row.get("reflection_q1",""), row.get("reflection_q2",""), row.get("reflection_q3",""),
-                row.get("image_urls",""), row.get("audio_url",""), row.get("suno_link",""),
-            ),
-        )
-        con.commit()
+# ---------- DB sqlite3 (pool WAL compartido, ver gabinete_db.py) ----------
+def insert_entry(row: Dict[str, Any]) -> int:
+    # por la cola de escritura: un solo hilo inserta por lotes (ver write_queue.py)
+    return get_write_queue().insert(row)
 
 def fetch_entries() -> List[sqlite3.Row]:
-    with db() as con:
-        return con.execute(
-            "SELECT * FROM entries ORDER BY datetime(created_at) DESC"
-        ).fetchall()
-
-# ---------- guardar media ----------
-def save_image(file) -> str:
-    image = Image.open(file).convert("RGB")
-    fname = f"img_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}.jpg"
-    out = IMG_DIR / fname
-    image.save(out, "JPEG", quality=92)
-    # devolvemos la ruta relativa a DATA_DIR (para servir localmente)
-    return str(out.relative_to(DATA_DIR))
-
-def save_audio(file) -> str:
-    suffix = Path(file.name).suffix.lower() or ".mp3"
-    fname = f"aud_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}{suffix}"
-    out = AUDIO_DIR / fname
-    out.write_bytes(file.read())
-    return str(out.relative_to(DATA_DIR))
+    return gdb.fetch_entries(get_pool())
 
 # ---------- estilos (bonito) ----------
 st.markdown("""
@@ -117,11 +131,14 @@ h1,h2,h3{letter-spacing:.2px}
 .card:hover{transform:translateY(-2px);box-shadow:0 16px 28px rgba(0,0,0,.12)}
 .badge{display:inline-block;padding:.25rem .6rem;border-radius:999px;background:#EFEAFF;margin-right:.35rem;font-size:.8rem;color:#5531ff}
 .meta{opacity:.8;font-size:.9rem}
+.meta mark{background:#EFEAFF;color:#5531ff;padding:0 .15rem;border-radius:4px}
 .grid{display:grid;gap:1rem}
 .grid.cols-3{grid-template-columns:repeat(3,minmax(0,1fr))}
 .thumb{border-radius:14px;overflow:hidden;margin-bottom:10px;aspect-ratio:16/10;width:100%;object-fit:cover}
 @media (max-width:1100px){.grid.cols-3{grid-template-columns:repeat(2,minmax(0,1fr))}}
 @media (max-width:800px){.grid.cols-3{grid-template-columns:1fr}}
+.player svg{width:100%;height:40px;fill:#B9A8FF;display:block}
+.player audio{width:100%;height:36px}
 hr{margin:1.2rem 0}
 </style>
 """, unsafe_allow_html=True)
@@ -142,6 +159,13 @@ page = st.sidebar.radio(
         "Panel docente",
     ],
 )
+# costo de cada rerun por página (Panel docente › Rendimiento; ver metrics.py)
+def end_rerun() -> None:
+    metrics.observe("page.rerun", time.perf_counter() - rerun_started, page=page)
+    metrics.METRICS.dump()
+
+# borrador del alumno (se guarda solo; ver drafts.py)
+draft_token = drafts.identify(get_pool(), page)
 
 # ---------- páginas ----------
 if page == "Inicio":
@@ -180,9 +204,16 @@ if page == "Fase 1 · Análisis Forense":
         "Tómale una foto.\n\n"
         "**2. Digital:** Sube la foto y responde la reflexión."
     )
+    pool = get_pool()
+    drafts.prefill(pool, drafts.FASE1)
+    drafts.status()
     f = st.file_uploader("Sube tu artefacto (JPG/PNG):", type=["jpg","jpeg","png"])
+    saved = drafts.attach(pool, "fase1", [f] if f else [], limit=1)
     if f: st.image(f, caption="Previsualización — Artefacto", use_container_width=True)
-    st.text_area("Reflexión: ¿cuál es ese ‘sol’ sugerido por tu artefacto?")
+    elif saved and media.media_src(saved[-1].display):
+        st.image(media.media_src(saved[-1].display), caption="Artefacto guardado en tu borrador", use_container_width=True)
+    st.text_area("Reflexión: ¿cuál es ese ‘sol’ sugerido por tu artefacto?", key=drafts.key("fase1_reflexion"))
+    drafts.autosave(pool, drafts.FASE1)
 
 # ----- Fase 2
 if page == "Fase 2 · Arquitectura Conceptual":
@@ -192,12 +223,19 @@ if page == "Fase 2 · Arquitectura Conceptual":
     st.info("Giramos la lente hacia adentro: el gabinete no es ventana, es espejo.")
     st.markdown("---")
     st.subheader("Ficha arquitectónica")
-    tipo = st.radio("Tipo de gabinete:", ["Verdad cruda","Embellece la realidad","Muestra el potencial"])
-    meta = st.text_input("Metáfora central (nombre secreto):")
-    salas = st.text_area("Salas principales (3–5):")
-    arte = st.text_input("Artefacto central:")
-    if st.button("Guardar (local) – Fase 2"):
-        st.success("✓ Guardado en esta sesión.")
+    pool = get_pool()
+    drafts.prefill(pool, drafts.FASE2)
+    drafts.status()
+    tipo = st.radio("Tipo de gabinete:", ["Verdad cruda","Embellece la realidad","Muestra el potencial"],
+                    key=drafts.key("fase2_tipo"))
+    meta = st.text_input("Metáfora central (nombre secreto):", key=drafts.key("fase2_metafora"))
+    salas = st.text_area("Salas principales (3–5):", key=drafts.key("fase2_salas"))
+    arte = st.text_input("Artefacto central:", key=drafts.key("fase2_artefacto"))
+    if st.button("Guardar – Fase 2"):
+        drafts.autosave(pool, drafts.FASE2, force=True)
+        st.success("✓ Guardado en tu borrador." if draft_token else "✓ Guardado en esta sesión.")
+    else:
+        drafts.autosave(pool, drafts.FASE2)
     st.markdown("---")
     st.subheader("Resumen")
     st.write(f"**Tipo:** {tipo or '—'}")
@@ -212,9 +250,16 @@ if page == "Fase 3 · Prototipo":
     st.header("La Metáfora: El Secreto")
     st.info("Un pitch es revelación controlada: qué muestras y qué reservas.")
     st.markdown("---")
+    pool = get_pool()
+    drafts.prefill(pool, drafts.FASE3)
+    drafts.status()
     fp = st.file_uploader("Foto del prototipo (JPG/PNG):", type=["jpg","jpeg","png"])
+    saved = drafts.attach(pool, "fase3", [fp] if fp else [], limit=1)
     if fp: st.image(fp, caption="Previsualización — Prototipo", use_container_width=True)
-    st.text_area("Pitch (~3 min):")
+    elif saved and media.media_src(saved[-1].display):
+        st.image(media.media_src(saved[-1].display), caption="Prototipo guardado en tu borrador", use_container_width=True)
+    st.text_area("Pitch (~3 min):", key=drafts.key("fase3_pitch"))
+    drafts.autosave(pool, drafts.FASE3)
 
 # ----- Fase 4
 if page == "Fase 4 · Conspiración Curatorial":
@@ -223,11 +268,52 @@ if page == "Fase 4 · Conspiración Curatorial":
     st.header("La Metáfora: El Rizoma")
     st.info("Conecta tu gabinete con el de otros: temas, contrastes, diálogos.")
     st.markdown("---")
-    team = st.text_input("Nombre del equipo/curaduría")
-    concepto = st.text_area("Concepto curatorial (200–300 palabras):", height=180)
-    invitacion = st.text_area("Invitación (corta y clara):", height=140)
-    if st.button("Guardar (local) – Fase 4"):
-        st.success("✓ Guardado en esta sesión.")
+    pool = get_pool()
+    import rizoma
+
+    # similitud de textos y etiquetas entre gabinetes (ver rizoma.py)
+    st.subheader("Conexiones del rizoma")
+    rz = rizoma.get_rizoma()
+    busca = st.text_input("Busca un gabinete (título, autor, etiqueta…)", key="rz_busca")
+    candidatos, _ = gdb.fetch_page(pool, search=busca.strip(), limit=10)
+    if candidatos:
+        elegido = st.selectbox("Gabinete de partida", candidatos,
+                               format_func=lambda c: f"{c.title} — {c.author} ({c.grp})")
+        relacionados = rz.related(elegido.id, k=8)
+        score = {r.entry_id: r.score for r in relacionados}
+        for c in gdb.cards_for(pool, [r.entry_id for r in relacionados]):
+            comunes = [t for t in c.tags if gdb.normalize_tag(t) in {gdb.normalize_tag(x) for x in elegido.tags}]
+            st.markdown(
+                f"**{c.title}** — {c.author} · {c.grp} · <span class='meta'>afinidad {score[c.id]:.0%}</span> "
+                + " ".join(f"<span class='badge'>{t}</span>" for t in comunes),
+                unsafe_allow_html=True,
+            )
+        if not relacionados:
+            st.caption("Aún no hay gabinetes con temas en común.")
+
+        grupos, sim = rz.group_graph()
+        if len(grupos) > 1:
+            with st.expander("Mapa de conexiones entre grupos"):
+                edges = [
+                    f'"{grupos[i]}" -- "{grupos[j]}" [label="{sim[i, j]:.0%}", penwidth={1 + 6 * sim[i, j]:.1f}]'
+                    for i in range(len(grupos)) for j in range(i + 1, len(grupos)) if sim[i, j] >= 0.05
+                ]
+                st.graphviz_chart("graph { node [shape=box, style=rounded]; " + "; ".join(
+                    [f'"{g}"' for g in grupos] + edges) + " }")
+    else:
+        st.caption("No hay gabinetes que coincidan." if busca else "Todavía no hay gabinetes publicados.")
+    st.markdown("---")
+
+    drafts.prefill(pool, drafts.FASE4)
+    drafts.status()
+    team = st.text_input("Nombre del equipo/curaduría", key=drafts.key("fase4_equipo"))
+    concepto = st.text_area("Concepto curatorial (200–300 palabras):", height=180, key=drafts.key("fase4_concepto"))
+    invitacion = st.text_area("Invitación (corta y clara):", height=140, key=drafts.key("fase4_invitacion"))
+    if st.button("Guardar – Fase 4"):
+        drafts.autosave(pool, drafts.FASE4, force=True)
+        st.success("✓ Guardado en tu borrador." if draft_token else "✓ Guardado en esta sesión.")
+    else:
+        drafts.autosave(pool, drafts.FASE4)
     st.markdown("---")
     st.subheader("Resumen")
     st.write(f"**Equipo:** {team or '—'}")
@@ -237,37 +323,70 @@ if page == "Fase 4 · Conspiración Curatorial":
 # ----- Crear / publicar
 if page == "Crear mi gabinete":
     st.title("Crear / Editar mi Gabinete")
+    pool = get_pool()
+    if draft_token and drafts.key("email") not in st.session_state:
+        st.session_state[drafts.key("email")] = st.session_state.get("draft_email", "")
+    drafts.prefill(pool, drafts.GABINETE)
+    drafts.status()
+
+    # imágenes ya guardadas en el borrador (Fase 1, Fase 3 y borradores anteriores):
+    # se publican tal cual, sin volver a subirlas ni procesarlas
+    draft_imgs = drafts.images(drafts.current(pool))
+    if draft_imgs:
+        st.caption(f"Imágenes de tu borrador ({len(draft_imgs)}) — se publican junto con las que subas:")
+        cols = st.columns(6)
+        for col, img in zip(cols, draft_imgs[:6]):
+            if src := media.media_src(img.thumb):
+                col.image(src, use_container_width=True)
+        if st.button("Quitar imágenes del borrador"):
+            for slot in ("fase1", "fase3", "gabinete"):
+                drafts.drop_images(pool, slot)
+            st.rerun()
+
     with st.form("gabinete_form", clear_on_submit=False):
         st.subheader("1) Perfil")
         c = st.columns(3)
-        student_name = c[0].text_input("Nombre completo *")
-        email        = c[1].text_input("Email *")
-        group        = c[2].selectbox("Grupo", ["Grupo A","Grupo B","Grupo C","Otro"])
+        student_name = c[0].text_input("Nombre completo *", key=drafts.key("student_name"))
+        email        = c[1].text_input("Email *", key=drafts.key("email"))
+        group        = c[2].selectbox("Grupo", ["Grupo A","Grupo B","Grupo C","Otro"], key=drafts.key("group"))
 
         st.markdown("---")
         st.subheader("2) Obra")
-        artifact_title = st.text_input("Título de la obra *")
-        artifact_desc  = st.text_area("Descripción breve *", help="Materiales, intención, metáfora, salas…")
-        tags           = st.text_input("Etiquetas (coma) — ej: identidad, memoria, ecofeminismo")
+        artifact_title = st.text_input("Título de la obra *", key=drafts.key("artifact_title"))
+        artifact_desc  = st.text_area("Descripción breve *", help="Materiales, intención, metáfora, salas…",
+                                      key=drafts.key("artifact_desc"))
+        tags           = st.text_input("Etiquetas (coma) — ej: identidad, memoria, ecofeminismo", key=drafts.key("tags"))
 
         st.markdown("---")
         st.subheader("3) Imágenes (1–6)")
         imgs = st.file_uploader("JPG/PNG", type=["jpg","jpeg","png"], accept_multiple_files=True)
-        if imgs and len(imgs) > 6:
-            st.warning("Se guardarán solo las 6 primeras."); imgs = imgs[:6]
+        if imgs and len(imgs) + len(draft_imgs) > 6:
+            st.warning("Se guardarán solo las 6 primeras."); imgs = imgs[:max(0, 6 - len(draft_imgs))]
 
         st.markdown("---")
         st.subheader("4) Reflexiones")
-        q1 = st.text_area("Q1 · ¿Qué de ti representa tu arte-objeto?")
-        q2 = st.text_area("Q2 · ¿Por qué merece existir y qué debería sentir el visitante?")
-        q3 = st.text_area("Q3 · Concepto curatorial / rizoma:")
+        q1 = st.text_area("Q1 · ¿Qué de ti representa tu arte-objeto?", key=drafts.key("reflection_q1"))
+        q2 = st.text_area("Q2 · ¿Por qué merece existir y qué debería sentir el visitante?", key=drafts.key("reflection_q2"))
+        q3 = st.text_area("Q3 · Concepto curatorial / rizoma:", key=drafts.key("reflection_q3"))
 
         st.markdown("---")
         st.subheader("5) Audio / Canción")
         aud  = st.file_uploader("Audio (MP3/WAV/M4A)", type=["mp3","wav","m4a"])
-        suno = st.text_input("o enlace público de Suno (opcional)")
+        suno = st.text_input("o enlace público de Suno (opcional)", key=drafts.key("suno_link"))
+
+        c = st.columns([1,1,3])
+        submit = c[0].form_submit_button("Publicar mi gabinete")
+        keep   = c[1].form_submit_button("Guardar borrador")
 
-        submit = st.form_submit_button("Publicar mi gabinete")
+    on_img_error = lambda f, ex: st.warning(f"No se pudo guardar {f.name}: {ex}")
+    if keep:
+        if not draft_token:
+            st.warning("Escribe tu email en la barra lateral para guardar tu borrador.")
+        else:
+            with st.spinner("Guardando borrador…"):
+                drafts.attach(pool, "gabinete", imgs or [], on_error=on_img_error)
+                drafts.autosave(pool, drafts.GABINETE, force=True)
+            st.success("✓ Borrador guardado.")
 
     if submit:
         faltan = [("Nombre", student_name), ("Email", email), ("Título", artifact_title), ("Descripción", artifact_desc)]
@@ -275,19 +394,17 @@ if page == "Crear mi gabinete":
         if miss:
             st.error("Faltan: " + ", ".join(miss))
         else:
-            img_urls = []
-            for f in (imgs or []):
-                try:
-                    img_urls.append(save_image(f))
-                except Exception as ex:
-                    st.warning(f"No se pudo guardar una imagen: {ex}")
+            with st.spinner("Procesando imágenes…"):
+                # solo se procesan las subidas nuevas; las del borrador ya tienen sus versiones
+                new_versions = drafts.attach(pool, "gabinete", imgs or [], on_error=on_img_error)
+                img_versions = list({v.original: v for v in draft_imgs + new_versions}.values())[:6]
             aud_url = ""
             if aud:
                 try:
-                    aud_url = save_audio(aud)
+                    aud_url = save_audio(get_pool(), aud)
                 except Exception as ex:
                     st.warning(f"No se pudo guardar audio: {ex}")
-            insert_entry({
+            row = {
                 "student_name": student_name.strip(),
                 "email": email.strip(),
                 "group": group,
@@ -297,68 +414,129 @@ if page == "Crear mi gabinete":
                 "reflection_q1": (q1 or "").strip(),
                 "reflection_q2": (q2 or "").strip(),
                 "reflection_q3": (q3 or "").strip(),
-                "image_urls": "||".join(img_urls),
+                "image_urls": "||".join(v.original for v in img_versions),
+                "images": img_versions,
                 "audio_url": aud_url,
                 "suno_link": (suno or "").strip(),
-            })
-            st.success("¡Tu gabinete ha sido publicado!")
+            }
+            try:
+                with st.spinner("Publicando…"):
+                    new_id = insert_entry(row)
+                if draft_token:
+                    drafts.autosave(pool, drafts.GABINETE, force=True)
+                    gdb.mark_draft_published(pool, draft_token, new_id)
+            except (TimeoutError, Deferred):
+                # el envío ya está en el spool: el hilo escritor lo publicará en cuanto pueda
+                st.info("Hay muchas publicaciones en este momento: tu gabinete quedó en cola y aparecerá en unos minutos.")
+            except Exception as ex:
+                st.error(f"No se pudo publicar: {ex}")
+            else:
+                st.success("¡Tu gabinete ha sido publicado!")
 
 # ----- Galería
 if page == "Galería":
     st.title("Galería de Gabinetes")
-    colf = st.columns([1,1,2])
-    g = colf[0].selectbox("Grupo", ["Todos","Grupo A","Grupo B","Grupo C","Otro"])
-    s = colf[1].text_input("Buscar", placeholder="título, nombre, etiqueta…")
-    t = colf[2].text_input("Etiqueta exacta")
-
-    entries = fetch_entries()
-
-    def match(e: sqlite3.Row) -> bool:
-        if g != "Todos" and e["grp"] != g: return False
-        if s:
-            blob = " ".join([
-                e["student_name"], e["email"], e["grp"], e["artifact_title"],
-                e["artifact_desc"], e["tags"], e["reflection_q1"], e["reflection_q2"], e["reflection_q3"]
-            ]).lower()
-            if s.lower() not in blob: return False
-        if t and t.strip() not in parse_tags(e["tags"]): return False
-        return True
-
-    flt = [e for e in entries if match(e)]
-    st.caption(f"Mostrando {len(flt)} de {len(entries)} gabinetes")
-
+    colf = st.columns([1,1,1,2])
+    sem = colf[0].selectbox("Semestre", [None, *archive.semesters()], key="gal_sem",
+                            format_func=lambda x: "Actual" if x is None else x)
+    g = colf[1].selectbox("Grupo", ["Todos","Grupo A","Grupo B","Grupo C","Otro"])
+    s = colf[2].text_input("Buscar", placeholder="título, nombre, etiqueta…")
+    t = colf[3].text_input("Etiqueta exacta")
+
+    # filtros resueltos en SQL (Buscar usa el índice FTS5, ordenado por relevancia);
+    # solo se leen/pintan PAGE_SIZE tarjetas por vista
+    flt = {"group": None if g == "Todos" else g, "search": s.strip(), "tag": t.strip()}
+    fkey = (sem, *flt.values())
+    if st.session_state.get("gal_filter") != fkey:
+        st.session_state.gal_filter = fkey
+        st.session_state.gal_cursors = [None]   # pila de cursores: uno por página visitada
+    cursors = st.session_state.gal_cursors
+
+    # solo la base del semestre elegido; los archivos se abren cuando alguien los pide (ver archive.py)
+    pool = archive.pool_for(sem)
+    entries, next_cursor = gdb.fetch_page(pool, **flt, after=cursors[-1])
+    shown = gdb.count_entries(pool, **flt)
+    pages = max(1, -(-shown // gdb.PAGE_SIZE))
+    st.caption(f"Mostrando {shown} de {gdb.count_entries(pool)} gabinetes · página {len(cursors)} de {pages}")
+
+    if flt["search"] and archive.semesters() and st.checkbox("Buscar también en los otros semestres"):
+        def _gal_sem(x):
+            st.session_state.gal_sem = x
+        for other, other_pool, found in archive.search_all(get_pool(), **flt, limit=5):
+            if other == sem:
+                continue
+            label = "Actual" if other is None else other
+            with st.expander(f"{label} · {gdb.count_entries(other_pool, **flt)} coincidencia(s)"):
+                for e in found:
+                    st.markdown(f"**{e.title}** — {e.author} ({e.grp})<div class='meta'>{e.snippet or ''}</div>",
+                                unsafe_allow_html=True)
+                st.button(f"Ver en la galería de {label}", key=f"gal_sem_{label}", on_click=_gal_sem, args=(other,))
+
+    cloud = gdb.tag_counts(pool, flt["group"])
+    if cloud:
+        with st.expander("Etiquetas más usadas"):
+            st.markdown(" ".join(f"<span class='badge'>{x} · {n}</span>" for x, n in cloud), unsafe_allow_html=True)
+    # tarjetas livianas (ver gdb.Card); lo pesado se pide solo al abrir cada una
+    page_audio = gdb.audio_streams_for(pool, [e.audio_url for e in entries if e.audio_url])
+
+    render_started = time.perf_counter()
     st.markdown('<div class="grid cols-3">', unsafe_allow_html=True)
-    for e in flt:
+    for e in entries:
         st.markdown('<div class="card">', unsafe_allow_html=True)
 
-        imgs = [u for u in (e["image_urls"] or "").split("||") if u]
-        if imgs:
-            first = DATA_DIR / imgs[0]
-            if first.exists():
-                st.markdown(f"<img class='thumb' src='{first.as_posix()}' />", unsafe_allow_html=True)
+        # solo la miniatura; las versiones grandes se piden al abrir "Ver imágenes"
+        thumb = media.media_src(e.thumb) if e.thumb else None
+        if thumb:
+            st.image(thumb, use_container_width=True)
+
+        st.markdown(f"<h3>{e.title}</h3>", unsafe_allow_html=True)
+        st.markdown(f"<div class='meta'>Por {e.author} — {e.grp}</div>", unsafe_allow_html=True)
+        if flt["search"] and e.snippet:
+            st.markdown(f"<div class='meta'>{e.snippet}</div>", unsafe_allow_html=True)
+        st.write(e.blurb + ("…" if len(e.blurb) == gdb.BLURB_CHARS else ""))
+
+        if e.tags:
+            st.markdown(" ".join([f"<span class='badge'>{x}</span>" for x in e.tags]), unsafe_allow_html=True)
+
+        if e.audio_url in page_audio:
+            st.markdown(audio_player(page_audio[e.audio_url]), unsafe_allow_html=True)
+        elif e.audio_url:
+            # audio aún sin versión de streaming (python media.py backfill)
+            if src := media.media_src(e.audio_url):
+                st.audio(src)
+        if e.suno_link:
+            st.link_button("Escuchar en Suno", e.suno_link)
+
+        if e.image_count and st.toggle(f"Ver imágenes ({e.image_count})", key=f"imgs_{e.id}"):
+            versions = gdb.images_for(pool, [e.id])[e.id]
+            imgs = [v["display"] for v in versions] or gdb.media_paths(gdb.entry_detail(pool, e.id)["image_urls"], "")
+            for u in imgs:
+                if src := media.media_src(u):
+                    st.image(src, use_container_width=True)
+
+        # on_change="rerun": el contenido solo se ejecuta (y se lee de la base) con el expander abierto
+        with st.expander("Reflexiones", key=f"refl_{e.id}", on_change="rerun") as refl:
+            if refl.open:
+                text = gdb.entry_detail(pool, e.id)
+                if len(e.blurb) == gdb.BLURB_CHARS:
+                    st.write(text["artifact_desc"])
+                st.markdown(f"**Q1** {text['reflection_q1'] or '—'}")
+                st.markdown(f"**Q2** {text['reflection_q2'] or '—'}")
+                st.markdown(f"**Q3** {text['reflection_q3'] or '—'}")
 
-        st.markdown(f"<h3>{e['artifact_title']}</h3>", unsafe_allow_html=True)
-        st.markdown(f"<div class='meta'>Por {e['student_name']} — {e['grp']}</div>", unsafe_allow_html=True)
-        st.write(e["artifact_desc"])
-
-        tags = parse_tags(e["tags"])
-        if tags:
-            st.markdown(" ".join([f"<span class='badge'>{x}</span>" for x in tags]), unsafe_allow_html=True)
+        st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+    metrics.observe("gallery.render", time.perf_counter() - render_started)
 
-        if e["audio_url"]:
-            ap = DATA_DIR / e["audio_url"]
-            if ap.exists():
-                st.audio(ap.read_bytes())
-        if e["suno_link"]:
-            st.link_button("Escuchar en Suno", e["suno_link"])
+    def _gal_prev():
+        st.session_state.gal_cursors.pop()
 
-        with st.expander("Reflexiones"):
-            st.markdown(f"**Q1** {e['reflection_q1'] or '—'}")
-            st.markdown(f"**Q2** {e['reflection_q2'] or '—'}")
-            st.markdown(f"**Q3** {e['reflection_q3'] or '—'}")
+    def _gal_next(cursor):
+        st.session_state.gal_cursors.append(cursor)
 
-        st.markdown("</div>", unsafe_allow_html=True)
-    st.markdown("</div>", unsafe_allow_html=True)
+    nav = st.columns([1,1,4])
+    nav[0].button("← Anterior", disabled=len(cursors) == 1, on_click=_gal_prev)
+    nav[1].button("Siguiente →", disabled=next_cursor is None, on_click=_gal_next, args=(next_cursor,))
 
 # ----- Panel docente
 if page == "Panel docente":
@@ -366,58 +544,200 @@ if page == "Panel docente":
     key = st.text_input("Clave docente", type="password")
     if key != ADMIN_KEY:
         st.info("Introduce la clave docente para ver/exportar datos.")
+        end_rerun()
         st.stop()
 
-    entries = fetch_entries()
+    import pandas as pd
+    # agregados SQL en caché hasta la próxima publicación (ver gdb.dashboard); por defecto, solo el semestre en curso
+    panel_sem = st.selectbox("Semestre", [None, *archive.semesters()], key="panel_sem",
+                             format_func=lambda x: "Actual" if x is None else x)
+    stats = gdb.dashboard(archive.pool_for(panel_sem))
+    tot = stats["totals"]
+    pct = lambda n: f"{n / tot['total']:.0%}" if tot["total"] else "—"
+    c = st.columns(4)
+    c[0].metric("Total", tot["total"])
+    c[1].metric("Con audio", tot["with_audio"])
+    c[2].metric(">2 imágenes", tot["over_two_images"])
+    c[3].metric("Grupos", tot["groups"])
     c = st.columns(4)
-    c[0].metric("Total", len(entries))
-    c[1].metric("Con audio", sum(1 for e in entries if (e["audio_url"] or e["suno_link"])))
-    c[2].metric(">2 imágenes", sum(1 for e in entries if len([u for u in (e["image_urls"] or '').split('||') if u]) > 2))
-    grupos = {}
-    for e in entries: grupos[e["grp"]] = grupos.get(e["grp"], 0) + 1
-    c[3].metric("Grupos", len(grupos))
+    c[0].metric("Con imágenes", pct(tot["with_images"]))
+    c[1].metric("Con audio/Suno", pct(tot["with_audio"]))
+    c[2].metric("Sin media", tot["without_media"])
+    c[3].metric("Reflexión media", f"{tot['reflection_chars']:.0f} car.")
+
+    if stats["by_day"]:
+        st.subheader("Entregas por día")
+        por_dia = pd.DataFrame(stats["by_day"]).pivot(index="day", columns="grp", values="total").fillna(0)
+        st.bar_chart(por_dia)
+        st.dataframe(
+            pd.DataFrame(stats["by_group"]).rename(columns={
+                "grp": "Grupo", "total": "Gabinetes", "with_audio": "Con audio",
+                "with_images": "Con imágenes", "reflection_chars": "Reflexión media (car.)",
+            }),
+            hide_index=True, use_container_width=True,
+        )
+
+    q = get_write_queue().stats()
+    with st.expander(f"Cola de publicaciones · {q['depth']} en espera"):
+        c = st.columns(4)
+        c[0].metric("En espera", q["depth"])
+        c[1].metric("Publicados / fallidos", f"{q['written']} / {q['failed']}")
+        c[2].metric("Lote medio", f"{q['avg_batch']:.1f}")
+        c[3].metric("Latencia media", f"{q['avg_latency_ms']:.0f} ms", help=f"máx. {q['max_latency_ms']:.0f} ms")
+        if q["deferred"]:
+            st.caption(f"{q['deferred']} envío(s) esperando a que la base vuelva a aceptar escrituras "
+                       f"({q['retries']} reintento(s) de lote); siguen en el spool.")
+        if q["recovered"]:
+            st.caption(f"{q['recovered']} envío(s) recuperados del spool al arrancar.")
+
+    # tiempos de este proceso desde que arrancó (ver metrics.py)
+    with st.expander("Rendimiento"):
+        perf = metrics.METRICS
+        ms = lambda r: {"Veces": r["count"], "p50 (ms)": round(r["p50_ms"], 1),
+                        "p95 (ms)": round(r["p95_ms"], 1), "Máx. (ms)": round(r["max_ms"], 1)}
+        st.caption(f"Desde hace {(time.time() - perf.started) / 60:.0f} min · "
+                   "p50/p95 sobre las últimas 1024 muestras de cada serie")
+        st.markdown("**Costo por rerun de cada página**")
+        st.dataframe([{"Página": r["labels"].get("page", "—"), **ms(r)} for r in perf.latencies("page.rerun")],
+                     hide_index=True, use_container_width=True)
+        st.markdown("**Operaciones**")
+        st.dataframe([{"Operación": r["name"], **ms(r)} for r in perf.latencies() if r["name"] != "page.rerun"],
+                     hide_index=True, use_container_width=True)
+        st.markdown("**Consultas más lentas**")
+        st.dataframe([{"SQL": r["sql"], "Veces": r["count"], "Prom. (ms)": round(r["avg_ms"], 2),
+                       "Máx. (ms)": round(r["max_ms"], 2)} for r in perf.slow_queries()],
+                     hide_index=True, use_container_width=True)
+        c = st.columns(3)
+        c[0].download_button("Prometheus (.prom)", data=perf.prometheus(), file_name="gabinete.prom", mime="text/plain")
+        c[1].download_button("JSON", data=json.dumps(perf.snapshot(), ensure_ascii=False, indent=1),
+                             file_name="gabinete_metrics.json", mime="application/json")
+        if c[2].button("Reiniciar contadores"):
+            perf.reset()
+        for name, problems in banners.warnings().items():
+            st.warning(f"assets/{name} {' y '.join(problems)}: conviene reemplazar el original por uno más liviano.")
+
+    store = storage.get_storage()
+    with st.expander(f"Almacenamiento de media · {store.name}"):
+        if isinstance(store, storage.LocalStorage):
+            st.caption("La media vive en el disco del servidor (data/). Para un bucket S3 "
+                       "define GABINETE_STORAGE=s3 y GABINETE_S3_BUCKET (ver storage.py).")
+        else:
+            st.caption("Lo nuevo se sube al publicar. La media anterior se copia en segundo plano; "
+                       "la galería sigue funcionando mientras tanto.")
+            running = migrations().get("run")
+            if st.button("Copiar media existente al almacén", disabled=bool(running and running.is_alive())):
+                migrations()["run"] = media.migrate(get_pool())
+            migration_progress()
 
     st.markdown("---")
     st.subheader("Exportar datos")
 
-    # CSV
-    csv_buf = io.StringIO()
-    w = csv.writer(csv_buf)
-    w.writerow(["id","created_at","student_name","email","group","artifact_title","artifact_desc",
-                "tags","reflection_q1","reflection_q2","reflection_q3","image_urls","audio_url","suno_link"])
-    for e in entries:
-        w.writerow([e["id"], e["created_at"], e["student_name"], e["email"], e["grp"], e["artifact_title"],
-                    e["artifact_desc"], e["tags"], e["reflection_q1"], e["reflection_q2"], e["reflection_q3"],
-                    e["image_urls"], e["audio_url"], e["suno_link"]])
-    st.download_button("Descargar CSV", data=csv_buf.getvalue().encode("utf-8"),
-                       file_name="gabinetes.csv", mime="text/csv")
-
-       # ZIP (CSV + media)
-    zip_buf = io.BytesIO()
-    with ZipFile(zip_buf, "w", ZIP_DEFLATED) as zf:
-        zf.writestr("gabinetes.csv", csv_buf.getvalue().encode("utf-8"))
-        for e in entries:
-            for u in [u for u in (e["image_urls"] or "").split("||") if u]:
-                p = DATA_DIR / u
-                if p.exists():
-                    zf.write(p, arcname=str(Path("media") / u))
-            if e["audio_url"]:
-                ap = DATA_DIR / e["audio_url"]
-                if ap.exists():
-                    zf.write(ap, arcname=str(Path("media") / e["audio_url"]))
-    st.download_button(
-        "Descargar ZIP (CSV + media)",
-        data=zip_buf.getvalue(),
-        file_name="gabinetes_media.zip",
-        mime="application/zip"
-    )
+    # Se generan al hacer clic (en disco, por partes) y se reutilizan mientras
+    # la tabla no cambie; ver export.py. El CSV es solo texto; el ZIP lleva toda
+    # la media y se descarga del disco por un enlace (download_link)
+    import export
+    pool = get_pool()
+    c = st.columns(2)
+    c[0].download_button("Descargar CSV", data=lambda: export.csv_export(pool).read_bytes(),
+                         file_name="gabinetes.csv", mime="text/csv")
+    if c[1].button("Preparar ZIP (CSV + media)"):
+        with st.spinner("Generando ZIP…"):
+            st.session_state.export_zip = str(export.zip_export(pool))
+    if st.session_state.get("export_zip") and Path(st.session_state.export_zip).exists():
+        download_link(c[1], "Descargar ZIP", Path(st.session_state.export_zip))
+
+    # Parquet con columnas tipadas (fechas, grupo/semestre como categoría, etiquetas como lista, SPARK)
+    archived = st.multiselect("Semestres archivados a incluir en el análisis", archive.semesters())
+    analytics_pools = [pool, *(archive.get_archive_pool(sem) for sem in archived)]
+    st.download_button("Descargar Parquet (análisis)",
+                       data=lambda: export.analytics_export(analytics_pools).read_bytes(),
+                       file_name="gabinetes_analisis.parquet", mime="application/vnd.apache.parquet")
+    with st.expander("Análisis por semestre y grupo", key="analytics", on_change="rerun") as analytics:
+        if analytics.open:
+            df = export.analytics_frame(analytics_pools)
+            df["reflection_chars"] = df[["reflection_q1_chars", "reflection_q2_chars", "reflection_q3_chars"]].sum(axis=1)
+            df["spark_total"] = df[[f"spark_{c}" for c in gdb.SPARK_CRITERIA]].sum(axis=1, min_count=1)
+            st.dataframe(
+                df.groupby(["semester", "group"], observed=True).agg(**{
+                    "Gabinetes": ("id", "size"), "Reflexión media (car.)": ("reflection_chars", "mean"),
+                    "Imágenes (media)": ("image_count", "mean"), "Con audio": ("has_audio", "mean"),
+                    "SPARK medio (0–20)": ("spark_total", "mean"),
+                }).round(2).reset_index().rename(columns={"semester": "Semestre", "group": "Grupo"}),
+                hide_index=True, use_container_width=True,
+            )
+            st.markdown("**Etiquetas más usadas**")
+            st.bar_chart(df["tags"].explode().dropna().value_counts().head(20))
+
+    st.subheader("Respaldo incremental")
+    modo = st.radio("Incluir", ["Desde el último respaldo", "Desde una fecha", "Todo"], horizontal=True)
+    since_ts = None
+    if modo == "Desde una fecha":
+        since_ts = st.date_input("Creados o editados desde").isoformat()
+    elif modo == "Todo":
+        since_ts = "0000"
+    if st.button("Generar respaldo"):
+        with st.spinner("Generando respaldo…"):
+            out, checkpoint = export.delta_export(pool, since_ts)
+        st.session_state.last_delta = str(out)
+    if st.session_state.get("last_delta") and Path(st.session_state.last_delta).exists():
+        delta = Path(st.session_state.last_delta)
+        download_link(st, f"Descargar {delta.name}", delta)
+    hist = gdb.checkpoints(pool)
+    if hist:
+        with st.expander("Respaldos anteriores"):
+            for cp in hist:
+                desde = cp["since_ts"] or ("inicio" if cp["since_rev"] < 0 else f"rev {cp['since_rev']}")
+                st.caption(f"#{cp['id']} · {cp['created_at'][:16].replace('T',' ')} · desde {desde} → rev {cp['upto_rev']}"
+                           f" · {cp['rows']} gabinete(s), {cp['media']} archivo(s)")
+    st.caption("Para restaurar: `python export.py restore delta_0001.zip delta_0002.zip …`")
+
+    # instantáneas completas de la base (API de backup en línea; ver backup.py)
+    st.subheader("Copias de seguridad de la base")
+    sched = backup.get_scheduler()
+    b = sched.stats()
+    st.caption((f"Automáticas cada {b['interval_h']:g} h si hubo cambios" if b["enabled"]
+                else "Copias automáticas desactivadas (GABINETE_BACKUP_HOURS=0)")
+               + f" · se conservan las {backup.BACKUP_KEEP} más recientes en data/backups/")
+    if b["last_error"]:
+        st.error(f"La última copia automática falló: {b['last_error']}")
+    if st.button("Copiar la base ahora"):
+        with st.spinner("Copiando…"):
+            sched.run_now()
+    snaps = backup.snapshots()
+    if snaps:
+        m = backup.manifest(snaps[0])
+        st.caption(f"Última: {m['created_at'][:16].replace('T', ' ')} UTC · {m['entries']} gabinete(s) · "
+                   f"{m['gz_bytes'] / 1e6:.1f} MB · {len(m['media'])} archivo(s) de media en el manifiesto")
+        st.download_button(f"Descargar {snaps[0].name}", data=lambda: snaps[0].read_bytes(),
+                           file_name=snaps[0].name, mime="application/gzip")
+    st.caption("Para comprobar o restaurar (con la app detenida): "
+               "`python backup.py verify …db.gz` · `python backup.py restore …db.gz`")
+
+    st.subheader("Archivo por semestre")
+    active = archive.active_semesters(get_pool())
+    st.caption("Los semestres anteriores pasan a un archivo propio (data/archive/) que solo se abre al "
+               "elegirlo arriba o en la Galería; sus originales van a " + str(media.COLD_DIR) + ".")
+    if len(active) > 1:
+        current = next(iter(active))
+        older = {sem: n for sem, n in active.items() if sem < current}
+        if st.button(f"Archivar semestres anteriores a {current} "
+                     f"({', '.join(f'{sem}: {n}' for sem, n in sorted(older.items()))})"):
+            with st.spinner("Archivando…"):
+                done = archive.archive_before(get_pool(), current)
+            st.success(" · ".join(f"{sem}: {n} gabinete(s), {cold} original(es) movidos" for sem, (n, cold) in done.items()))
+    else:
+        st.caption("En la base activa solo hay un semestre; no hay nada que archivar.")
+    if archive.semesters():
+        st.caption("Archivados: " + " · ".join(
+            f"{sem} ({archive.archive_path(sem).stat().st_size / 1e6:.1f} MB)" for sem in archive.semesters()))
 
     # --- Evaluación SPARK (0–4) + export CSV
-    from spark_patch import admin_panel
     st.markdown("---")
     st.subheader("Evaluación SPARK")
-    admin_panel(SPARK_CONN)
+    from spark_patch import admin_panel
+    admin_panel(get_pool())
 
 # ----- Pie
 st.markdown("---")
 st.caption("Hecho con ❤️ por el Gabinete del Asombro · Streamlit + SQLite (sqlite3)")
+end_rerun()
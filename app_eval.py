@@ -1,9 +1,9 @@
 # app_eval.py — Panel independiente para evaluar SPARK (versión simple)
-from pathlib import Path
-import sqlite3
 import streamlit as st
-# Importa directamente desde la carpeta donde están app.py y spark_patch.py
-from Gabinete_Personal_App.spark_patch import ensure_schema, admin_panel
+# Imports de primer nivel, como app.py: con el paquete delante se cargaría una
+# segunda copia de gabinete_db (otro pool y otra caché) en el mismo proceso
+from gabinete_db import DB_PATH, get_pool
+from spark_patch import admin_panel
 
 st.set_page_config(page_title="Evaluación SPARK", page_icon="✅", layout="wide")
 st.title("Evaluación SPARK")
@@ -15,17 +15,12 @@ if key != ADMIN_KEY:
     st.info("Introduce la clave docente para acceder.")
     st.stop()
 
-# Usa la MISMA base que tu app principal
-DB_PATH = Path("Gabinete_Personal_App") / "data" / "gabinete.db"
-DB_PATH.parent.mkdir(parents=True, exist_ok=True)
-conn = sqlite3.connect(str(DB_PATH), check_same_thread=False)
-ensure_schema(conn)
-
+# Usa la MISMA base (y el mismo pool WAL) que tu app principal; el esquema lo crea get_pool
 st.caption(f"Base de datos: {DB_PATH.as_posix()}")
 st.markdown("---")
 
 # Panel de evaluación SPARK
-admin_panel(conn)
+admin_panel(get_pool())
 
 st.markdown("---")
 st.caption("Panel independiente de evaluación SPARK · comparte la misma base de datos de la app principal.")
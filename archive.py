@@ -0,0 +1,213 @@
+# ===========================================
+# Gabinete Personal — archive.py (semestres archivados)
+# ===========================================
+# Los gabinetes de semestres anteriores salen de la base activa a un archivo
+# SQLite por semestre (data/archive/<semestre>.db) con el mismo esquema: la
+# galería, la búsqueda FTS y las métricas del panel funcionan igual sobre un
+# archivo, que se abre solo lectura y solo cuando alguien lo elige. Así cada
+# consulta de la base activa escala con la cohorte actual, no con la historia.
+#
+# Semestres: "2025-1" (enero–junio) y "2025-2" (julio–diciembre), por created_at.
+#
+# Archivar (archive_before) por cada semestre anterior al elegido:
+#   1. copia gabinetes, etiquetas, imágenes, términos, SPARK y su media
+#      (media_objects/media_refs/audio_streams) al archivo, en una transacción
+#      del archivo; la base activa solo se lee
+#   2. comprueba que el archivo tenga todos los gabinetes copiados
+#   3. los borra de la base activa (en cascada), junto con la media que ya solo
+#      usaban ellos (así el GC de la base activa no la toca)
+#   4. mueve los originales de esa media a COLD_DIR (GABINETE_COLD_DIR); las
+#      miniaturas, versiones display y el audio de streaming se quedan para que
+#      la galería del archivo siga pintándose
+# Si algo se interrumpe entre 1 y 3, repetir es seguro: el archivo reemplaza
+# las filas por id.
+#
+#   python archive.py list
+#   python archive.py before 2025-2     # archiva todo lo anterior a 2025-2
+from __future__ import annotations
+import argparse, shutil
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import streamlit as st
+
+import gabinete_db as gdb
+import media
+
+ARCHIVE_DIR = gdb.DATA_DIR / "archive"
+# archivos: se escriben solo al archivar, sin WAL (un único archivo que copiar)
+ARCHIVE_PRAGMAS = {"journal_mode": "DELETE"}
+READONLY_PRAGMAS = {**ARCHIVE_PRAGMAS, "query_only": "ON"}
+# tablas por gabinete que viajan con él, en orden de dependencias
+ENTRY_TABLES = ("entry_tags", "entry_images", "entry_terms", "spark_scores")
+
+
+# ---------- semestres ----------
+def semester_of(created_at: str) -> str:
+    year, month = created_at[:4], int(created_at[5:7])
+    return f"{year}-{1 if month <= 6 else 2}"
+
+
+def semester_range(semester: str) -> Tuple[str, str]:
+    """[inicio, fin) del semestre como prefijos ISO comparables con created_at."""
+    year, half = int(semester[:4]), int(semester[-1])
+    return (f"{year}-01-01", f"{year}-07-01") if half == 1 else (f"{year}-07-01", f"{year + 1}-01-01")
+
+
+def active_semesters(pool: gdb.ConnectionPool) -> Dict[str, int]:
+    """Semestres presentes en la base activa y sus gabinetes, del más reciente al más antiguo."""
+    out: Dict[str, int] = {}
+    with pool.connection() as con:
+        for month, n in con.execute("SELECT substr(created_at, 1, 7), COUNT(*) FROM entries GROUP BY 1"):
+            sem = semester_of(month)
+            out[sem] = out.get(sem, 0) + n
+    return dict(sorted(out.items(), reverse=True))
+
+
+def archive_path(semester: str) -> Path:
+    return ARCHIVE_DIR / f"{semester}.db"
+
+
+def semesters() -> List[str]:
+    """Semestres archivados, del más reciente al más antiguo."""
+    return sorted((p.stem for p in ARCHIVE_DIR.glob("*-[12].db")), reverse=True)
+
+
+@st.cache_resource(show_spinner=False)
+def get_archive_pool(semester: str) -> gdb.ConnectionPool:
+    """Pool solo lectura de un semestre archivado; se abre la primera vez que alguien lo elige."""
+    gdb.open_pool(archive_path(semester), size=1, pragmas=ARCHIVE_PRAGMAS).close()   # esquema al día
+    return gdb.ConnectionPool(archive_path(semester), size=2, pragmas=READONLY_PRAGMAS)
+
+
+def pool_for(semester: Optional[str]) -> gdb.ConnectionPool:
+    """Base activa (None) o el archivo del semestre."""
+    return gdb.get_pool() if semester is None else get_archive_pool(semester)
+
+
+# ---------- búsqueda en todos los semestres ----------
+def search_all(pool: gdb.ConnectionPool, search: str, *, group: str | None = None, tag: str = "",
+               limit: int = gdb.PAGE_SIZE) -> List[Tuple[Optional[str], gdb.ConnectionPool, List[gdb.Card]]]:
+    """Primera página de resultados de la base activa y de cada archivo (solo los que tienen alguno).
+
+    Devuelve [(semestre o None, pool, tarjetas)], la base activa primero. El bm25 de
+    cada archivo se calcula con sus propias estadísticas, por eso no se mezclan.
+    """
+    out = []
+    for sem in [None, *semesters()]:
+        p = pool if sem is None else get_archive_pool(sem)
+        cards, _ = gdb.fetch_page(p, group=group, search=search, tag=tag, limit=limit)
+        if cards:
+            out.append((sem, p, cards))
+    return out
+
+
+# ---------- archivar ----------
+def _columns(con, schema: str, table: str) -> str:
+    return ", ".join(r[1] for r in con.execute(f"PRAGMA {schema}.table_info({table})"))
+
+
+def _archive_semester(pool: gdb.ConnectionPool, semester: str) -> Tuple[int, int]:
+    """Mueve un semestre de la base activa a su archivo. Devuelve (gabinetes, originales a COLD_DIR)."""
+    start, end = semester_range(semester)
+    path = archive_path(semester)
+    gdb.open_pool(path, size=1, pragmas=ARCHIVE_PRAGMAS).close()        # crea/migra el archivo
+    moving = "(SELECT id FROM temp.archive_ids)"
+    with pool.connection() as con:
+        con.execute("ATTACH DATABASE ? AS arch", (str(path),))
+        try:
+            con.execute("CREATE TEMP TABLE IF NOT EXISTS archive_ids(id INTEGER PRIMARY KEY)")
+            con.execute("DELETE FROM temp.archive_ids")
+            con.execute("INSERT INTO temp.archive_ids SELECT id FROM main.entries WHERE created_at >= ? AND created_at < ?",
+                        (start, end))
+            con.commit()
+            ids = con.execute("SELECT COUNT(*) FROM temp.archive_ids").fetchone()[0]
+            if not ids:
+                return 0, 0
+            hashes = f"(SELECT DISTINCT hash FROM main.media_refs WHERE entry_id IN {moving})"
+
+            # 1. copia (BEGIN diferido: solo el archivo toma lock de escritura)
+            con.execute("BEGIN")
+            try:
+                con.execute(f"DELETE FROM arch.entries WHERE id IN {moving}")        # repetir es seguro
+                cols = _columns(con, "arch", "entries")
+                con.execute(f"INSERT INTO arch.entries({cols}) SELECT {cols} FROM main.entries WHERE id IN {moving}")
+                for table in ENTRY_TABLES:
+                    cols = _columns(con, "arch", table)
+                    con.execute(f"INSERT OR REPLACE INTO arch.{table}({cols}) "
+                                f"SELECT {cols} FROM main.{table} WHERE entry_id IN {moving}")
+                for table in ("media_objects", "audio_streams"):
+                    cols = _columns(con, "arch", table)
+                    con.execute(f"INSERT OR IGNORE INTO arch.{table}({cols}) "
+                                f"SELECT {cols} FROM main.{table} WHERE hash IN {hashes}")
+                con.execute(f"INSERT OR IGNORE INTO arch.media_refs(entry_id, hash) "
+                            f"SELECT entry_id, hash FROM main.media_refs WHERE entry_id IN {moving}")
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+
+            # 2. verificación
+            copied = con.execute(f"SELECT COUNT(*) FROM arch.entries WHERE id IN {moving}").fetchone()[0]
+            if copied != ids:
+                raise RuntimeError(f"{semester}: el archivo tiene {copied} de {ids} gabinetes; no se borra nada")
+
+            # 3. fuera de la base activa, con la media que ya nadie más usa
+            with_media = con.execute(f"SELECT hash, path, kind FROM main.media_objects WHERE hash IN {hashes}").fetchall()
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                con.execute(f"DELETE FROM main.entries WHERE id IN {moving}")
+                orphaned = [r for r in with_media if not con.execute(
+                    """SELECT EXISTS (SELECT 1 FROM main.media_refs WHERE hash = ?)
+                              OR EXISTS (SELECT 1 FROM main.draft_media WHERE hash = ?)""",
+                    (r["hash"], r["hash"])).fetchone()[0]]
+                con.executemany("DELETE FROM main.media_objects WHERE hash = ?", [(r["hash"],) for r in orphaned])
+                con.commit()
+            except BaseException:
+                con.rollback()
+                raise
+        finally:
+            con.execute("DETACH DATABASE arch")
+
+    # 4. originales al almacenamiento frío
+    cold = 0
+    for r in orphaned:
+        src = media.DATA_DIR / r["path"]
+        if src.exists():
+            dest = media.COLD_DIR / r["path"]
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(src, dest)
+            cold += 1
+    return ids, cold
+
+
+def archive_before(pool: gdb.ConnectionPool, semester: str) -> Dict[str, Tuple[int, int]]:
+    """Archiva cada semestre anterior a `semester`. Devuelve {semestre: (gabinetes, originales movidos)}."""
+    done = {}
+    for sem in sorted(active_semesters(pool)):
+        if sem < semester:
+            done[sem] = _archive_semester(pool, sem)
+    return done
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Archivo de semestres anteriores")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="semestres en la base activa y archivados")
+    b = sub.add_parser("before", help="archiva todo lo anterior a un semestre (p. ej. 2025-2)")
+    b.add_argument("semester")
+    a = ap.parse_args()
+    pool = gdb.open_pool()
+    if a.command == "list":
+        for sem, n in active_semesters(pool).items():
+            print(f"{sem}  {n:>6} gabinetes  (activa)")
+        for sem in semesters():
+            size = archive_path(sem).stat().st_size
+            print(f"{sem}  {'':>6}            archivo {archive_path(sem).name} ({size / 1e6:.1f} MB)")
+    else:
+        for sem, (n, cold) in archive_before(pool, a.semester).items():
+            print(f"{sem}: {n} gabinete(s) archivados, {cold} original(es) a {media.COLD_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# ===========================================
+# Gabinete Personal — backup.py (copias de seguridad de gabinete.db)
+# ===========================================
+# Instantáneas completas de la base con la API de backup en línea de SQLite:
+# se copia por bloques de STEP_PAGES páginas, con una pausa corta entre bloques,
+# desde una conexión del pool que mantiene abierta una transacción de lectura.
+# Con WAL eso no bloquea a quien publica y todas las páginas son de la misma
+# instantánea (la copia no se reinicia por las escrituras de otras sesiones).
+#
+# Cada instantánea queda en data/backups/ como
+#   gabinete_<fecha>.db.gz          la base comprimida
+#   gabinete_<fecha>.manifest.json  sha256 y tamaño de la base, versión del
+#                                   esquema, gabinetes, rev y la media a la
+#                                   que apuntan (ruta, hash, tamaño)
+# Se conservan las BACKUP_KEEP más recientes. La media no se copia (ya vive
+# deduplicada en el almacén y el respaldo incremental de export.py la incluye):
+# el manifiesto permite comprobar que sigue ahí.
+#
+# Un hilo por proceso (get_scheduler, arrancado por app.py) toma una
+# instantánea cada GABINETE_BACKUP_HOURS horas (0 = desactivado), solo si la
+# base cambió desde la anterior.
+#
+#   python backup.py snapshot
+#   python backup.py list
+#   python backup.py verify data/backups/gabinete_20250901_120000.db.gz
+#   python backup.py restore data/backups/gabinete_20250901_120000.db.gz [--db otra/gabinete.db]
+from __future__ import annotations
+import argparse, gzip, hashlib, json, os, shutil, sqlite3, tempfile, threading, time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import streamlit as st
+
+import gabinete_db as gdb
+
+DATA_DIR    = gdb.DATA_DIR
+BACKUP_DIR  = DATA_DIR / "backups"
+INTERVAL    = float(os.getenv("GABINETE_BACKUP_HOURS", "6")) * 3600
+BACKUP_KEEP = int(os.getenv("GABINETE_BACKUP_KEEP", "28"))
+STEP_PAGES  = 256            # páginas por paso (1 MB con páginas de 4 KB)
+STEP_PAUSE  = 0.005          # segundos entre pasos
+CHUNK       = 1024 * 1024
+
+_lock = threading.Lock()     # una instantánea a la vez por proceso
+
+
+def _manifest_path(snapshot: Path) -> Path:
+    return snapshot.with_name(snapshot.name.replace(".db.gz", ".manifest.json"))
+
+
+def _describe(con: sqlite3.Connection) -> Dict[str, Any]:
+    """Lo que dice de sí misma la copia: esquema, contadores y media referenciada."""
+    known = {path: (digest, size) for digest, path, size in con.execute("SELECT hash, path, size FROM media_objects")}
+    paths = set()
+    for image_urls, audio_url in con.execute("SELECT image_urls, audio_url FROM entries"):
+        paths.update(gdb.media_paths(image_urls, audio_url))
+    paths.update(path for (path,) in con.execute(
+        "SELECT o.path FROM draft_media d JOIN media_objects o ON o.hash = d.hash"))
+    return {
+        "user_version": con.execute("PRAGMA user_version").fetchone()[0],
+        "entries": con.execute("SELECT COUNT(*) FROM entries").fetchone()[0],
+        "upto_rev": gdb.generation(con, "entries"),
+        "generations": list(gdb.generations(con)),
+        "media": [{"path": p, "hash": known.get(p, (None, None))[0], "size": known.get(p, (None, None))[1]}
+                  for p in sorted(paths)],
+    }
+
+
+def _gzip(src: Path, dest: Path) -> str:
+    """Comprime por bloques y devuelve el sha256 de los bytes sin comprimir."""
+    h = hashlib.sha256()
+    with open(src, "rb") as fin, gzip.open(dest, "wb", compresslevel=6) as fout:
+        while block := fin.read(CHUNK):
+            h.update(block)
+            fout.write(block)
+    return h.hexdigest()
+
+
+def _gunzip(src: Path, dest: Path) -> str:
+    h = hashlib.sha256()
+    with gzip.open(src, "rb") as fin, open(dest, "wb") as fout:
+        while block := fin.read(CHUNK):
+            h.update(block)
+            fout.write(block)
+    return h.hexdigest()
+
+
+# ---------- instantáneas ----------
+def snapshot(pool: gdb.ConnectionPool, directory: Path = BACKUP_DIR) -> Path:
+    """Copia consistente de la base, comprimida y con manifiesto. Devuelve la ruta del .db.gz."""
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"gabinete_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+    started = time.perf_counter()
+    with _lock, tempfile.TemporaryDirectory(dir=directory) as tmp:
+        raw = Path(tmp) / "gabinete.db"
+        copy = sqlite3.connect(raw)
+        try:
+            with pool.connection() as src:
+                src.execute("BEGIN")          # fija la instantánea (WAL) para todos los pasos
+                src.execute("SELECT 1 FROM counters LIMIT 1").fetchall()
+                try:
+                    src.backup(copy, pages=STEP_PAGES, sleep=STEP_PAUSE)
+                finally:
+                    src.rollback()
+            manifest = _describe(copy)
+        finally:
+            copy.close()
+        out = directory / f"{name}.db.gz"
+        part = Path(tmp) / out.name
+        manifest.update(
+            created_at=datetime.utcnow().isoformat(), file=out.name,
+            db_sha256=_gzip(raw, part), db_bytes=raw.stat().st_size, gz_bytes=part.stat().st_size,
+            seconds=round(time.perf_counter() - started, 3),
+        )
+        _manifest_path(out).write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+        os.replace(part, out)                 # el .db.gz aparece completo o no aparece
+    return out
+
+
+def snapshots(directory: Path = BACKUP_DIR) -> List[Path]:
+    """Instantáneas con manifiesto, la más reciente primero."""
+    return sorted((p for p in directory.glob("gabinete_*.db.gz") if _manifest_path(p).exists()), reverse=True)
+
+
+def manifest(snapshot_path: Path) -> Dict[str, Any]:
+    return json.loads(_manifest_path(snapshot_path).read_text(encoding="utf-8"))
+
+
+def prune(directory: Path = BACKUP_DIR, keep: int = BACKUP_KEEP) -> int:
+    """Borra las instantáneas más antiguas que las `keep` más recientes. Devuelve cuántas borró."""
+    old = snapshots(directory)[keep:]
+    for p in old:
+        p.unlink(missing_ok=True)
+        _manifest_path(p).unlink(missing_ok=True)
+    return len(old)
+
+
+def changed_since_last(pool: gdb.ConnectionPool, directory: Path = BACKUP_DIR) -> bool:
+    last = snapshots(directory)
+    if not last:
+        return True
+    with pool.connection() as con:
+        return list(gdb.generations(con)) != manifest(last[0]).get("generations")
+
+
+# ---------- verificar / restaurar ----------
+def verify(snapshot_path: Path, data_dir: Path = DATA_DIR, keep_copy: Optional[Path] = None) -> Dict[str, Any]:
+    """Descomprime en un temporal y comprueba sha256, integrity_check, gabinetes y media.
+
+    Devuelve {"ok", "problems", "missing_media"}; la media que falta no invalida la
+    base (se avisa aparte). Con keep_copy la base descomprimida queda ahí.
+    """
+    expected = manifest(snapshot_path)
+    problems: List[str] = []
+    with tempfile.TemporaryDirectory(dir=keep_copy.parent if keep_copy else None) as tmp:
+        raw = Path(tmp) / "gabinete.db"
+        digest = _gunzip(snapshot_path, raw)
+        if digest != expected["db_sha256"]:
+            problems.append(f"sha256 distinto: {digest[:12]}… (manifiesto {expected['db_sha256'][:12]}…)")
+        con = sqlite3.connect(f"file:{raw}?mode=ro", uri=True)
+        try:
+            check = [r[0] for r in con.execute("PRAGMA integrity_check")]
+            if check != ["ok"]:
+                problems.append("integrity_check: " + "; ".join(check[:5]))
+            entries = con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            if entries != expected["entries"]:
+                problems.append(f"{entries} gabinetes (manifiesto {expected['entries']})")
+        finally:
+            con.close()
+        if keep_copy and not problems:
+            os.replace(raw, keep_copy)
+    missing = [m["path"] for m in expected["media"] if not (data_dir / m["path"]).exists()]
+    return {"ok": not problems, "problems": problems, "missing_media": missing}
+
+
+def restore(snapshot_path: Path, db_path: Path = gdb.DB_PATH, force: bool = False) -> Dict[str, Any]:
+    """Verifica la instantánea y reemplaza la base. Con la app detenida.
+
+    La base actual (con su WAL ya aplicado) se conserva como
+    <nombre>.before-restore-<fecha>.db junto a la restaurada.
+    """
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    part = db_path.with_name(db_path.name + ".restore")
+    report = verify(snapshot_path, db_path.parent, keep_copy=part)
+    if not report["ok"]:
+        if not force:
+            raise RuntimeError("instantánea inválida: " + "; ".join(report["problems"]))
+        _gunzip(snapshot_path, part)
+    if db_path.exists():
+        con = sqlite3.connect(db_path)
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")   # lo confirmado en el WAL pasa al archivo
+        con.close()
+        keep = db_path.with_name(f"{db_path.stem}.before-restore-{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.db")
+        shutil.move(db_path, keep)
+        report["previous"] = str(keep)
+    for suffix in ("-wal", "-shm"):       # un WAL viejo no debe aplicarse sobre la base restaurada
+        Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+    os.replace(part, db_path)
+    return report
+
+
+# ---------- programadas ----------
+class BackupScheduler:
+    """Hilo que toma una instantánea cada `interval` segundos si la base cambió."""
+
+    def __init__(self, pool: gdb.ConnectionPool, interval: float = INTERVAL, directory: Path = BACKUP_DIR):
+        self.pool = pool
+        self.interval = interval
+        self.directory = directory
+        self.last: Optional[Path] = None
+        self.last_error: Optional[str] = None
+        self.last_run: Optional[str] = None
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="gabinete-backup", daemon=True)
+        if interval > 0:
+            self._thread.start()
+
+    def run_now(self) -> Path:
+        """Instantánea inmediata (botón del Panel docente), aunque nada haya cambiado."""
+        return self._take(force=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.interval > 0, "interval_h": self.interval / 3600, "last": self.last,
+                "last_run": self.last_run, "last_error": self.last_error}
+
+    def _take(self, force: bool = False) -> Optional[Path]:
+        self.last_run = datetime.utcnow().isoformat()
+        try:
+            if not force and not changed_since_last(self.pool, self.directory):
+                return None
+            self.last = snapshot(self.pool, self.directory)
+            prune(self.directory)
+            self.last_error = None
+            return self.last
+        except Exception as ex:
+            self.last_error = f"{type(ex).__name__}: {ex}"
+            if force:
+                raise
+            return None
+
+    def _run(self) -> None:
+        while not self._wake.wait(self.interval):
+            self._take()
+
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler(db_path: str = str(gdb.DB_PATH)) -> BackupScheduler:
+    """Un programador por proceso (lo comparten todas las sesiones)."""
+    return BackupScheduler(gdb.get_pool(db_path))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Instantáneas de gabinete.db")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("snapshot", help="toma una instantánea ahora (y aplica la retención)")
+    sub.add_parser("list", help="lista las instantáneas")
+    v = sub.add_parser("verify", help="comprueba una instantánea sin restaurarla")
+    v.add_argument("snapshot", type=Path)
+    r = sub.add_parser("restore", help="verifica y restaura una instantánea (con la app detenida)")
+    r.add_argument("snapshot", type=Path)
+    r.add_argument("--db", type=Path, default=gdb.DB_PATH)
+    r.add_argument("--force", action="store_true", help="restaura aunque la verificación falle")
+    a = ap.parse_args()
+
+    if a.command == "snapshot":
+        out = snapshot(gdb.open_pool())
+        m = manifest(out)
+        print(f"{out} · {m['entries']} gabinete(s) · {m['db_bytes'] / 1e6:.1f} MB -> {m['gz_bytes'] / 1e6:.1f} MB "
+              f"en {m['seconds']} s")
+        if pruned := prune():
+            print(f"{pruned} instantánea(s) antigua(s) borradas")
+    elif a.command == "list":
+        for p in snapshots():
+            m = manifest(p)
+            print(f"{p.name}  {m['created_at'][:19]}  {m['entries']:>6} gabinetes  rev {m['upto_rev']:>7}  "
+                  f"{m['gz_bytes'] / 1e6:7.1f} MB  {len(m['media'])} media")
+    elif a.command == "verify":
+        report = verify(a.snapshot)
+        print("OK" if report["ok"] else "INVÁLIDA: " + "; ".join(report["problems"]))
+        if report["missing_media"]:
+            print(f"{len(report['missing_media'])} archivo(s) de media ya no están en {DATA_DIR}:")
+            for path in report["missing_media"][:20]:
+                print(f"  {path}")
+        raise SystemExit(0 if report["ok"] else 1)
+    else:
+        report = restore(a.snapshot, a.db, a.force)
+        print(f"Restaurada en {a.db}" + (f" (la anterior quedó en {report['previous']})" if "previous" in report else ""))
+        if report["missing_media"]:
+            print(f"Atención: faltan {len(report['missing_media'])} archivo(s) de media (python backup.py verify …)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# ===========================================
+# Gabinete Personal — banners.py (imágenes de assets/ como archivos estáticos)
+# ===========================================
+# Los banners de Inicio y de las Fases pesan 0.2–1 MB cada uno. Con st.image el
+# servidor los relee en cada rerun. Ahora, una vez por proceso (o con
+# `python banners.py build`), cada imagen de assets/ se convierte en versiones
+# AVIF y WebP de WIDTHS px más un JPEG de respaldo, en static/assets/ con la
+# huella del original en el nombre:
+#   static/assets/hero.3f9a…c1.960.avif
+# picture() arma un <picture> con srcset (AVIF, luego WebP) y el navegador elige
+# formato y ancho. AVIF solo si el Pillow instalado trae el códec
+# (features.check("avif")); si no, se queda en WebP.
+#
+# Caché: el servidor estático de Streamlit (Starlette desde 1.65) no envía
+# Cache-Control para app/static; el navegador solo revalida con ETag y
+# Last-Modified (304 sin cuerpo). Como el nombre cambia cuando cambia la imagen,
+# las versiones se pueden guardar indefinidamente, pero esa cabecera la tiene
+# que poner un proxy delante de la app, por ejemplo en nginx:
+#   location ~ ^/app/static/assets/.+\.[0-9a-f]{12}\.[0-9]+\.(avif|webp|jpg)$ {
+#       proxy_pass http://127.0.0.1:8501;
+#       add_header Cache-Control "public, max-age=31536000, immutable";
+#   }
+# En Streamlit Community Cloud no hay dónde ponerla.
+#
+#   python banners.py build [--force]
+from __future__ import annotations
+import argparse, hashlib, html, json, os
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple
+
+import streamlit as st
+
+import media
+
+ASSETS_DIR  = Path(__file__).parent / "assets"
+OUT_DIR     = media.STATIC_DIR / "assets"
+MANIFEST    = OUT_DIR / "manifest.json"
+WIDTHS      = (480, 960, 1440, 1920)
+FALLBACK_W  = 1440            # JPEG para navegadores sin WebP
+QUALITY     = {"avif": 60, "webp": 80, "jpeg": 82}
+ENCODER     = {"avif": {"speed": 8}, "webp": {"method": 6}}   # AVIF speed 8: casi lo que tarda WebP
+MAX_BYTES   = 1_000_000       # un original más pesado que esto se reporta
+MAX_WIDTH   = 3000
+SUFFIXES    = {".jpg", ".jpeg", ".png", ".webp"}
+SIZES       = "(max-width: 768px) 100vw, 75vw"     # layout "wide" con sidebar
+
+
+class Variant(NamedTuple):
+    file: str
+    width: int
+
+
+def _has_avif() -> bool:
+    from PIL import features
+    return bool(features.check("avif"))
+
+
+def _fingerprint(src: Path) -> str:
+    # cambiar la receta (o ganar el códec AVIF al actualizar Pillow) también invalida
+    h = hashlib.sha256(f"{WIDTHS}{QUALITY}{ENCODER}{FALLBACK_W}{_has_avif()}".encode())
+    h.update(src.read_bytes())
+    return h.hexdigest()[:12]
+
+
+def _render(src: Path, fp: str) -> Dict[str, Any]:
+    from PIL import Image, ImageOps
+    with Image.open(src) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    width, height = image.size
+    variants: List[Variant] = []
+    avif: List[Variant] = []
+    formats = [("webp", variants)] + ([("avif", avif)] if _has_avif() else [])
+    for w in sorted({min(w, width) for w in WIDTHS}):
+        resized = None
+        for fmt, done in formats:
+            out = OUT_DIR / f"{src.stem}.{fp}.{w}.{fmt}"
+            if not out.exists():
+                if resized is None:
+                    resized = image.resize((w, round(height * w / width)), Image.LANCZOS)
+                resized.save(out, fmt.upper(), quality=QUALITY[fmt], **ENCODER[fmt])
+            done.append(Variant(out.name, w))
+    fw = min(FALLBACK_W, width)
+    fallback = OUT_DIR / f"{src.stem}.{fp}.{fw}.jpg"
+    if not fallback.exists():
+        image.resize((fw, round(height * fw / width)), Image.LANCZOS).save(
+            fallback, "JPEG", quality=QUALITY["jpeg"], progressive=True, optimize=True)
+    warnings = []
+    if src.stat().st_size > MAX_BYTES:
+        warnings.append(f"pesa {src.stat().st_size / 1e6:.1f} MB (máx. {MAX_BYTES / 1e6:.0f} MB)")
+    if width > MAX_WIDTH:
+        warnings.append(f"mide {width} px de ancho (máx. {MAX_WIDTH})")
+    return {"fp": fp, "width": width, "height": height, "bytes": src.stat().st_size,
+            "variants": [v._asdict() for v in variants], "avif": [v._asdict() for v in avif],
+            "fallback": fallback.name, "warnings": warnings}
+
+
+def build(force: bool = False) -> Dict[str, Dict[str, Any]]:
+    """Genera lo que falte (o todo con force) y borra las versiones de originales que cambiaron."""
+    OUT_DIR.mkdir(parents=True, exist_ok=True)
+    old = {} if force or not MANIFEST.exists() else json.loads(MANIFEST.read_text(encoding="utf-8"))
+    manifest: Dict[str, Dict[str, Any]] = {}
+    for src in sorted(p for p in ASSETS_DIR.iterdir() if p.suffix.lower() in SUFFIXES):
+        fp = _fingerprint(src)
+        prev = old.get(src.name)
+        manifest[src.name] = prev if prev and prev["fp"] == fp else _render(src, fp)
+    keep = {MANIFEST.name} | {v["file"] for m in manifest.values() for v in m["variants"] + m.get("avif", [])} \
+        | {m["fallback"] for m in manifest.values()}
+    for p in OUT_DIR.iterdir():
+        if p.name not in keep:
+            p.unlink(missing_ok=True)
+    tmp = MANIFEST.with_suffix(".part")
+    tmp.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+    os.replace(tmp, MANIFEST)
+    return manifest
+
+
+@st.cache_resource(show_spinner=False)
+def get_manifest() -> Dict[str, Dict[str, Any]]:
+    """Una vez por proceso; si Pillow o el disco fallan, img_asset vuelve a st.image."""
+    try:
+        return build()
+    except Exception:
+        return {}
+
+
+def picture(name: str, alt: str = "") -> str | None:
+    """<picture> con srcset AVIF y WebP y JPEG de respaldo, o None si el asset no está en el manifiesto."""
+    m = get_manifest().get(name)
+    if not m:
+        return None
+    url = media.static_url(OUT_DIR.name)
+    sources = ""
+    for fmt, variants in (("avif", m.get("avif", [])), ("webp", m["variants"])):
+        if variants:
+            srcset = ", ".join(f"{url}/{x['file']} {x['width']}w" for x in variants)
+            sources += f"<source type='image/{fmt}' srcset='{srcset}' sizes='{SIZES}'>"
+    return (f"<picture>{sources}"
+            f"<img src='{url}/{m['fallback']}' alt='{html.escape(alt, quote=True)}' "
+            f"width='{m['width']}' height='{m['height']}' decoding='async' "
+            f"style='width:100%;height:auto;border-radius:14px'></picture>")
+
+
+def warnings() -> Dict[str, List[str]]:
+    """Assets con original demasiado pesado o grande (para el Panel docente)."""
+    return {name: m["warnings"] for name, m in get_manifest().items() if m["warnings"]}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Versiones AVIF/WebP de assets/ en static/assets/")
+    sub = ap.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("build", help="genera las versiones que falten")
+    b.add_argument("--force", action="store_true", help="regenera todas")
+    a = ap.parse_args()
+    for name, m in build(a.force).items():
+        sizes = {fmt: sum((OUT_DIR / x["file"]).stat().st_size for x in m.get(key, [])) / 1e3
+                 for fmt, key in (("WebP", "variants"), ("AVIF", "avif"))}
+        print(f"{name}: {m['bytes'] / 1e3:.0f} KB -> {len(m['variants'])} anchos ("
+              + ", ".join(f"{fmt} {kb:.0f} KB" for fmt, kb in sizes.items() if kb) + " en total)"
+              + "".join(f"\n  ! {w}" for w in m["warnings"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench_card_memory.py — memoria por gabinete: fila completa vs tarjeta liviana
+#
+#   python bench/bench_card_memory.py [--rows 10000]
+#
+# Llena una base temporal con gabinetes de textos realistas (descripción y tres
+# reflexiones largas) y mide con tracemalloc cuánto ocupa tener la galería entera
+# en memoria como:
+#   - sqlite3.Row de las 14+ columnas (SELECT * como el app.py original)
+#   - objetos SQLModel Entry (como pages/gabinete-app)
+#   - gdb.Card (lo que hoy lee la galería)
+from __future__ import annotations
+import argparse, gc, sqlite3, sys, tempfile, tracemalloc
+from pathlib import Path
+from typing import Callable, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+
+ROW = {
+    "student_name": "Alumna Prueba", "email": "a@example.com", "group": "Grupo A",
+    "artifact_title": "Caja de memoria", "artifact_desc": "Madera, hilo y fotografías de la abuela. " * 12,
+    "tags": "identidad, memoria, archivo", "reflection_q1": "El sol que sugiere mi artefacto es… " * 25,
+    "reflection_q2": "La historia que cuento es… " * 25, "reflection_q3": "Lo que no muestro es… " * 25,
+    "image_urls": "uploads/objects/ab/cd/abcd.jpg||uploads/objects/ef/01/ef01.jpg", "audio_url": "", "suno_link": "",
+}
+
+
+def fill(pool: gdb.ConnectionPool, n: int) -> None:
+    for i in range(n):
+        gdb.insert_entry(pool, {**ROW, "artifact_title": f"Caja de memoria {i}",
+                                "artifact_desc": f"{i} " + ROW["artifact_desc"]})
+
+
+def measure(load: Callable[[], list]) -> int:
+    """Bytes que siguen ocupados mientras el resultado está vivo."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = load()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(s.size_diff for s in after.compare_to(before, "filename"))
+    assert result
+    del result
+    return size
+
+
+def full_rows(pool: gdb.ConnectionPool) -> list:
+    with pool.connection() as con:
+        return con.execute("SELECT * FROM entries ORDER BY created_at DESC, id DESC").fetchall()
+
+
+def sqlmodel_rows(pool: gdb.ConnectionPool) -> Optional[Callable[[], list]]:
+    try:
+        from sqlmodel import Field, Session, SQLModel, create_engine, select
+    except ImportError:
+        return None
+
+    class Entry(SQLModel, table=True):       # mismas columnas que pages/gabinete-app
+        __tablename__ = "entries"
+        id: Optional[int] = Field(default=None, primary_key=True)
+        created_at: str
+        student_name: str
+        email: str
+        grp: str
+        artifact_title: str
+        artifact_desc: str
+        tags: str = ""
+        reflection_q1: str = ""
+        reflection_q2: str = ""
+        reflection_q3: str = ""
+        image_urls: str = ""
+        audio_url: str = ""
+        suno_link: str = ""
+
+    engine = create_engine(f"sqlite:///{pool.path}")
+
+    def load() -> list:
+        with Session(engine, expire_on_commit=False) as s:
+            rows = s.exec(select(Entry)).all()
+            s.expunge_all()
+            return list(rows)
+    return load
+
+
+def cards(pool: gdb.ConnectionPool, n: int) -> list:
+    rows, _ = gdb.fetch_page.uncached(pool, limit=n)
+    return rows
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000)
+    a = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = gdb.open_pool(Path(tmp) / "bench.db")
+        fill(pool, a.rows)
+        runs = [("sqlite3.Row (SELECT *)", lambda: full_rows(pool))]
+        orm = sqlmodel_rows(pool)
+        if orm:
+            runs.append(("SQLModel Entry", orm))
+        runs.append(("gdb.Card", lambda: cards(pool, a.rows)))
+
+        print(f"{a.rows} gabinetes en memoria")
+        base = None
+        for name, load in runs:
+            size = measure(load)
+            base = base or size
+            print(f"  {name:<24} {size / 1e6:8.1f} MB  {size / a.rows:8.0f} B/gabinete  ({size / base:.0%})")
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# bench_db_pool.py — inserciones/lecturas concurrentes: connect-por-llamada vs pool WAL
+#
+#   python bench/bench_db_pool.py [--writers 16] [--readers 8] [--rows 50]
+#
+# Simula una clase entera publicando a la vez: N hilos insertan gabinetes
+# mientras M hilos leen la galería. Cuenta filas/s y errores "database is locked".
+from __future__ import annotations
+import argparse, sqlite3, sys, tempfile, threading, time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+
+ROW = {
+    "student_name": "Alumna Prueba", "email": "a@example.com", "group": "Grupo A",
+    "artifact_title": "Caja de memoria", "artifact_desc": "Madera, hilo y fotografías. " * 10,
+    "tags": "identidad, memoria", "reflection_q1": "…" * 200, "reflection_q2": "…" * 200,
+    "reflection_q3": "…" * 200, "image_urls": "", "audio_url": "", "suno_link": "",
+}
+
+
+# ---------- acceso "antes": como el app.py original ----------
+def legacy_setup(path: Path) -> None:
+    con = sqlite3.connect(path)
+    con.executescript(gdb.MIGRATIONS[0])
+    con.close()
+
+def legacy_insert(path: Path, row) -> None:
+    with sqlite3.connect(path) as con:
+        con.execute(
+            """INSERT INTO entries (created_at, student_name, email, grp, artifact_title, artifact_desc,
+            tags, reflection_q1, reflection_q2, reflection_q3, image_urls, audio_url, suno_link)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (datetime.utcnow().isoformat(), row["student_name"], row["email"], row["group"],
+             row["artifact_title"], row["artifact_desc"], row["tags"], row["reflection_q1"],
+             row["reflection_q2"], row["reflection_q3"], row["image_urls"], row["audio_url"], row["suno_link"]),
+        )
+        con.commit()
+
+def legacy_fetch(path: Path):
+    with sqlite3.connect(path) as con:
+        return con.execute("SELECT * FROM entries ORDER BY datetime(created_at) DESC").fetchall()
+
+
+# ---------- carga ----------
+def run(insert, fetch, writers: int, readers: int, rows: int) -> dict:
+    errors, reads = [0], [0]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def writer():
+        for _ in range(rows):
+            try:
+                insert(ROW)
+            except sqlite3.OperationalError:
+                with lock: errors[0] += 1
+
+    def reader():
+        while not done.is_set():
+            try:
+                fetch()
+                with lock: reads[0] += 1
+            except sqlite3.OperationalError:
+                with lock: errors[0] += 1
+
+    ws = [threading.Thread(target=writer) for _ in range(writers)]
+    rs = [threading.Thread(target=reader) for _ in range(readers)]
+    t0 = time.perf_counter()
+    for t in rs + ws: t.start()
+    for t in ws: t.join()
+    elapsed = time.perf_counter() - t0
+    done.set()
+    for t in rs: t.join()
+    return {
+        "inserts_per_s": round((writers * rows - errors[0]) / elapsed, 1),
+        "reads_per_s": round(reads[0] / elapsed, 1),
+        "locked_errors": errors[0],
+        "seconds": round(elapsed, 3),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--writers", type=int, default=16)
+    ap.add_argument("--readers", type=int, default=8)
+    ap.add_argument("--rows", type=int, default=50)
+    a = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        old = Path(tmp) / "antes.db"
+        legacy_setup(old)
+        before = run(lambda r: legacy_insert(old, r), lambda: legacy_fetch(old), a.writers, a.readers, a.rows)
+
+        pool = gdb.open_pool(Path(tmp) / "despues.db")
+        after = run(lambda r: gdb.insert_entry(pool, r), lambda: gdb.fetch_entries(pool), a.writers, a.readers, a.rows)
+        pool.close()
+
+    print(f"{'':10}{'ins/s':>10}{'lect/s':>10}{'locked':>8}{'s':>8}")
+    for name, r in (("antes", before), ("después", after)):
+        print(f"{name:10}{r['inserts_per_s']:>10}{r['reads_per_s']:>10}{r['locked_errors']:>8}{r['seconds']:>8}")
+
+
+if __name__ == "__main__":
+    main()
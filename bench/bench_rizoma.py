@@ -0,0 +1,99 @@
+# bench_rizoma.py — motor de conexiones de la Fase 4 (rizoma.py)
+#
+#   python bench/bench_rizoma.py [--rows 10000] [--queries 200]
+#
+# Llena una base temporal con gabinetes de vocabulario Zipf (como un texto real:
+# pocas palabras muy frecuentes, muchas raras) y mide:
+#   - update_terms: términos de todos los gabinetes (primera vez)
+#   - build: índice invertido TF-IDF en memoria
+#   - related(): latencia media de los k más parecidos
+#   - group_graph(): mapa entre grupos
+#   - refresh tras editar un gabinete (solo recalcula ese)
+from __future__ import annotations
+import argparse, random, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+import rizoma              # noqa: E402
+
+SYLLABLES = "ma me mi mo mu sa se si so su ta te ti to tu la le li lo lu ra re ri ro ru na ne ni no nu ca co cu".split()
+GROUPS = [f"Grupo {c}" for c in "ABCDEFGH"]
+
+
+def vocabulary(n: int, rng: random.Random) -> list:
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def text(rng: random.Random, vocab: list, weights: list, n: int) -> str:
+    return " ".join(rng.choices(vocab, weights, k=n))
+
+
+def fill(pool: gdb.ConnectionPool, n: int, seed: int = 7) -> None:
+    rng = random.Random(seed)
+    vocab = vocabulary(20_000, rng)
+    weights = [1 / (i + 1) for i in range(len(vocab))]      # Zipf
+    rows = []
+    for i in range(n):
+        rows.append({
+            "student_name": f"Alumno {i}", "email": "", "group": rng.choice(GROUPS),
+            "artifact_title": text(rng, vocab, weights, 4), "artifact_desc": text(rng, vocab, weights, 80),
+            "tags": ", ".join(rng.choices(vocab[:300], k=3)),
+            "reflection_q1": text(rng, vocab, weights, 60), "reflection_q2": text(rng, vocab, weights, 60),
+            "reflection_q3": text(rng, vocab, weights, 60),
+        })
+        if len(rows) == 500:
+            gdb.insert_entries(pool, rows)
+            rows = []
+    if rows:
+        gdb.insert_entries(pool, rows)
+
+
+def timed(label: str, fn, rows: int = 0):
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    extra = f"  ({rows / dt:,.0f} gabinetes/s)" if rows else ""
+    print(f"  {label:<28} {dt * 1000:9.1f} ms{extra}")
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000)
+    ap.add_argument("--queries", type=int, default=200)
+    a = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pool = gdb.open_pool(Path(tmp) / "bench.db")
+        fill(pool, a.rows)
+        print(f"{a.rows} gabinetes, {len(GROUPS)} grupos")
+
+        timed("update_terms (todos)", lambda: rizoma.update_terms(pool), a.rows)
+        rz = rizoma.Rizoma(pool)
+        index = timed("refresh (build del índice)", rz.refresh)
+        size = sum(arr.nbytes for arr in (index.feats, index.weights, index.post_feats, index.post_rows, index.post_weights))
+        print(f"  {'postings':<28} {len(index.post_feats):9,d}  ({size / 1e6:.1f} MB en memoria)")
+
+        ids = random.Random(1).sample(list(index.row_of), min(a.queries, len(index)))
+        t0 = time.perf_counter()
+        for e in ids:
+            rz.related(e, k=8)
+        dt = (time.perf_counter() - t0) / len(ids)
+        print(f"  {'related(k=8), media':<28} {dt * 1000:9.2f} ms")
+        timed("group_graph", rz.group_graph)
+
+        with pool.transaction() as con:
+            con.execute("UPDATE entries SET artifact_desc = artifact_desc || ' editado' WHERE id = ?", (ids[0],))
+        t0 = time.perf_counter()
+        done = rizoma.update_terms(pool)
+        rz.refresh()
+        print(f"  {'refresh tras 1 edición':<28} {(time.perf_counter() - t0) * 1000:9.1f} ms  ({done} recalculado)")
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
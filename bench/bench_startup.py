@@ -0,0 +1,86 @@
+# bench_startup.py — arranque en frío y costo por rerun de cada página del sidebar
+#
+#   python bench/bench_startup.py [--reruns 10] [--cold 3]
+#
+# Usa streamlit.testing (AppTest) para ejecutar app.py sin navegador:
+#   - arranque en frío: un proceso nuevo que importa y corre el script una vez
+#     (imports + bootstrap + primera página), repetido --cold veces
+#   - rerun: dentro de un mismo proceso, elige cada página en el sidebar y la
+#     vuelve a correr --reruns veces (lo que cuesta cada clic o tecla)
+# Además lista qué módulos pesados (PIL, numpy, pandas, sqlalchemy, zipfile)
+# quedan cargados después de visitar cada página.
+from __future__ import annotations
+import argparse, statistics, subprocess, sys, time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+HEAVY = ("PIL", "numpy", "pandas", "sqlalchemy", "zipfile")
+PAGES = [
+    "Inicio",
+    "Fase 1 · Análisis Forense",
+    "Fase 2 · Arquitectura Conceptual",
+    "Fase 3 · Prototipo",
+    "Fase 4 · Conspiración Curatorial",
+    "Crear mi gabinete",
+    "Galería",
+    "Panel docente",
+]
+
+COLD = """
+import sys, time
+t = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120).run()
+assert not at.exception, at.exception
+print(time.perf_counter() - t, ",".join(m for m in {heavy!r} if m in sys.modules))
+"""
+
+
+def cold_start(runs: int) -> None:
+    times, loaded = [], ""
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", COLD.format(app=str(ROOT / "app.py"), heavy=HEAVY)],
+                             cwd=ROOT, capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(out[0]))
+        loaded = out[1] if len(out) > 1 else "—"
+    print(f"arranque en frío (Inicio)   {statistics.median(times) * 1000:8.0f} ms   cargados: {loaded}")
+
+
+def reruns(n: int) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=120)
+    at.secrets["ADMIN_KEY"] = "bench"
+    at.run()
+    print(f"\n{'página':<34} {'1ª visita':>10} {'rerun (mediana)':>16}   módulos pesados")
+    for page in PAGES:
+        t = time.perf_counter()
+        at.sidebar.radio[0].set_value(page).run()
+        first = time.perf_counter() - t
+        if page == "Panel docente" and at.text_input:
+            at.text_input[0].set_value("bench").run()
+        samples = []
+        for _ in range(n):
+            t = time.perf_counter()
+            at.run()
+            samples.append(time.perf_counter() - t)
+        if at.exception:
+            print(f"{page:<34} error: {at.exception[0].message}")
+            continue
+        loaded = ",".join(m for m in HEAVY if m in sys.modules) or "—"
+        print(f"{page:<34} {first * 1000:8.0f} ms {statistics.median(samples) * 1000:13.1f} ms   {loaded}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--reruns", type=int, default=10)
+    ap.add_argument("--cold", type=int, default=3)
+    a = ap.parse_args()
+    cold_start(a.cold)
+    reruns(a.reruns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# bench_suite.py — benchmark de punta a punta con datos sintéticos y baseline JSON
+#
+#   python bench/bench_suite.py [--sizes 1000 10000 100000] [--repeat 20] [--out bench/baseline.json]
+#   python bench/bench_suite.py --sizes 10000 --compare bench/baseline.json [--tolerance 0.25]
+#
+# Cada tamaño corre en su propio proceso con una carpeta de datos temporal
+# (GABINETE_DATA_DIR), así los módulos leen sus rutas de ahí y la memoria
+# máxima (RSS) de un tamaño no contamina al siguiente. Por tamaño:
+#   - genera imágenes JPEG y audios WAV únicos y los guarda con media.save_images /
+#     media.save_audio (escenarios save_image y save_audio)
+#   - llena entries con textos de vocabulario Zipf, etiquetas, imágenes y audio
+#     (seed_insert, por lotes de 500 como la cola de escritura)
+#   - fetch_entries, galería (filtros + cursores), búsqueda FTS, métricas del
+#     Panel docente, publicaciones concurrentes por la cola, export CSV y ZIP
+#   - con pandas y pyarrow, export Parquet de análisis y su carga frente a leer el CSV
+#   - con Streamlit instalado, reruns reales de app.py (AppTest) en Galería y
+#     Panel docente
+# De cada escenario guarda ops/s, p50/p95/p99/máx en ms y pico de memoria
+# Python (tracemalloc, una pasada aparte para no sesgar los tiempos).
+#
+# --compare marca regresión si p50 o el pico de memoria suben, o las ops/s
+# bajan, más de --tolerance respecto del baseline; sale con código 1.
+from __future__ import annotations
+import argparse, io, json, math, os, platform, random, resource, struct, subprocess, sys, tempfile
+import threading, time, tracemalloc, wave
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+SYLLABLES = "ma me mi mo mu sa se si so su ta te ti to tu la le li lo lu ra re ri ro ru na ne ni no nu ca co cu".split()
+GROUPS = ["Grupo A", "Grupo B", "Grupo C", "Otro"]
+BATCH = 500
+
+
+# ---------- datos sintéticos ----------
+class Upload(io.BytesIO):
+    """Lo mínimo de un UploadedFile de Streamlit: bytes + nombre."""
+
+    def __init__(self, data: bytes, name: str):
+        super().__init__(data)
+        self.name = name
+
+
+def vocabulary(n: int, rng: random.Random) -> List[str]:
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+class Corpus:
+    def __init__(self, seed: int = 7):
+        self.rng = random.Random(seed)
+        self.vocab = vocabulary(20_000, self.rng)
+        self.weights = [1 / (i + 1) for i in range(len(self.vocab))]     # Zipf
+        self.tags = self.vocab[:80]
+
+    def text(self, n: int) -> str:
+        return " ".join(self.rng.choices(self.vocab, self.weights, k=n))
+
+    def row(self, i: int, images: List[Any], audio: List[str]) -> Dict[str, Any]:
+        rng = self.rng
+        imgs = rng.sample(images, min(len(images), rng.choice([0, 1, 1, 2, 3]))) if images else []
+        return {
+            "student_name": f"Alumno {i}", "email": f"a{i}@example.com", "group": rng.choice(GROUPS),
+            "artifact_title": self.text(4), "artifact_desc": self.text(rng.randint(40, 120)),
+            "tags": ", ".join(rng.choices(self.tags, self.weights[:len(self.tags)], k=rng.randint(1, 4))),
+            "reflection_q1": self.text(rng.randint(30, 90)), "reflection_q2": self.text(rng.randint(30, 90)),
+            "reflection_q3": self.text(rng.randint(30, 90)),
+            "image_urls": "||".join(r.original for r in imgs), "images": imgs,
+            "audio_url": rng.choice(audio) if audio and rng.random() < .3 else "", "suno_link": "",
+        }
+
+
+def make_image(seed: int, size=(1600, 1200)) -> Upload:
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    noise = Image.effect_noise(size, 40 + seed % 30)
+    grad = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (noise, grad, grad.rotate(90 + seed % 180)))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + rng.randint(40, 300), y + rng.randint(40, 300)),
+                     fill=tuple(rng.randrange(256) for _ in range(3)))
+    out = io.BytesIO()
+    image.save(out, "JPEG", quality=90)
+    return Upload(out.getvalue(), f"foto_{seed}.jpg")
+
+
+def make_audio(seed: int, seconds: float = 8.0, rate: int = 22050) -> Upload:
+    freq = 180 + 37 * seed
+    samples = (int(12000 * math.sin(2 * math.pi * freq * t / rate) * (0.5 + 0.5 * math.sin(t / rate * 3)))
+               for t in range(int(seconds * rate)))
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"".join(struct.pack("<h", s) for s in samples))
+    return Upload(out.getvalue(), f"voz_{seed}.wav")
+
+
+# ---------- medición ----------
+def percentile(data: List[float], q: float) -> float:
+    data = sorted(data)
+    return data[min(len(data) - 1, int(q * len(data)))] if data else 0.0
+
+
+def peak_mb(fn: Callable[[], Any]) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+
+def summary(samples: List[float], ops: int | None = None, peak: float | None = None) -> Dict[str, Any]:
+    """samples: segundos por repetición; ops: operaciones totales (por defecto una por repetición)."""
+    total = sum(samples)
+    ops = ops or len(samples)
+    return {"ops": ops, "seconds": round(total, 4), "ops_per_s": round(ops / total, 2) if total else None,
+            "p50_ms": round(percentile(samples, .5) * 1000, 3), "p95_ms": round(percentile(samples, .95) * 1000, 3),
+            "p99_ms": round(percentile(samples, .99) * 1000, 3), "max_ms": round(max(samples) * 1000, 3),
+            "peak_mb": None if peak is None else round(peak, 2)}
+
+
+def bench(fn: Callable[[], Any], repeat: int, memory: bool = True) -> Dict[str, Any]:
+    samples = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t)
+    return summary(samples, peak=peak_mb(fn) if memory else None)
+
+
+# ---------- escenarios (dentro del proceso de un tamaño) ----------
+def run_size(rows: int, repeat: int, seed: int) -> Dict[str, Any]:
+    import export
+    import gabinete_db as gdb
+    import media
+    from write_queue import WriteQueue
+
+    pool = gdb.open_pool(gdb.DB_PATH)
+    corpus = Corpus(seed)
+    out: Dict[str, Any] = {}
+    say = lambda name: print(f"  [{rows}] {name}", file=sys.stderr, flush=True)
+
+    say("save_image")
+    uploads = [make_image(seed * 1000 + i) for i in range(repeat)]
+    samples = []
+    images = []
+    for up in uploads:
+        t = time.perf_counter()
+        images.append(media.save_image(pool, up))
+        samples.append(time.perf_counter() - t)
+    extra = make_image(seed * 1000 + repeat)
+    out["save_image"] = summary(samples, peak=peak_mb(lambda: media.save_image(pool, extra)))
+
+    say("save_audio")
+    clips = [make_audio(seed * 100 + i) for i in range(max(3, repeat // 4))]
+    samples = []
+    audio = []
+    for clip in clips:
+        t = time.perf_counter()
+        audio.append(media.save_audio(pool, clip))
+        samples.append(time.perf_counter() - t)
+    out["save_audio"] = summary(samples)
+
+    say("seed_insert")
+    samples = []
+    for start in range(0, rows, BATCH):
+        batch = [corpus.row(i, images, audio) for i in range(start, min(rows, start + BATCH))]
+        t = time.perf_counter()
+        gdb.insert_entries(pool, batch)
+        samples.append(time.perf_counter() - t)
+    out["seed_insert"] = summary(samples, ops=rows)
+    with pool.connection() as con:
+        con.execute("PRAGMA optimize")
+
+    say("fetch_entries")
+    out["fetch_entries"] = bench(lambda: gdb.fetch_entries.uncached(pool), max(3, repeat // 4))
+
+    rng = random.Random(seed)
+
+    def gallery() -> None:
+        flt = {"group": rng.choice([None, *GROUPS]), "search": "", "tag": rng.choice(["", "", *corpus.tags[:10]])}
+        cursor = None
+        for _ in range(3):                     # tres páginas siguiendo el cursor
+            _, cursor = gdb.fetch_page.uncached(pool, **flt, after=cursor)
+            if cursor is None:
+                break
+        gdb.count_entries.uncached(pool, **flt)
+        gdb.tag_counts.uncached(pool, flt["group"])
+
+    say("gallery")
+    out["gallery"] = bench(gallery, repeat)
+    out["gallery_cached"] = bench(lambda: gdb.fetch_page(pool), repeat, memory=False)
+
+    say("search")
+    terms = corpus.vocab[:200]
+    out["search"] = bench(lambda: gdb.fetch_page.uncached(pool, search=rng.choice(terms)), repeat)
+
+    say("panel")
+    out["panel"] = bench(lambda: gdb.dashboard.uncached(pool), max(3, repeat // 2))
+
+    say("submission")
+    queue = WriteQueue(pool, spool_dir=gdb.DATA_DIR / "spool")
+    threads, per_thread = 8, max(5, repeat)
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def student(k: int) -> None:
+        for j in range(per_thread):
+            row = corpus.row(rows + k * per_thread + j, images, audio)
+            t = time.perf_counter()
+            queue.insert(row)
+            with lock:
+                latencies.append(time.perf_counter() - t)
+
+    t0 = time.perf_counter()
+    workers = [threading.Thread(target=student, args=(k,)) for k in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - t0
+    queue.close()
+    sub = summary(latencies)
+    sub.update(ops_per_s=round(len(latencies) / wall, 2), seconds=round(wall, 4), threads=threads)
+    out["submission"] = sub
+
+    def fresh(ext: str, build: Callable[[gdb.ConnectionPool], Path]) -> Callable[[], Any]:
+        def run() -> Path:
+            for old in export.EXPORT_DIR.glob(f"gabinetes_*.{ext}"):
+                old.unlink()                   # sin esto el export reutiliza el archivo anterior
+            return build(pool)
+        return run
+
+    say("export")
+    out["csv_export"] = bench(fresh("csv", export.csv_export), 3)
+    out["zip_export"] = bench(fresh("zip", export.zip_export), 3)
+    out["zip_export"]["mb"] = round(export.zip_export(pool).stat().st_size / 1e6, 1)
+    out.update(run_analytics(pool))
+
+    out.update(run_apptest(repeat))
+    pool.close()
+    return {"rows": rows, "scenarios": out,
+            "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)}
+
+
+def run_analytics(pool: gdb.ConnectionPool) -> Dict[str, Any]:
+    """Export Parquet y carga en pandas frente a re-parsear el CSV. Se omite sin pandas/pyarrow."""
+    try:
+        import pandas as pd
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return {}
+
+    def parquet() -> Path:
+        for old in export.EXPORT_DIR.glob("analisis_*.parquet"):
+            old.unlink()
+        return export.analytics_export([pool])
+
+    out = {"parquet_export": bench(parquet, 3)}
+    out["parquet_export"]["mb"] = round(export.analytics_export([pool]).stat().st_size / 1e6, 1)
+    csv_path = export.csv_export(pool)
+    out["csv_load"] = bench(lambda: pd.read_csv(csv_path, parse_dates=["created_at"]), 3)
+    out["parquet_load"] = bench(lambda: export.analytics_frame([pool]), 3)
+    return out
+
+
+def run_apptest(repeat: int) -> Dict[str, Any]:
+    """Reruns reales de app.py (sin navegador). Se omite si Streamlit no está instalado."""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {}
+    out = {}
+    at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=300)
+    at.secrets["ADMIN_KEY"] = "bench"
+    at.run()
+    for name, page in (("app_gallery", "Galería"), ("app_panel", "Panel docente")):
+        at.sidebar.radio[0].set_value(page).run()
+        if page == "Panel docente":
+            at.text_input[0].set_value("bench").run()
+        if at.exception:
+            print(f"  AppTest {page}: {at.exception[0].message}", file=sys.stderr)
+            continue
+        out[name] = bench(at.run, repeat, memory=False)
+    return out
+
+
+# ---------- proceso principal ----------
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Regresiones de `current` respecto de `baseline` (mismos tamaños y escenarios)."""
+    problems = []
+    base_sizes = {str(r["rows"]): r for r in baseline["results"]}
+    for run in current["results"]:
+        base = base_sizes.get(str(run["rows"]))
+        if base is None:
+            continue
+        for name, now in run["scenarios"].items():
+            old = base["scenarios"].get(name)
+            if not old:
+                continue
+            for key, worse in (("p50_ms", 1), ("peak_mb", 1), ("ops_per_s", -1)):
+                a, b = old.get(key), now.get(key)
+                if not a or b is None:
+                    continue
+                change = (b - a) / a * worse
+                if change > tolerance:
+                    problems.append(f"{run['rows']:>7} {name:<16} {key:<10} {a:>10.2f} -> {b:>10.2f}  ({change:+.0%})")
+    return problems
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", type=Path, help="escribe los resultados (JSON) aquí; p. ej. el baseline")
+    ap.add_argument("--compare", type=Path, help="baseline JSON contra el que comparar")
+    ap.add_argument("--tolerance", type=float, default=0.25)
+    ap.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    a = ap.parse_args()
+
+    if a.worker is not None:
+        print(json.dumps(run_size(a.worker, a.repeat, a.seed)))
+        return
+
+    results = []
+    for rows in a.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = {**os.environ, "GABINETE_DATA_DIR": tmp, "GABINETE_TRANSCODE": "0"}
+            proc = subprocess.run([sys.executable, __file__, "--worker", str(rows), "--repeat", str(a.repeat),
+                                   "--seed", str(a.seed)], env=env, cwd=ROOT, stdout=subprocess.PIPE, text=True, check=True)
+            results.append(json.loads(proc.stdout))
+
+    report = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+              "machine": platform.machine(), "cpus": os.cpu_count(), "repeat": a.repeat, "results": results}
+    for run in results:
+        print(f"\n{run['rows']} gabinetes · RSS máx. {run['max_rss_mb']} MB")
+        print(f"  {'escenario':<16} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'pico MB':>9}")
+        for name, s in run["scenarios"].items():
+            print(f"  {name:<16} {s['ops_per_s'] or 0:>10.1f} {s['p50_ms']:>10.2f} {s['p95_ms']:>10.2f} "
+                  f"{s['p99_ms']:>10.2f} {'' if s['peak_mb'] is None else s['peak_mb']:>9}")
+    if a.out:
+        a.out.write_text(json.dumps(report, indent=1, ensure_ascii=False), encoding="utf-8")
+        print(f"\nresultados en {a.out}")
+    if a.compare:
+        problems = compare(report, json.loads(a.compare.read_text(encoding="utf-8")), a.tolerance)
+        print(f"\ncomparación con {a.compare} (tolerancia {a.tolerance:.0%}):")
+        print("\n".join(problems) if problems else "  sin regresiones")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# ===========================================
+# Gabinete Personal — drafts.py (borradores de las Fases y del formulario)
+# ===========================================
+# El avance de cada alumno se guarda en la tabla drafts (uno por email). El
+# token del borrador es su secreto: se entrega solo al crearlo y queda en la URL
+# (?borrador=…), así que recargar la página o reconectar no pierde nada. Para
+# retomar un borrador existente en otra sesión hace falta ese enlace o el código
+# (el token); escribir el email de otra persona no abre su borrador.
+#
+# - Los widgets de cada Fase usan la clave "d_<campo>": prefill() los llena con
+#   lo guardado y autosave() escribe solo los campos que difieren de la base,
+#   como mucho una vez cada DRAFT_DEBOUNCE segundos (lo que quede pendiente lo
+#   escribe un fragmento que corre cada DRAFT_DEBOUNCE).
+# - Lo pendiente va con su token y se escribe antes de cambiar de página o de
+#   borrador; al abrir otro borrador los widgets se vacían y se recargan de él.
+# - Las imágenes se guardan en el almacén por contenido al subirlas, una sola
+#   vez, y el borrador guarda sus versiones: publicar no vuelve a procesarlas.
+from __future__ import annotations
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import streamlit as st
+
+import gabinete_db as gdb
+from media import Rendition, save_images
+
+DRAFT_DEBOUNCE = 2.0
+QUERY_PARAM = "borrador"
+MAX_IMAGES = 6
+
+# campos de cada página (clave en drafts.data)
+FASE1 = ["fase1_reflexion"]
+FASE2 = ["fase2_tipo", "fase2_metafora", "fase2_salas", "fase2_artefacto"]
+FASE3 = ["fase3_pitch"]
+FASE4 = ["fase4_equipo", "fase4_concepto", "fase4_invitacion"]
+GABINETE = ["student_name", "email", "group", "artifact_title", "artifact_desc", "tags",
+            "reflection_q1", "reflection_q2", "reflection_q3", "suno_link"]
+
+
+def key(field: str) -> str:
+    return f"d_{field}"
+
+
+# ---------- identidad ----------
+ALL_FIELDS = FASE1 + FASE2 + FASE3 + FASE4 + GABINETE
+
+
+def identify(pool: gdb.ConnectionPool, page: str) -> Optional[str]:
+    """Campo de email en la barra lateral; devuelve el token del borrador de esta sesión (o None).
+
+    Se llama en cada rerun antes de pintar la página: si la página cambió, escribe
+    antes lo que el debounce dejó pendiente.
+    """
+    ss = st.session_state
+    if ss.get("draft_page") != page:
+        flush(pool)
+        ss.draft_page = page
+    if "draft_token" not in ss:
+        token = st.query_params.get(QUERY_PARAM)
+        draft = gdb.load_draft(pool, token) if token else None
+        ss.draft_token = token if draft else None
+        if draft:
+            ss.draft_email = draft["email"]
+    email = st.sidebar.text_input("Tu email (guarda tu avance)", key="draft_email",
+                                  help="Con tu email tu borrador se guarda solo y puedes retomarlo al volver.")
+    if email and "@" in email:
+        norm = gdb.normalize_email(email)
+        draft = current(pool)
+        if draft is None or draft["email"] != norm:
+            token = gdb.create_draft(pool, norm)
+            if token:
+                _switch(pool, token, keep_fields=True)     # borrador nuevo: se queda con lo ya escrito
+            else:
+                _switch(pool, None)
+                code = st.sidebar.text_input("Código de tu borrador", key="draft_code", type="password",
+                                             help="Está en el enlace que guardaste: …?borrador=<código>")
+                found = gdb.load_draft(pool, code.strip()) if code else None
+                if found and found["email"] == norm:
+                    _switch(pool, found["token"])
+                elif code:
+                    st.sidebar.error("Ese código no corresponde a ese email.")
+                else:
+                    st.sidebar.info("Ya hay un borrador con ese email. Ábrelo con el enlace que guardaste "
+                                    "o escribe su código.")
+    if ss.draft_token:
+        st.query_params[QUERY_PARAM] = ss.draft_token
+        st.sidebar.caption(f"Código de tu borrador: `{ss.draft_token}`. Guárdalo (o guarda este enlace) "
+                           "para retomarlo en otro dispositivo.")
+    else:
+        st.query_params.pop(QUERY_PARAM, None)
+    return ss.draft_token
+
+
+def _switch(pool: gdb.ConnectionPool, token: Optional[str], keep_fields: bool = False) -> None:
+    """Cambia el borrador de la sesión: escribe lo pendiente del anterior y vacía los widgets
+    (salvo keep_fields) para que prefill() los llene con el nuevo."""
+    ss = st.session_state
+    if ss.get("draft_token") == token:
+        return
+    flush(pool)
+    if not keep_fields:
+        for f in ALL_FIELDS:
+            ss.pop(key(f), None)
+    ss.draft_token = token
+
+
+def current(pool: gdb.ConnectionPool) -> Optional[Dict[str, Any]]:
+    token = st.session_state.get("draft_token")
+    return gdb.load_draft(pool, token) if token else None
+
+
+# ---------- campos ----------
+def prefill(pool: gdb.ConnectionPool, fields: Sequence[str]) -> None:
+    """Antes de pintar los widgets: pone en session_state lo guardado (si el widget aún no tiene valor)."""
+    ss = st.session_state
+    draft = current(pool)
+    if not draft:
+        return
+    for f in fields:
+        if key(f) not in ss and f in draft["data"]:
+            ss[key(f)] = draft["data"][f]
+
+
+def _write(pool: gdb.ConnectionPool, token: str, changed: Dict[str, Any]) -> None:
+    ss = st.session_state
+    gdb.save_draft(pool, token, changed)
+    ss.pop("draft_pending", None)
+    ss.draft_written_at = time.monotonic()
+
+
+def flush(pool: gdb.ConnectionPool) -> None:
+    """Escribe ya lo que el debounce dejó pendiente (en el borrador al que pertenece)."""
+    pending = st.session_state.get("draft_pending")
+    if pending:
+        _write(pool, pending["token"], pending["data"])
+
+
+def autosave(pool: gdb.ConnectionPool, fields: Sequence[str], force: bool = False) -> bool:
+    """Después de los widgets: guarda los campos que difieren de la base. True si escribió."""
+    ss = st.session_state
+    draft = current(pool)
+    if not draft:
+        return False
+    changed = {f: ss[key(f)] for f in fields if key(f) in ss and ss[key(f)] != draft["data"].get(f)}
+    if not changed:
+        ss.pop("draft_pending", None)
+        return False
+    if force or time.monotonic() - ss.get("draft_written_at", 0.0) >= DRAFT_DEBOUNCE:
+        _write(pool, draft["token"], changed)
+        return True
+    ss.draft_pending = {"token": draft["token"], "data": changed}
+    _flush(pool)
+    return False
+
+
+@st.fragment(run_every=DRAFT_DEBOUNCE)
+def _flush(pool: gdb.ConnectionPool) -> None:
+    """Escribe lo que autosave dejó pendiente por el debounce."""
+    ss = st.session_state
+    if ss.get("draft_pending") and time.monotonic() - ss.get("draft_written_at", 0.0) >= DRAFT_DEBOUNCE:
+        flush(pool)
+
+
+# ---------- imágenes ----------
+def images(draft: Optional[Dict[str, Any]], *slots: str) -> List[Rendition]:
+    """Versiones guardadas en el borrador (sin repetir), de los `slots` indicados o de todos."""
+    if not draft:
+        return []
+    out: Dict[str, Rendition] = {}
+    for slot, imgs in draft["images"].items():
+        if slots and slot not in slots:
+            continue
+        for img in imgs:
+            out.setdefault(img[0], Rendition(*img))
+    return list(out.values())
+
+
+def attach(pool: gdb.ConnectionPool, slot: str, files: List[Any], limit: int = MAX_IMAGES,
+           on_error=None) -> List[Rendition]:
+    """Guarda en el almacén las subidas nuevas del `slot` y las anota en el borrador
+    (se quedan las `limit` más recientes).
+
+    Cada archivo se procesa una vez por sesión (por file_id); los que ya estaban
+    en el borrador se reutilizan.
+    """
+    ss = st.session_state
+    seen = ss.setdefault("draft_files", {})
+    new = [f for f in files if getattr(f, "file_id", f.name) not in seen]
+    failed = set()
+
+    def _failed(f, ex):
+        failed.add(id(f))
+        if on_error:
+            on_error(f, ex)
+
+    # en un solo lote (pool de procesos de media.py); devuelve una versión por archivo que no falló
+    saved = save_images(pool, new, on_error=_failed) if new else []
+    for f, r in zip([f for f in new if id(f) not in failed], saved):
+        seen[getattr(f, "file_id", f.name)] = r
+    if not ss.get("draft_token"):
+        return [seen[fid] for fid in (getattr(f, "file_id", f.name) for f in files) if fid in seen]
+    draft = current(pool)
+    kept = images(draft, slot)
+    for r in saved:
+        if r.original not in {k.original for k in kept}:
+            kept.append(r)
+    kept = kept[-limit:]
+    if saved:
+        gdb.save_draft(pool, ss.draft_token, images={slot: [list(r) for r in kept]})
+    return kept
+
+
+def status() -> None:
+    if st.session_state.get("draft_token"):
+        st.caption("💾 Tu avance se guarda solo en tu borrador.")
+    else:
+        st.caption("Escribe tu email en la barra lateral para guardar tu avance.")
+
+
+def drop_images(pool: gdb.ConnectionPool, slot: str) -> None:
+    gdb.save_draft(pool, st.session_state.draft_token, images={slot: []})
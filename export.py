@@ -0,0 +1,417 @@
+# ===========================================
+# Gabinete Personal — export.py (CSV / ZIP / Parquet del Panel docente)
+# ===========================================
+# Las exportaciones se generan solo cuando alguien las pide y se escriben en
+# disco por partes (nunca el archivo completo en memoria). Cada archivo lleva
+# en el nombre la huella de la tabla entries: mientras nadie publique ni edite,
+# las descargas repetidas reutilizan el último archivo.
+#
+# El ZIP (con media) y los respaldos no pasan por la memoria de la sesión: serve()
+# los enlaza en static/exports/<token>/ y Streamlit los entrega por bloques desde
+# el disco. Su servidor estático no entrega archivos de más de 200 MB; los que
+# pasan de ahí se descargan del servidor (data/exports/).
+#
+# Análisis (Parquet): una fila por gabinete con columnas tipadas para pandas/
+# Arrow, de la base activa y de los semestres archivados que se pidan.
+#
+# Respaldo incremental (delta): solo gabinetes nuevos o editados desde el
+# último respaldo (o desde una fecha) y solo la media que aún no se había
+# enviado; cada uno queda registrado en export_checkpoints. La cadena "desde
+# el último" sigue solo a los respaldos por rev: uno por fecha no la corta.
+#
+#   python export.py delta [--since-ts 2025-09-01]
+#   python export.py restore delta_0001.zip delta_0002.zip … [--db otra/gabinete.db]
+from __future__ import annotations
+import argparse, csv, hashlib, io, json, os, secrets, shutil, sqlite3, threading
+from datetime import datetime
+from pathlib import Path
+from contextlib import ExitStack
+from typing import TYPE_CHECKING, Any, Callable, Iterable, List, Sequence, Tuple
+from zipfile import ZipFile, ZipInfo, ZIP_DEFLATED, ZIP_STORED
+
+import gabinete_db as gdb
+import metrics
+from storage import LocalStorage, get_storage
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+DATA_DIR   = gdb.DATA_DIR
+EXPORT_DIR = DATA_DIR / "exports"
+DELTA_DIR  = EXPORT_DIR / "deltas"
+SERVE_DIR  = gdb.BASE_DIR / "static" / "exports"     # static/: lo sirve Streamlit (server.enableStaticServing)
+MAX_SERVED = 200 * 1024 * 1024                      # más grande, app/static responde 404 (Streamlit 1.65)
+
+CSV_HEADER = ["id","created_at","student_name","email","group","artifact_title","artifact_desc",
+              "tags","reflection_q1","reflection_q2","reflection_q3","image_urls","audio_url","suno_link"]
+CSV_COLUMNS = ("id, created_at, student_name, email, grp, artifact_title, artifact_desc, tags, "
+               "reflection_q1, reflection_q2, reflection_q3, image_urls, audio_url, suno_link")
+
+# formatos ya comprimidos: deflate solo gasta CPU (WAV sí se comprime)
+STORED_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".mp3", ".m4a", ".aac", ".ogg", ".opus"}
+
+_build_lock = threading.Lock()
+
+
+def fingerprint(con: sqlite3.Connection, *counters: str) -> str:
+    """Huella barata de entries: contador de cambios (triggers) + conteo + último id.
+
+    `counters`: otros contadores que también invalidan (p. ej. "spark" para el análisis).
+    """
+    gens = "|".join(str(gdb.generation(con, name)) for name in ("entries", *counters))
+    count, last_id = con.execute("SELECT COUNT(*), ifnull(MAX(id), 0) FROM entries").fetchone()
+    return hashlib.sha1(f"{gens}|{count}|{last_id}".encode()).hexdigest()[:12]
+
+
+def write_csv(con: sqlite3.Connection, fh, where: str = "", args: Iterable = (), extra: Tuple[str, ...] = ()) -> int:
+    """Escribe el CSV fila por fila desde el cursor (sin cargar la tabla). Devuelve cuántas filas."""
+    w = csv.writer(fh)
+    w.writerow(CSV_HEADER + list(extra))
+    cols = ", ".join((CSV_COLUMNS,) + extra)
+    n = 0
+    for row in con.execute(f"SELECT {cols} FROM entries {where} ORDER BY created_at DESC, id DESC", tuple(args)):
+        w.writerow(tuple(row))
+        n += 1
+    return n
+
+def _add_media(zf: ZipFile, rel: str) -> bool:
+    p = DATA_DIR / rel
+    kind = ZIP_STORED if p.suffix.lower() in STORED_SUFFIXES else ZIP_DEFLATED
+    arcname = str(Path("media") / rel)
+    if p.exists():
+        zf.write(p, arcname=arcname, compress_type=kind)
+        return True
+    # sin copia local (p. ej. tras reiniciar en la nube): por bloques desde el almacén configurado
+    store = get_storage()
+    if isinstance(store, LocalStorage) or not store.exists(rel):
+        return False
+    info = ZipInfo(arcname, date_time=datetime.now().timetuple()[:6])
+    info.compress_type = kind
+    with zf.open(info, "w", force_zip64=True) as out:
+        for block in store.stream(rel):
+            out.write(block)
+    return True
+
+
+def _cached(pool: gdb.ConnectionPool, ext: str, build: Callable[[sqlite3.Connection, Path], None]) -> Path:
+    """Devuelve exports/gabinetes_<huella>.<ext>, generándolo si la tabla cambió desde el último."""
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    with _build_lock, pool.connection() as con:
+        con.execute("BEGIN")             # una sola instantánea (WAL) para huella y filas
+        out = EXPORT_DIR / f"gabinetes_{fingerprint(con)}.{ext}"
+        if not out.exists():
+            tmp = out.with_suffix(f".{ext}.part")
+            with metrics.span(f"export.{ext}"):
+                build(con, tmp)
+            os.replace(tmp, out)
+            metrics.count("export.bytes", out.stat().st_size, kind=ext)
+            for old in EXPORT_DIR.glob(f"gabinetes_*.{ext}"):
+                if old != out:
+                    old.unlink(missing_ok=True)
+        con.rollback()
+    return out
+
+
+def _build_csv(con: sqlite3.Connection, out: Path) -> None:
+    with open(out, "w", newline="", encoding="utf-8") as fh:
+        write_csv(con, fh)
+
+
+def _build_zip(con: sqlite3.Connection, out: Path) -> None:
+    with ZipFile(out, "w", ZIP_DEFLATED) as zf:
+        with zf.open("gabinetes.csv", "w") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as fh:
+            write_csv(con, fh)
+        written = set()   # media por contenido: la misma foto en varios gabinetes va una sola vez
+        for image_urls, audio_url in con.execute("SELECT image_urls, audio_url FROM entries"):
+            for u in gdb.media_paths(image_urls, audio_url):
+                if u not in written and _add_media(zf, u):
+                    written.add(u)
+
+
+def csv_export(pool: gdb.ConnectionPool) -> Path:
+    return _cached(pool, "csv", _build_csv)
+
+
+def zip_export(pool: gdb.ConnectionPool) -> Path:
+    return _cached(pool, "zip", _build_zip)
+
+
+def serve(path: Path) -> str | None:
+    """URL para descargar `path` (de exports/) directo del disco, o None si pasa de MAX_SERVED.
+
+    static/ no pide la clave docente: cada archivo va en una carpeta con nombre
+    aleatorio y el enlace solo aparece en el Panel docente. Las carpetas de
+    exportaciones que ya se reemplazaron o borraron se eliminan aquí.
+    """
+    import media
+    if path.stat().st_size > MAX_SERVED:
+        return None
+    SERVE_DIR.mkdir(parents=True, exist_ok=True)
+    with _build_lock:
+        found = None
+        for folder in SERVE_DIR.iterdir():
+            names = [p.name for p in folder.iterdir()] if folder.is_dir() else []
+            if path.name in names:
+                found = folder
+            elif not any((EXPORT_DIR / n).exists() or (DELTA_DIR / n).exists() for n in names):
+                shutil.rmtree(folder, ignore_errors=True)
+        if found is None:
+            found = SERVE_DIR / secrets.token_urlsafe(16)
+            found.mkdir()
+            tmp = found / f"{path.name}.part"
+            try:
+                os.link(path, tmp)                    # sin duplicar bytes
+            except OSError:
+                shutil.copyfile(path, tmp)            # static/ en otro disco
+            os.replace(tmp, found / path.name)
+    return media.static_url(f"{SERVE_DIR.name}/{found.name}/{path.name}")
+
+
+# ---------- análisis en columnas (Parquet) ----------
+# El CSV obliga a re-parsear fechas, etiquetas y largos en cada análisis. Aquí
+# cada columna sale ya tipada: fechas como timestamp, semestre y grupo como
+# categorías, etiquetas como lista, largos de texto y conteos de media como
+# enteros y SPARK unido por gabinete. Se lee del cursor por lotes de
+# PARQUET_BATCH filas (un row group por lote): la memoria no crece con la tabla.
+PARQUET_BATCH = 5000
+SEMESTER_SQL = ("substr(e.created_at, 1, 4) || '-' || "
+                "CASE WHEN substr(e.created_at, 6, 2) <= '06' THEN 1 ELSE 2 END")
+ANALYTICS_SQL = f"""SELECT e.id, {SEMESTER_SQL}, e.created_at, e.updated_at, e.student_name, e.email, e.grp,
+    e.artifact_title,
+    (SELECT group_concat(tag, char(31)) FROM
+        (SELECT t.tag FROM entry_tags t WHERE t.entry_id = e.id ORDER BY t.pos)),
+    length(ifnull(e.artifact_desc, '')), length(ifnull(e.reflection_q1, '')),
+    length(ifnull(e.reflection_q2, '')), length(ifnull(e.reflection_q3, '')),
+    e.image_count, ifnull(e.audio_url, '') != '', ifnull(e.suno_link, '') != '',
+    {", ".join(f"s.{c}" for c in gdb.SPARK_CRITERIA)}
+    FROM entries e LEFT JOIN spark_scores s ON s.entry_id = e.id
+    ORDER BY e.created_at, e.id"""
+
+
+def analytics_schema() -> "pa.Schema":
+    import pyarrow as pa
+    category = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.int64()), ("semester", category),
+        ("created_at", pa.timestamp("us")), ("updated_at", pa.timestamp("us")),
+        ("student_name", pa.string()), ("email", pa.string()), ("group", category),
+        ("artifact_title", pa.string()), ("tags", pa.list_(pa.string())),
+        ("desc_chars", pa.int32()), ("reflection_q1_chars", pa.int32()),
+        ("reflection_q2_chars", pa.int32()), ("reflection_q3_chars", pa.int32()),
+        ("image_count", pa.int16()), ("has_audio", pa.bool_()), ("has_suno", pa.bool_()),
+        *((f"spark_{c}", pa.int8()) for c in gdb.SPARK_CRITERIA),   # NULL = sin calificar
+    ])
+
+
+def _timestamps(values: Iterable[str | None]) -> List[datetime | None]:
+    return [datetime.fromisoformat(v) if v else None for v in values]
+
+
+def write_parquet(con: sqlite3.Connection, writer: Any) -> int:
+    """Escribe los gabinetes de `con` en un pyarrow.parquet.ParquetWriter, por lotes. Devuelve cuántas filas."""
+    import pyarrow as pa
+    schema = writer.schema
+    cur = con.execute(ANALYTICS_SQL)
+    cur.row_factory = None
+    n = 0
+    while rows := cur.fetchmany(PARQUET_BATCH):
+        cols: List[Any] = list(zip(*rows))
+        cols[2], cols[3] = _timestamps(cols[2]), _timestamps(cols[3])
+        cols[8] = [tags.split("\x1f") if tags else [] for tags in cols[8]]
+        cols[14], cols[15] = [bool(v) for v in cols[14]], [bool(v) for v in cols[15]]
+        writer.write_batch(pa.record_batch(
+            [pa.array(col, type=field.type) for col, field in zip(cols, schema)], schema=schema))
+        n += len(rows)
+    return n
+
+
+def analytics_export(pools: Sequence[gdb.ConnectionPool]) -> Path:
+    """exports/analisis_<huella>.parquet con los gabinetes de `pools` (base activa y archivos).
+
+    Como _cached: se genera solo si alguna base cambió (gabinetes o SPARK) desde el último.
+    """
+    import pyarrow.parquet as pq
+    EXPORT_DIR.mkdir(parents=True, exist_ok=True)
+    with _build_lock, ExitStack() as stack:
+        cons = [stack.enter_context(pool.connection()) for pool in pools]
+        for con in cons:
+            con.execute("BEGIN")         # una instantánea por base para huella y filas
+        fp = hashlib.sha1("|".join(fingerprint(con, "spark") for con in cons).encode()).hexdigest()[:12]
+        out = EXPORT_DIR / f"analisis_{fp}.parquet"
+        if not out.exists():
+            tmp = out.with_suffix(".parquet.part")
+            with metrics.span("export.parquet"), \
+                    pq.ParquetWriter(tmp, analytics_schema(), compression="zstd") as writer:
+                for con in cons:
+                    write_parquet(con, writer)
+            os.replace(tmp, out)
+            metrics.count("export.bytes", out.stat().st_size, kind="parquet")
+            for old in EXPORT_DIR.glob("analisis_*.parquet"):
+                if old != out:
+                    old.unlink(missing_ok=True)
+        for con in cons:
+            con.rollback()
+    return out
+
+
+def analytics_frame(pools: Sequence[gdb.ConnectionPool], columns: List[str] | None = None) -> "pd.DataFrame":
+    """El Parquet de análisis como DataFrame (semestre y grupo como category)."""
+    import pandas as pd
+    return pd.read_parquet(analytics_export(pools), columns=columns)
+
+
+# ---------- respaldo incremental ----------
+DELTA_EXTRA = ("updated_at",)
+
+def _backed_up(con: sqlite3.Connection, path: str, since_rev: int) -> bool:
+    """¿Algún gabinete sin cambios desde since_rev (ya respaldado) usa el objeto de `path`?
+
+    La media anterior al almacén por contenido no está en media_objects: cuenta como nueva.
+    """
+    return con.execute(
+        """SELECT EXISTS (SELECT 1 FROM media_objects o
+                          JOIN media_refs r ON r.hash = o.hash
+                          JOIN entries e ON e.id = r.entry_id
+                          WHERE o.path = ? AND e.rev <= ?)""",
+        (path, since_rev),
+    ).fetchone()[0]
+
+
+def delta_export(pool: gdb.ConnectionPool, since_ts: str | None = None) -> Tuple[Path, int]:
+    """Genera el siguiente respaldo incremental y lo registra. Devuelve (zip, id del punto de control).
+
+    Sin since_ts: todo lo cambiado desde el último punto de control (o todo, si no hay).
+    Con since_ts (ISO): lo creado o editado desde esa fecha.
+    """
+    DELTA_DIR.mkdir(parents=True, exist_ok=True)
+    with _build_lock, pool.connection() as con:
+        con.execute("BEGIN")              # instantánea: upto_rev y filas coinciden
+        upto = gdb.generation(con, "entries")
+        if since_ts:
+            since_rev, where, args = None, "WHERE updated_at >= ?", [since_ts]
+        else:
+            last = gdb.last_checkpoint(con)
+            since_rev = last["upto_rev"] if last else -1
+            where, args = "WHERE rev > ?", [since_rev]
+        tmp = DELTA_DIR / f"delta_{datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')}.zip.part"
+        with ZipFile(tmp, "w", ZIP_DEFLATED) as zf:
+            with zf.open("gabinetes.csv", "w") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as fh:
+                rows = write_csv(con, fh, where, args, DELTA_EXTRA)
+            # media nueva: la que usan las filas del delta y ninguna fila ya respaldada
+            # (media_refs + índices: cuesta lo que el delta, no lo que la tabla)
+            sent, seen = set(), set()
+            for image_urls, audio_url in con.execute(f"SELECT image_urls, audio_url FROM entries {where}", args):
+                for u in gdb.media_paths(image_urls, audio_url):
+                    if u in seen:
+                        continue
+                    seen.add(u)
+                    if since_rev is not None and _backed_up(con, u, since_rev):
+                        continue
+                    if _add_media(zf, u):
+                        sent.add(u)
+            zf.writestr("manifest.json", json.dumps({
+                "created_at": datetime.utcnow().isoformat(), "since_rev": since_rev, "since_ts": since_ts,
+                "upto_rev": upto, "rows": rows, "media": len(sent),
+            }, indent=2))
+        con.rollback()
+    checkpoint = gdb.record_checkpoint(pool, since_rev=since_rev, since_ts=since_ts, upto_rev=upto,
+                                       rows=rows, media=len(sent), path="")
+    out = DELTA_DIR / f"delta_{checkpoint:04d}.zip"
+    os.replace(tmp, out)
+    with pool.transaction() as con:
+        con.execute("UPDATE export_checkpoints SET path = ? WHERE id = ?", (str(out.relative_to(DATA_DIR)), checkpoint))
+    return out, checkpoint
+
+
+# ---------- restaurar / fusionar deltas ----------
+def restore(db_path: Path, deltas: List[Path]) -> Tuple[int, int]:
+    """Aplica respaldos (completos o delta, en orden) sobre una base, nueva o existente.
+
+    Las filas se insertan o reemplazan por id; la media se extrae junto a la base
+    (sin pisar archivos ya presentes) y se registra en el almacén por contenido.
+    Devuelve (filas, archivos de media).
+    """
+    import media                          # solo para restaurar: registra/hashea la media
+    data_dir = db_path.parent
+    pool = gdb.open_pool(db_path)
+    rows = files = 0
+    prev_upto = None
+    for delta in deltas:
+        with ZipFile(delta) as zf:
+            manifest = json.loads(zf.read("manifest.json")) if "manifest.json" in zf.namelist() else {}
+            if prev_upto is not None and manifest.get("since_rev") not in (None, prev_upto):
+                print(f"  ! {delta.name}: empieza en rev {manifest.get('since_rev')}, el anterior terminó en {prev_upto}")
+            prev_upto = manifest.get("upto_rev", prev_upto)
+
+            for info in zf.infolist():
+                if not info.filename.startswith("media/") or info.is_dir():
+                    continue
+                rel = info.filename[len("media/"):]
+                dest = (data_dir / rel).resolve()
+                if not dest.is_relative_to(data_dir.resolve()):     # "media/../../x" o absoluta
+                    print(f"  ! {delta.name}: se omite {info.filename} (fuera de la carpeta de datos)")
+                    continue
+                rel = dest.relative_to(data_dir.resolve()).as_posix()
+                if not dest.exists():
+                    dest.parent.mkdir(parents=True, exist_ok=True)
+                    with zf.open(info) as src, open(dest, "wb") as out:
+                        while block := src.read(media.CHUNK):
+                            out.write(block)
+                    files += 1
+                with open(dest, "rb") as fh:
+                    digest = media.hash_file(fh)
+                kind = "audio" if dest.suffix.lower() in {".mp3", ".wav", ".m4a", ".aac", ".ogg", ".opus"} else "image"
+                gdb.register_media(pool, digest, rel, kind, dest.stat().st_size)
+
+            with zf.open("gabinetes.csv") as raw, io.TextIOWrapper(raw, encoding="utf-8", newline="") as fh:
+                with pool.transaction() as con:
+                    for r in csv.DictReader(fh):
+                        con.execute(
+                            """INSERT INTO entries
+                               (id, created_at, updated_at, student_name, email, grp, artifact_title, artifact_desc,
+                                tags, reflection_q1, reflection_q2, reflection_q3, image_urls, audio_url, suno_link,
+                                image_count)
+                               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                               ON CONFLICT(id) DO UPDATE SET
+                                 created_at = excluded.created_at, student_name = excluded.student_name,
+                                 email = excluded.email, grp = excluded.grp,
+                                 artifact_title = excluded.artifact_title, artifact_desc = excluded.artifact_desc,
+                                 tags = excluded.tags, reflection_q1 = excluded.reflection_q1,
+                                 reflection_q2 = excluded.reflection_q2, reflection_q3 = excluded.reflection_q3,
+                                 image_urls = excluded.image_urls, audio_url = excluded.audio_url,
+                                 suno_link = excluded.suno_link, image_count = excluded.image_count""",
+                            (int(r["id"]), r["created_at"], r.get("updated_at") or r["created_at"],
+                             r["student_name"], r["email"], r["group"], r["artifact_title"], r["artifact_desc"],
+                             r["tags"], r["reflection_q1"], r["reflection_q2"], r["reflection_q3"],
+                             r["image_urls"], r["audio_url"], r["suno_link"], gdb.image_count(r["image_urls"])),
+                        )
+                        entry_id = int(r["id"])
+                        gdb.set_entry_tags(con, entry_id, r["tags"])
+                        gdb.link_media(con, entry_id, gdb.media_paths(r["image_urls"], r["audio_url"]))
+                        rows += 1
+        print(f"{delta.name}: aplicado")
+    pool.close()
+    return rows, files
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Respaldos del Gabinete")
+    sub = ap.add_subparsers(dest="command", required=True)
+    d = sub.add_parser("delta", help="genera el siguiente respaldo incremental")
+    d.add_argument("--since-ts", help="fecha ISO (UTC); por defecto, desde el último respaldo")
+    r = sub.add_parser("restore", help="aplica respaldos en orden sobre una base")
+    r.add_argument("deltas", nargs="+", type=Path)
+    r.add_argument("--db", type=Path, default=gdb.DB_PATH)
+    a = ap.parse_args()
+    if a.command == "delta":
+        out, checkpoint = delta_export(gdb.open_pool(), a.since_ts)
+        print(f"Respaldo #{checkpoint}: {out}")
+    else:
+        rows, files = restore(a.db, a.deltas)
+        print(f"Listo: {rows} gabinete(s), {files} archivo(s) de media. "
+              "Para miniaturas: python media.py backfill")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1140 @@
+# ===========================================
+# Gabinete Personal — gabinete_db.py (acceso a datos compartido)
+# ===========================================
+# Un único pool de conexiones sqlite3 (WAL + pragmas afinados) para app.py,
+# la página de Evaluación SPARK y app_eval.py. El esquema se crea/migra una
+# sola vez por proceso (get_pool está cacheado con st.cache_resource).
+from __future__ import annotations
+import functools, json, os, re, sqlite3, threading, time, unicodedata, uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import streamlit as st
+
+import metrics
+
+BASE_DIR = Path(__file__).parent
+# GABINETE_DATA_DIR: otra carpeta de datos (base + media), p. ej. para bench/bench_suite.py
+DATA_DIR = Path(os.getenv("GABINETE_DATA_DIR", BASE_DIR / "data"))
+DB_PATH  = DATA_DIR / "gabinete.db"
+
+# journal_mode=WAL: lectores y un escritor no se bloquean entre sí.
+# synchronous=NORMAL: seguro con WAL, evita un fsync por commit.
+PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,          # ms esperando el lock antes de "database is locked"
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -20000,          # ~20 MB de caché de páginas por conexión
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+}
+
+POOL_SIZE = 8
+QUERY_CACHE_SIZE = 256   # resultados de lectura guardados (LRU), compartidos por todas las sesiones
+
+
+class PoolTimeout(RuntimeError):
+    """No se liberó ninguna conexión del pool a tiempo."""
+
+
+# ---------- pool ----------
+@functools.lru_cache(maxsize=1024)
+def _sql_text(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+class TimedConnection(sqlite3.Connection):
+    """Conexión que anota cuánto tarda cada sentencia en metrics (db.query y la lista de lentas).
+
+    Mide execute() hasta la primera fila; lo que se lee después con fetch* queda fuera.
+    """
+
+    def execute(self, sql, *args):
+        t = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            metrics.METRICS.observe_sql(_sql_text(sql), time.perf_counter() - t)
+
+    def executemany(self, sql, *args):
+        t = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            metrics.METRICS.observe_sql(_sql_text(sql), time.perf_counter() - t)
+
+
+class ConnectionPool:
+    """Pool de conexiones sqlite3 seguro entre hilos (cada sesión de Streamlit corre en su hilo)."""
+
+    def __init__(self, path: Union[str, Path], size: int = POOL_SIZE,
+                 pragmas: Dict[str, Any] | None = None, acquire_timeout: float = 30.0):
+        self.path = str(path)
+        self.size = size
+        self.pragmas = {**PRAGMAS, **(pragmas or {})}
+        self.acquire_timeout = acquire_timeout
+        self._lock = threading.Lock()
+        self._idle: List[sqlite3.Connection] = []
+        self._opened = 0
+        # Espera FIFO: al devolver una conexión se entrega directo al primero en la
+        # fila, así los lectores de la galería no dejan sin turno a quien publica.
+        self._waiters: Deque[Tuple[threading.Event, List[sqlite3.Connection]]] = deque()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(
+            self.path,
+            timeout=self.pragmas["busy_timeout"] / 1000,
+            check_same_thread=False,   # la conexión viaja entre hilos, pero nunca se usa en dos a la vez
+            factory=TimedConnection,
+        )
+        con.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            con.execute(f"PRAGMA {name}={value}")
+        return con
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            if self._opened < self.size:
+                self._opened += 1
+                waiter = None
+            else:
+                waiter = (threading.Event(), [])
+                self._waiters.append(waiter)
+        if waiter is None:
+            try:
+                return self._connect()
+            except BaseException:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        ready, box = waiter
+        if not ready.wait(self.acquire_timeout):
+            with self._lock:
+                if not box:
+                    self._waiters.remove(waiter)
+                    raise PoolTimeout(f"Sin conexiones libres tras {self.acquire_timeout}s ({self.path})")
+        return box[0]
+
+    def _release(self, con: sqlite3.Connection) -> None:
+        if con.in_transaction:
+            con.rollback()
+        with self._lock:
+            if self._waiters:
+                ready, box = self._waiters.popleft()
+                box.append(con)
+                ready.set()
+            else:
+                self._idle.append(con)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Presta una conexión del pool; se devuelve (sin transacción abierta) al salir."""
+        con = self._acquire()
+        try:
+            yield con
+        finally:
+            self._release(con)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transacción de escritura: BEGIN IMMEDIATE toma el lock al inicio (sin deadlocks de upgrade)."""
+        with self.connection() as con:
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                yield con
+            except BaseException:
+                con.rollback()
+                raise
+            con.commit()
+
+    def close(self) -> None:
+        """Cierra las conexiones ociosas (las prestadas se cierran al devolverse al GC)."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for con in idle:
+            con.close()
+
+
+# ---------- caché de consultas ----------
+# Cada rerun de Streamlit repite las mismas lecturas (galería, panel) para cada
+# visitante. Los resultados se guardan por (consulta, parámetros) junto con los
+# contadores de la tabla counters: mientras ningún trigger/escritura los suba,
+# se devuelve lo guardado. Si varias sesiones piden lo mismo a la vez, solo una
+# consulta SQLite y las demás esperan su resultado.
+class Record(tuple):
+    """Fila inmutable y compacta: una tupla con el índice de columnas compartido (r["col"] o r[0])."""
+    __slots__ = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def keys(self) -> List[str]:
+        return list(self._index)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self[key] if key in self._index else default
+
+
+@functools.lru_cache(maxsize=None)
+def _record_type(columns: Tuple[str, ...]) -> type:
+    return type("Record", (Record,), {"__slots__": (), "_index": {c: i for i, c in enumerate(columns)}})
+
+
+def freeze(value: Any) -> Any:
+    """Copia de solo lectura de un resultado (lo comparten todas las sesiones)."""
+    if isinstance(value, sqlite3.Row):
+        return _record_type(tuple(value.keys()))(value)
+    if isinstance(value, tuple) and hasattr(value, "_fields"):
+        return value                    # NamedTuple (p. ej. Card): ya es inmutable
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    return value
+
+
+def generations(con: sqlite3.Connection) -> Tuple[int, ...]:
+    return tuple(v for (v,) in con.execute("SELECT value FROM counters ORDER BY name"))
+
+
+def bump_generation(con: sqlite3.Connection, name: str) -> None:
+    """Sube el contador `name` (escrituras que no pasan por los triggers de entries, p. ej. evaluaciones SPARK)."""
+    con.execute(
+        "INSERT INTO counters(name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+
+class QueryCache:
+    """LRU de resultados por clave, válido mientras no cambien los contadores de la base."""
+
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Any, Tuple[Tuple[int, ...], Any]] = OrderedDict()
+        self._loading: Dict[Any, Future] = {}
+        self.hits = self.misses = 0
+
+    def get(self, pool: ConnectionPool, key: Any, load: Callable[[], Any]) -> Any:
+        with pool.connection() as con:
+            gen = generations(con)
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[0] == gen:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+            pending = self._loading.get((key, gen))
+            owner = pending is None
+            if owner:
+                pending = self._loading[(key, gen)] = Future()
+        if not owner:
+            return pending.result()
+        try:
+            value = freeze(load())
+        except BaseException as ex:
+            with self._lock:
+                del self._loading[(key, gen)]
+            pending.set_exception(ex)
+            raise
+        with self._lock:
+            del self._loading[(key, gen)]
+            self._data[key] = (gen, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        pending.set_result(value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+QUERY_CACHE = QueryCache()
+
+
+def _key(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return tuple(_key(v) for v in value)
+    return value
+
+
+def cached_query(fn: Callable) -> Callable:
+    """Lectura `fn(pool, ...)` servida desde QUERY_CACHE; `fn.uncached` va directo a SQLite."""
+    @functools.wraps(fn)
+    def wrapper(pool: ConnectionPool, *args, **kwargs):
+        key = (fn.__name__, pool.path, _key(args), tuple(sorted((k, _key(v)) for k, v in kwargs.items())))
+        return QUERY_CACHE.get(pool, key, lambda: fn(pool, *args, **kwargs))
+    wrapper.uncached = fn
+    return wrapper
+
+
+# ---------- etiquetas ----------
+def parse_tags(s: str) -> list[str]:
+    return [t.strip() for t in (s or "").split(",") if t.strip()]
+
+def normalize_tag(tag: str) -> str:
+    """Clave de comparación de una etiqueta: sin mayúsculas, acentos ni espacios repetidos."""
+    folded = unicodedata.normalize("NFKD", tag.casefold())
+    return " ".join("".join(c for c in folded if not unicodedata.combining(c)).split())
+
+def set_entry_tags(con: sqlite3.Connection, entry_id: int, tags: str) -> None:
+    """Reescribe las filas de entry_tags de un gabinete (dentro de la transacción del llamador)."""
+    con.execute("DELETE FROM entry_tags WHERE entry_id = ?", (entry_id,))
+    seen: Dict[str, str] = {}
+    for tag in parse_tags(tags):
+        seen.setdefault(normalize_tag(tag), tag)
+    con.executemany(
+        "INSERT INTO entry_tags(entry_id, tag_norm, tag, pos) VALUES (?, ?, ?, ?)",
+        [(entry_id, norm, tag, pos) for pos, (norm, tag) in enumerate(seen.items()) if norm],
+    )
+
+def set_entry_images(con: sqlite3.Connection, entry_id: int, images: List[Any]) -> None:
+    """Registra las versiones de las imágenes (media.Rendition) de un gabinete, en orden."""
+    con.execute("DELETE FROM entry_images WHERE entry_id = ?", (entry_id,))
+    bump_generation(con, "media")
+    con.executemany(
+        "INSERT INTO entry_images(entry_id, pos, original, display, thumb, width, height) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(entry_id, pos, *img) for pos, img in enumerate(images)],
+    )
+
+def image_count(image_urls: str) -> int:
+    return len([u for u in (image_urls or "").split("||") if u])
+
+def media_paths(image_urls: str, audio_url: str) -> List[str]:
+    return [u for u in (image_urls or "").split("||") if u] + ([audio_url] if audio_url else [])
+
+def link_media(con: sqlite3.Connection, entry_id: int, paths: List[str]) -> None:
+    """Reescribe las referencias del gabinete a objetos del almacén (las rutas antiguas no cuentan)."""
+    con.execute("DELETE FROM media_refs WHERE entry_id = ?", (entry_id,))
+    if paths:
+        marks = ",".join("?" * len(paths))
+        con.execute(
+            f"INSERT OR IGNORE INTO media_refs(entry_id, hash) SELECT ?, hash FROM media_objects WHERE path IN ({marks})",
+            [entry_id, *paths],
+        )
+
+def _backfill_entry_tags(con: sqlite3.Connection) -> None:
+    for entry_id, tags in con.execute("SELECT id, tags FROM entries").fetchall():
+        set_entry_tags(con, entry_id, tags)
+
+
+# ---------- esquema / migraciones ----------
+# Cada paso es SQL (str) o una función que recibe la conexión. El índice+1 del
+# paso es su versión, guardada en PRAGMA user_version. Solo se agregan pasos al final.
+Migration = Union[str, Callable[[sqlite3.Connection], None]]
+
+MIGRATIONS: List[Migration] = [
+    # 1 — esquema original de app.py
+    """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        student_name TEXT NOT NULL,
+        email TEXT NOT NULL,
+        grp TEXT NOT NULL,
+        artifact_title TEXT NOT NULL,
+        artifact_desc TEXT NOT NULL,
+        tags TEXT DEFAULT '',
+        reflection_q1 TEXT DEFAULT '',
+        reflection_q2 TEXT DEFAULT '',
+        reflection_q3 TEXT DEFAULT '',
+        image_urls TEXT DEFAULT '',
+        audio_url TEXT DEFAULT '',
+        suno_link TEXT DEFAULT ''
+    );
+    """,
+    # 2 — índices para ordenar/paginar la galería sin datetime() (que impide usar índices)
+    """
+    CREATE INDEX IF NOT EXISTS idx_entries_created ON entries(created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS idx_entries_grp_created ON entries(grp, created_at DESC, id DESC);
+    """,
+    # 3 — índice de texto completo para "Buscar" (sin acentos: reflexión = reflexion)
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+        student_name, email, grp, artifact_title, artifact_desc, tags,
+        reflection_q1, reflection_q2, reflection_q3,
+        content='entries', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS entries_fts_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts(rowid, student_name, email, grp, artifact_title, artifact_desc, tags,
+                                reflection_q1, reflection_q2, reflection_q3)
+        VALUES (new.id, new.student_name, new.email, new.grp, new.artifact_title, new.artifact_desc, new.tags,
+                new.reflection_q1, new.reflection_q2, new.reflection_q3);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, student_name, email, grp, artifact_title, artifact_desc, tags,
+                                reflection_q1, reflection_q2, reflection_q3)
+        VALUES ('delete', old.id, old.student_name, old.email, old.grp, old.artifact_title, old.artifact_desc, old.tags,
+                old.reflection_q1, old.reflection_q2, old.reflection_q3);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_fts_au AFTER UPDATE OF student_name, email, grp, artifact_title,
+        artifact_desc, tags, reflection_q1, reflection_q2, reflection_q3 ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, student_name, email, grp, artifact_title, artifact_desc, tags,
+                                reflection_q1, reflection_q2, reflection_q3)
+        VALUES ('delete', old.id, old.student_name, old.email, old.grp, old.artifact_title, old.artifact_desc, old.tags,
+                old.reflection_q1, old.reflection_q2, old.reflection_q3);
+        INSERT INTO entries_fts(rowid, student_name, email, grp, artifact_title, artifact_desc, tags,
+                                reflection_q1, reflection_q2, reflection_q3)
+        VALUES (new.id, new.student_name, new.email, new.grp, new.artifact_title, new.artifact_desc, new.tags,
+                new.reflection_q1, new.reflection_q2, new.reflection_q3);
+    END;
+    -- backfill de las bases existentes
+    INSERT INTO entries_fts(entries_fts) VALUES ('rebuild');
+    """,
+    # 4 — etiquetas normalizadas (una fila por gabinete y etiqueta)
+    """
+    CREATE TABLE IF NOT EXISTS entry_tags (
+        entry_id INTEGER NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+        tag_norm TEXT NOT NULL,      -- clave normalizada (normalize_tag)
+        tag TEXT NOT NULL,           -- como la escribió el/la estudiante
+        pos INTEGER NOT NULL,        -- orden original para pintar las insignias
+        PRIMARY KEY (entry_id, tag_norm)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_entry_tags_norm ON entry_tags(tag_norm, entry_id);
+    """,
+    # 5 — relleno de entry_tags para los gabinetes existentes
+    _backfill_entry_tags,
+    # 6 — versiones (original / display / thumb) de cada imagen de un gabinete
+    """
+    CREATE TABLE IF NOT EXISTS entry_images (
+        entry_id INTEGER NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+        pos INTEGER NOT NULL,
+        original TEXT NOT NULL,
+        display TEXT NOT NULL,
+        thumb TEXT NOT NULL,
+        width INTEGER NOT NULL,
+        height INTEGER NOT NULL,
+        PRIMARY KEY (entry_id, pos)
+    ) WITHOUT ROWID;
+    """,
+    # 7 — almacén de media por contenido (sha256) y sus referencias desde gabinetes
+    """
+    CREATE TABLE IF NOT EXISTS media_objects (
+        hash TEXT PRIMARY KEY,       -- sha256 de los bytes subidos
+        path TEXT NOT NULL UNIQUE,   -- relativo a DATA_DIR
+        kind TEXT NOT NULL,          -- 'image' | 'audio'
+        size INTEGER NOT NULL,
+        last_seen TEXT NOT NULL      -- última vez que se subió/reutilizó (periodo de gracia del GC)
+    );
+    CREATE TABLE IF NOT EXISTS media_refs (
+        entry_id INTEGER NOT NULL REFERENCES entries(id) ON DELETE CASCADE,
+        hash TEXT NOT NULL REFERENCES media_objects(hash),
+        PRIMARY KEY (entry_id, hash)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_media_refs_hash ON media_refs(hash);
+    """,
+    # 8 — contador de cambios de entries (huella para cachés y exportaciones)
+    """
+    CREATE TABLE IF NOT EXISTS counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    ) WITHOUT ROWID;
+    INSERT OR IGNORE INTO counters(name, value) VALUES ('entries', 0);
+    CREATE TRIGGER IF NOT EXISTS entries_gen_ai AFTER INSERT ON entries BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'entries';
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_gen_au AFTER UPDATE ON entries BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'entries';
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_gen_ad AFTER DELETE ON entries BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'entries';
+    END;
+    """,
+    # 9 — rev/updated_at por gabinete (respaldos incrementales) y puntos de control de exportación.
+    # rev toma el valor del contador dentro de la transacción de escritura (BEGIN IMMEDIATE),
+    # así que crece en orden de commit: "rev > último respaldo" no pierde filas.
+    """
+    DROP TRIGGER IF EXISTS entries_gen_ai;
+    DROP TRIGGER IF EXISTS entries_gen_au;
+    ALTER TABLE entries ADD COLUMN updated_at TEXT;
+    ALTER TABLE entries ADD COLUMN rev INTEGER NOT NULL DEFAULT 0;
+    UPDATE entries SET updated_at = created_at, rev = (SELECT value FROM counters WHERE name = 'entries');
+    CREATE INDEX IF NOT EXISTS idx_entries_rev ON entries(rev);
+    CREATE TRIGGER entries_gen_ai AFTER INSERT ON entries BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'entries';
+        UPDATE entries SET rev = (SELECT value FROM counters WHERE name = 'entries'),
+                           updated_at = ifnull(new.updated_at, new.created_at)
+        WHERE id = new.id;
+    END;
+    -- WHEN: el UPDATE interno de los triggers cambia rev y no debe contarse dos veces
+    CREATE TRIGGER entries_gen_au AFTER UPDATE ON entries WHEN new.rev = old.rev BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'entries';
+        UPDATE entries SET rev = (SELECT value FROM counters WHERE name = 'entries'),
+                           updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+        WHERE id = new.id;
+    END;
+    CREATE TABLE IF NOT EXISTS export_checkpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        created_at TEXT NOT NULL,
+        since_rev INTEGER,           -- respaldo "desde el anterior" (NULL si fue por fecha)
+        since_ts TEXT,               -- respaldo "desde fecha" (NULL si fue por rev)
+        upto_rev INTEGER NOT NULL,   -- contador de entries en la instantánea exportada
+        rows INTEGER NOT NULL,
+        media INTEGER NOT NULL,
+        path TEXT NOT NULL           -- relativo a DATA_DIR
+    );
+    """,
+    # 10 — image_count por gabinete (métricas del Panel docente en SQL). El relleno no es una
+    # edición: se suspende entries_gen_au para no cambiar rev ni updated_at de cada fila.
+    """
+    ALTER TABLE entries ADD COLUMN image_count INTEGER NOT NULL DEFAULT 0;
+    DROP TRIGGER IF EXISTS entries_gen_au;
+    UPDATE entries SET image_count =
+        CASE WHEN ifnull(image_urls, '') = '' THEN 0
+             ELSE (length(image_urls) - length(replace(image_urls, '||', ''))) / 2 + 1 END;
+    CREATE TRIGGER entries_gen_au AFTER UPDATE ON entries WHEN new.rev = old.rev BEGIN
+        UPDATE counters SET value = value + 1 WHERE name = 'entries';
+        UPDATE entries SET rev = (SELECT value FROM counters WHERE name = 'entries'),
+                           updated_at = strftime('%Y-%m-%dT%H:%M:%f', 'now')
+        WHERE id = new.id;
+    END;
+    """,
+    # 11 — versión de streaming de cada audio (servida por static/, con Range) + duración y forma de onda
+    """
+    CREATE TABLE IF NOT EXISTS audio_streams (
+        hash TEXT PRIMARY KEY REFERENCES media_objects(hash) ON DELETE CASCADE,
+        stream TEXT NOT NULL,        -- relativo a static/
+        mime TEXT NOT NULL,
+        duration REAL,               -- segundos (NULL si no se pudo leer)
+        peaks BLOB                   -- picos 0–255 para la vista previa
+    ) WITHOUT ROWID;
+    """,
+    # 12 — id del envío (cola de escritura): reintentar tras un reinicio no duplica gabinetes
+    """
+    ALTER TABLE entries ADD COLUMN submission_id TEXT;
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_entries_submission ON entries(submission_id);
+    """,
+    # 13 — borradores de las Fases 1–4 y del formulario, por alumno (token en la URL)
+    """
+    CREATE TABLE IF NOT EXISTS drafts (
+        token TEXT PRIMARY KEY,
+        email TEXT NOT NULL UNIQUE,          -- normalizado (minúsculas, sin espacios)
+        data TEXT NOT NULL DEFAULT '{}',     -- campos del borrador (JSON)
+        images TEXT NOT NULL DEFAULT '{}',   -- {"fase1": [rendition, …], …} ya guardadas en el almacén
+        updated_at TEXT NOT NULL,
+        published_id INTEGER REFERENCES entries(id) ON DELETE SET NULL
+    ) WITHOUT ROWID;
+    -- media de borradores: el GC no la borra aunque ningún gabinete la use todavía
+    CREATE TABLE IF NOT EXISTS draft_media (
+        token TEXT NOT NULL REFERENCES drafts(token) ON DELETE CASCADE,
+        hash TEXT NOT NULL REFERENCES media_objects(hash),
+        PRIMARY KEY (token, hash)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_draft_media_hash ON draft_media(hash);
+    """,
+    # 14 — términos (bolsa de palabras con hashing) por gabinete para el motor Rizoma
+    """
+    CREATE TABLE IF NOT EXISTS entry_terms (
+        entry_id INTEGER PRIMARY KEY REFERENCES entries(id) ON DELETE CASCADE,
+        rev INTEGER NOT NULL,        -- rev de entries con que se calculó
+        feats BLOB NOT NULL,         -- uint32: hash de cada término
+        counts BLOB NOT NULL         -- float32: frecuencia ponderada por campo
+    );
+    """,
+    # 15 — evaluación SPARK: una fila por gabinete, un criterio por columna (0–4, NULL = sin calificar).
+    # version sube con cada guardado: concurrencia optimista entre docentes (ver save_spark_scores)
+    """
+    CREATE TABLE IF NOT EXISTS spark_scores (
+        entry_id INTEGER PRIMARY KEY REFERENCES entries(id) ON DELETE CASCADE,
+        s INTEGER CHECK (s BETWEEN 0 AND 4),
+        p INTEGER CHECK (p BETWEEN 0 AND 4),
+        a INTEGER CHECK (a BETWEEN 0 AND 4),
+        r INTEGER CHECK (r BETWEEN 0 AND 4),
+        k INTEGER CHECK (k BETWEEN 0 AND 4),
+        version INTEGER NOT NULL DEFAULT 1,
+        updated_at TEXT NOT NULL
+    );
+    INSERT OR IGNORE INTO counters(name, value) VALUES ('spark', 0);
+    """,
+]
+
+
+def _statements(script: str) -> Iterator[str]:
+    """Parte un script SQL en sentencias completas (respeta los ; dentro de triggers)."""
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            if buf.strip():
+                yield buf
+            buf = ""
+    if buf.strip():
+        yield buf
+
+
+def migrate(con: sqlite3.Connection) -> int:
+    """Aplica los pasos pendientes en una sola transacción y devuelve la versión final."""
+    con.execute("BEGIN IMMEDIATE")
+    try:
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        for target, step in enumerate(MIGRATIONS[version:], start=version + 1):
+            if callable(step):
+                step(con)
+            else:
+                for stmt in _statements(step):
+                    con.execute(stmt)
+            con.execute(f"PRAGMA user_version={target}")
+            version = target
+    except BaseException:
+        con.rollback()
+        raise
+    con.commit()
+    return version
+
+
+def open_pool(path: Union[str, Path] = DB_PATH, size: int = POOL_SIZE,
+              pragmas: Dict[str, Any] | None = None) -> ConnectionPool:
+    """Crea el pool y deja el esquema al día. Útil también fuera de Streamlit (benchmarks, scripts)."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    pool = ConnectionPool(path, size=size, pragmas=pragmas)
+    with pool.connection() as con:
+        migrate(con)
+    return pool
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool(db_path: str = str(DB_PATH)) -> ConnectionPool:
+    """Pool compartido por todas las sesiones y páginas del proceso."""
+    return open_pool(db_path)
+
+
+# ---------- consultas ----------
+def _insert_entry(con: sqlite3.Connection, row: Dict[str, Any]) -> int:
+    """INSERT de un gabinete con sus etiquetas/imágenes/media, dentro de la transacción del llamador.
+
+    Con `submission_id` (cola de escritura) el INSERT es idempotente: reenviar el mismo
+    envío devuelve el id ya creado.
+    """
+    sid = row.get("submission_id")
+    if sid:
+        found = con.execute("SELECT id FROM entries WHERE submission_id = ?", (sid,)).fetchone()
+        if found:
+            return found[0]
+    cur = con.execute(
+        """INSERT INTO entries
+        (created_at, student_name, email, grp, artifact_title, artifact_desc, tags,
+         reflection_q1, reflection_q2, reflection_q3, image_urls, audio_url, suno_link, image_count, submission_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (
+            row.get("created_at") or datetime.utcnow().isoformat(),
+            row["student_name"], row["email"], row["group"],
+            row["artifact_title"], row["artifact_desc"], row.get("tags",""),
+            row.get("reflection_q1",""), row.get("reflection_q2",""), row.get("reflection_q3",""),
+            row.get("image_urls",""), row.get("audio_url",""), row.get("suno_link",""),
+            image_count(row.get("image_urls","")), sid,
+        ),
+    )
+    set_entry_tags(con, cur.lastrowid, row.get("tags",""))
+    set_entry_images(con, cur.lastrowid, row.get("images", []))
+    link_media(con, cur.lastrowid, media_paths(row.get("image_urls",""), row.get("audio_url","")))
+    return cur.lastrowid
+
+
+def insert_entry(pool: ConnectionPool, row: Dict[str, Any]) -> int:
+    with pool.transaction() as con:
+        return _insert_entry(con, row)
+
+
+def insert_entries(pool: ConnectionPool, rows: List[Dict[str, Any]]) -> List[int | BaseException]:
+    """Varios gabinetes en una sola transacción (cola de escritura).
+
+    Cada fila va en su SAVEPOINT: si una falla se deshace solo esa y en su lugar
+    se devuelve la excepción; las demás se confirman juntas.
+    """
+    out: List[int | BaseException] = []
+    with pool.transaction() as con:
+        for row in rows:
+            con.execute("SAVEPOINT entry")
+            try:
+                out.append(_insert_entry(con, row))
+            except Exception as ex:
+                con.execute("ROLLBACK TO entry")
+                out.append(ex)
+            con.execute("RELEASE entry")
+    return out
+
+
+def generation(con: sqlite3.Connection, name: str) -> int:
+    """Valor del contador `name` (sube con cada INSERT/UPDATE/DELETE vigilado por triggers)."""
+    row = con.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+@cached_query
+def fetch_entries(pool: ConnectionPool) -> List[sqlite3.Row]:
+    with pool.connection() as con:
+        return con.execute(
+            "SELECT * FROM entries ORDER BY created_at DESC, id DESC"
+        ).fetchall()
+
+
+# ---------- galería: filtros en SQL + paginación keyset ----------
+PAGE_SIZE = 24
+# Cursor = clave de orden de la última tarjeta de la página:
+# (created_at, id) al navegar, (score bm25, id) al buscar.
+Cursor = Tuple[Any, int]
+
+# pesos bm25 por columna de entries_fts (el título y las etiquetas pesan más)
+FTS_WEIGHTS = (3.0, 1.0, 0.5, 10.0, 4.0, 6.0, 2.0, 2.0, 2.0)
+SNIPPET = "snippet(entries_fts, -1, '<mark>', '</mark>', '…', 12)"
+
+
+def fts_query(text: str) -> str:
+    """Convierte lo que escribe el visitante en una consulta FTS5 segura: todas las palabras, por prefijo."""
+    return " ".join(f'"{tok}"*' for tok in re.findall(r"\w+", text))
+
+
+def _gallery_where(group: str | None, tag: str) -> Tuple[List[str], List[Any]]:
+    clauses: List[str] = []
+    args: List[Any] = []
+    if group:
+        clauses.append("e.grp = ?")
+        args.append(group)
+    if tag:
+        clauses.append("e.id IN (SELECT entry_id FROM entry_tags WHERE tag_norm = ?)")
+        args.append(normalize_tag(tag))
+    return clauses, args
+
+
+def _gallery_source(group: str | None, search: str, tag: str, columns: str = "e.id") -> Tuple[str, List[Any], bool]:
+    """FROM/WHERE común a la página y al conteo. El bool indica si hay búsqueda de texto."""
+    clauses, args = _gallery_where(group, tag)
+    query = fts_query(search)
+    if query:
+        weights = ", ".join(map(str, FTS_WEIGHTS))
+        sql = (f"SELECT {columns}, bm25(entries_fts, {weights}) AS score, {SNIPPET} AS snippet "
+               "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid")
+        clauses.insert(0, "entries_fts MATCH ?")
+        args.insert(0, query)
+    else:
+        sql = f"SELECT {columns}, NULL AS score, NULL AS snippet FROM entries e"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    return sql, args, bool(query)
+
+
+class Card(NamedTuple):
+    """Lo que pinta una tarjeta de la galería. Los textos largos (descripción completa y
+    reflexiones) no vienen aquí: se piden con entry_detail al abrir la tarjeta."""
+    id: int
+    created_at: str
+    title: str
+    author: str
+    grp: str
+    blurb: str                   # inicio de artifact_desc (BLURB_CHARS)
+    thumb: str                   # miniatura, o la primera imagen si aún no hay versiones
+    tags: Tuple[str, ...]
+    image_count: int
+    audio_url: str
+    suno_link: str
+    score: Optional[float]       # bm25, solo al buscar
+    snippet: Optional[str]       # coincidencia resaltada, solo al buscar
+
+    @property
+    def has_audio(self) -> bool:
+        return bool(self.audio_url or self.suno_link)
+
+
+BLURB_CHARS = 280
+CARD_COLUMNS = f"""e.id, e.created_at, e.artifact_title, e.student_name, e.grp,
+    substr(ifnull(e.artifact_desc, ''), 1, {BLURB_CHARS}) AS blurb,
+    ifnull((SELECT i.thumb FROM entry_images i WHERE i.entry_id = e.id AND i.pos = 0),
+           substr(e.image_urls, 1, instr(e.image_urls || '||', '||') - 1)) AS thumb,
+    (SELECT group_concat(tag, char(31)) FROM
+        (SELECT t.tag FROM entry_tags t WHERE t.entry_id = e.id ORDER BY t.pos)) AS tags,
+    e.image_count, ifnull(e.audio_url, '') AS audio_url, ifnull(e.suno_link, '') AS suno_link"""
+
+
+def _card(row: tuple) -> Card:
+    *head, tags, image_count, audio_url, suno_link, score, snippet = row
+    return Card(*head, tuple(tags.split("\x1f")) if tags else (), image_count, audio_url, suno_link, score, snippet)
+
+
+@cached_query
+def fetch_page(pool: ConnectionPool, *, group: str | None = None, search: str = "", tag: str = "",
+               after: Cursor | None = None, limit: int = PAGE_SIZE) -> Tuple[List[Card], Cursor | None]:
+    """Una página de la galería (tarjetas livianas) y el cursor de la siguiente (None si no hay).
+
+    Sin búsqueda: más recientes primero. Con búsqueda: por relevancia (bm25), con
+    `snippet` que resalta la coincidencia.
+    """
+    sql, args, ranked = _gallery_source(group, search, tag, CARD_COLUMNS)
+    key = ("score", "id") if ranked else ("created_at", "id")
+    order = "ORDER BY score, id" if ranked else "ORDER BY created_at DESC, id DESC"
+    sql = f"SELECT * FROM ({sql})"
+    if after is not None:
+        sql += f" WHERE ({key[0]}, {key[1]}) {'>' if ranked else '<'} (?, ?)"
+        args += list(after)
+    with pool.connection() as con:
+        cur = con.execute(f"{sql} {order} LIMIT ?", args + [limit + 1])
+        cur.row_factory = None          # tuplas simples: se convierten a Card
+        rows = [_card(r) for r in cur]
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, ((last.score if ranked else last.created_at), last.id)
+    return rows, None
+
+
+@cached_query
+def cards_for(pool: ConnectionPool, entry_ids: List[int]) -> List[Card]:
+    """Tarjetas de gabinetes concretos, en el orden pedido (los que ya no existen se omiten)."""
+    if not entry_ids:
+        return []
+    marks = ",".join("?" * len(entry_ids))
+    with pool.connection() as con:
+        cur = con.execute(
+            f"SELECT {CARD_COLUMNS}, NULL AS score, NULL AS snippet FROM entries e WHERE e.id IN ({marks})",
+            list(entry_ids),
+        )
+        cur.row_factory = None
+        found = {c.id: c for c in map(_card, cur)}
+    return [found[i] for i in entry_ids if i in found]
+
+
+@cached_query
+def entry_detail(pool: ConnectionPool, entry_id: int) -> sqlite3.Row | None:
+    """Lo que la tarjeta no trae (descripción completa, reflexiones, todas las imágenes), al abrirla."""
+    with pool.connection() as con:
+        return con.execute(
+            """SELECT artifact_desc, reflection_q1, reflection_q2, reflection_q3, image_urls
+               FROM entries WHERE id = ?""",
+            (entry_id,),
+        ).fetchone()
+
+
+@cached_query
+def count_entries(pool: ConnectionPool, *, group: str | None = None, search: str = "", tag: str = "") -> int:
+    sql, args, _ = _gallery_source(group, search, tag)
+    with pool.connection() as con:
+        return con.execute(f"SELECT COUNT(*) FROM ({sql})", args).fetchone()[0]
+
+
+def rebuild_search_index(pool: ConnectionPool) -> None:
+    """Reconstruye entries_fts desde entries (reparación manual; la migración 3 ya hace el backfill)."""
+    with pool.transaction() as con:
+        con.execute("INSERT INTO entries_fts(entries_fts) VALUES ('rebuild')")
+
+
+# ---------- etiquetas: nube ----------
+@cached_query
+def tag_counts(pool: ConnectionPool, group: str | None = None, limit: int = 30) -> List[Tuple[str, int]]:
+    """Nube de etiquetas: (etiqueta, nº de gabinetes), de la más usada a la menos, opcionalmente por grupo."""
+    sql = "SELECT min(t.tag), count(*) AS n FROM entry_tags t"
+    args: List[Any] = []
+    if group:
+        sql += " JOIN entries e ON e.id = t.entry_id WHERE e.grp = ?"
+        args.append(group)
+    sql += " GROUP BY t.tag_norm ORDER BY n DESC, t.tag_norm LIMIT ?"
+    with pool.connection() as con:
+        return [(tag, n) for tag, n in con.execute(sql, args + [limit])]
+
+
+@cached_query
+def images_for(pool: ConnectionPool, entry_ids: List[int]) -> Dict[int, List[sqlite3.Row]]:
+    """Versiones de las imágenes de las tarjetas de una página (vacío si aún no hay backfill)."""
+    out: Dict[int, List[sqlite3.Row]] = {i: [] for i in entry_ids}
+    if not entry_ids:
+        return out
+    marks = ",".join("?" * len(entry_ids))
+    with pool.connection() as con:
+        for row in con.execute(
+            f"SELECT * FROM entry_images WHERE entry_id IN ({marks}) ORDER BY entry_id, pos", entry_ids,
+        ):
+            out[row["entry_id"]].append(row)
+    return out
+
+
+# ---------- media (almacén por contenido) ----------
+def register_media(pool: ConnectionPool, digest: str, path: str, kind: str, size: int) -> str:
+    """Alta del objeto o, si ya existía, renueva last_seen para que el GC no lo borre mientras se usa.
+
+    Devuelve la ruta registrada del objeto (la primera con la que se guardó ese contenido).
+    """
+    with pool.transaction() as con:
+        return con.execute(
+            """INSERT INTO media_objects(hash, path, kind, size, last_seen) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT(hash) DO UPDATE SET last_seen = excluded.last_seen
+               RETURNING path""",
+            (digest, path, kind, size, datetime.utcnow().isoformat()),
+        ).fetchone()[0]
+
+
+def media_path(pool: ConnectionPool, digest: str) -> str | None:
+    """Ruta registrada del objeto con ese contenido, o None si todavía no está en el almacén."""
+    with pool.connection() as con:
+        row = con.execute("SELECT path FROM media_objects WHERE hash = ?", (digest,)).fetchone()
+    return row[0] if row else None
+
+
+def touch_media(pool: ConnectionPool, digests: List[str]) -> None:
+    """Renueva last_seen de los objetos ya registrados (los que no existen se ignoran)."""
+    if not digests:
+        return
+    marks = ",".join("?" * len(digests))
+    with pool.transaction() as con:
+        con.execute(f"UPDATE media_objects SET last_seen = ? WHERE hash IN ({marks})",
+                    [datetime.utcnow().isoformat(), *digests])
+
+
+def unreferenced_media(pool: ConnectionPool, seen_before: str) -> List[sqlite3.Row]:
+    """Objetos sin ningún gabinete ni borrador que los use y sin subidas desde `seen_before` (ISO)."""
+    with pool.connection() as con:
+        return con.execute(
+            """SELECT o.* FROM media_objects o
+               WHERE o.last_seen < ? AND NOT EXISTS (SELECT 1 FROM media_refs r WHERE r.hash = o.hash)
+                 AND NOT EXISTS (SELECT 1 FROM draft_media d WHERE d.hash = o.hash)""",
+            (seen_before,),
+        ).fetchall()
+
+
+def forget_media(pool: ConnectionPool, digest: str, seen_before: str) -> bool:
+    """Borra la fila del objeto si sigue sin referencias; True si el llamador puede borrar sus archivos."""
+    with pool.transaction() as con:
+        cur = con.execute(
+            """DELETE FROM media_objects WHERE hash = ? AND last_seen < ?
+               AND NOT EXISTS (SELECT 1 FROM media_refs r WHERE r.hash = media_objects.hash)
+               AND NOT EXISTS (SELECT 1 FROM draft_media d WHERE d.hash = media_objects.hash)""",
+            (digest, seen_before),
+        )
+        return cur.rowcount == 1
+
+
+def set_audio_stream(pool: ConnectionPool, digest: str, stream: str, mime: str,
+                     duration: float | None, peaks: bytes | None) -> None:
+    with pool.transaction() as con:
+        con.execute(
+            "INSERT OR REPLACE INTO audio_streams(hash, stream, mime, duration, peaks) VALUES (?, ?, ?, ?, ?)",
+            (digest, stream, mime, duration, peaks),
+        )
+        bump_generation(con, "media")
+
+@cached_query
+def audio_streams_for(pool: ConnectionPool, paths: List[str]) -> Dict[str, sqlite3.Row]:
+    """Versión de streaming de los audios de una página, por ruta del objeto (audio_url)."""
+    if not paths:
+        return {}
+    marks = ",".join("?" * len(paths))
+    with pool.connection() as con:
+        return {
+            row["path"]: row
+            for row in con.execute(
+                f"""SELECT o.path, a.* FROM media_objects o JOIN audio_streams a ON a.hash = o.hash
+                    WHERE o.path IN ({marks})""", paths,
+            )
+        }
+
+def media_files(pool: ConnectionPool) -> List[Tuple[str, str]]:
+    """(ruta, tipo) de todo lo que la base usa: objetos del almacén ('image'/'audio'),
+    versiones de imágenes de gabinetes ('rendition') y streaming de audio ('stream', relativo a static/)."""
+    with pool.connection() as con:
+        return [tuple(r) for r in con.execute(
+            """SELECT path, kind FROM media_objects
+               UNION SELECT original, 'rendition' FROM entry_images
+               UNION SELECT display, 'rendition' FROM entry_images
+               UNION SELECT thumb, 'rendition' FROM entry_images
+               UNION SELECT stream, 'stream' FROM audio_streams"""
+        )]
+
+def audio_without_stream(pool: ConnectionPool) -> List[sqlite3.Row]:
+    with pool.connection() as con:
+        return con.execute(
+            """SELECT o.* FROM media_objects o
+               WHERE o.kind = 'audio' AND NOT EXISTS (SELECT 1 FROM audio_streams a WHERE a.hash = o.hash)"""
+        ).fetchall()
+
+
+# ---------- borradores ----------
+def normalize_email(email: str) -> str:
+    return "".join((email or "").split()).casefold()
+
+def create_draft(pool: ConnectionPool, email: str) -> str | None:
+    """Crea el borrador vacío de `email` y devuelve su token; None si ese email ya tiene uno.
+
+    El token es el único secreto del borrador: solo se entrega al crearlo. Un
+    borrador existente se abre con su token (enlace o código), nunca con el email.
+    """
+    token = uuid.uuid4().hex
+    with pool.transaction() as con:
+        cur = con.execute(
+            "INSERT OR IGNORE INTO drafts(token, email, updated_at) VALUES (?, ?, ?)",
+            (token, normalize_email(email), datetime.utcnow().isoformat()),
+        )
+        return token if cur.rowcount == 1 else None
+
+def load_draft(pool: ConnectionPool, token: str) -> Dict[str, Any] | None:
+    with pool.connection() as con:
+        row = con.execute("SELECT * FROM drafts WHERE token = ?", (token,)).fetchone()
+    if row is None:
+        return None
+    return {**dict(row), "data": json.loads(row["data"]), "images": json.loads(row["images"])}
+
+def save_draft(pool: ConnectionPool, token: str, fields: Dict[str, Any] | None = None,
+               images: Dict[str, List[Any]] | None = None) -> None:
+    """Escribe solo lo que cambió: json_patch mezcla `fields`/`images` con lo guardado."""
+    with pool.transaction() as con:
+        con.execute(
+            """UPDATE drafts SET data = json_patch(data, ?), images = json_patch(images, ?), updated_at = ?
+               WHERE token = ?""",
+            (json.dumps(fields or {}), json.dumps(images or {}), datetime.utcnow().isoformat(), token),
+        )
+        if images:
+            paths = [img[0] for slot in json.loads(
+                con.execute("SELECT images FROM drafts WHERE token = ?", (token,)).fetchone()[0]
+            ).values() for img in slot]
+            con.execute("DELETE FROM draft_media WHERE token = ?", (token,))
+            if paths:
+                marks = ",".join("?" * len(paths))
+                con.execute(
+                    f"INSERT OR IGNORE INTO draft_media(token, hash) SELECT ?, hash FROM media_objects WHERE path IN ({marks})",
+                    [token, *paths],
+                )
+
+def mark_draft_published(pool: ConnectionPool, token: str, entry_id: int) -> None:
+    with pool.transaction() as con:
+        con.execute("UPDATE drafts SET published_id = ?, updated_at = ? WHERE token = ?",
+                    (entry_id, datetime.utcnow().isoformat(), token))
+
+
+# ---------- respaldos incrementales ----------
+def last_checkpoint(con: sqlite3.Connection) -> sqlite3.Row | None:
+    """Último respaldo por rev: el siguiente "desde el último" sigue a partir de él.
+
+    Los respaldos por fecha no cuentan: sus filas empiezan en since_ts, no en el rev
+    anterior, y encadenar desde ellos dejaría fuera lo editado entre ambos.
+    """
+    return con.execute(
+        "SELECT * FROM export_checkpoints WHERE since_ts IS NULL ORDER BY id DESC LIMIT 1").fetchone()
+
+
+def record_checkpoint(pool: ConnectionPool, *, since_rev: int | None, since_ts: str | None,
+                      upto_rev: int, rows: int, media: int, path: str) -> int:
+    with pool.transaction() as con:
+        return con.execute(
+            """INSERT INTO export_checkpoints(created_at, since_rev, since_ts, upto_rev, rows, media, path)
+               VALUES (?, ?, ?, ?, ?, ?, ?)""",
+            (datetime.utcnow().isoformat(), since_rev, since_ts, upto_rev, rows, media, path),
+        ).lastrowid
+
+
+def checkpoints(pool: ConnectionPool, limit: int = 10) -> List[sqlite3.Row]:
+    with pool.connection() as con:
+        return con.execute("SELECT * FROM export_checkpoints ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+
+
+# ---------- panel docente ----------
+# Las métricas se calculan con agregados SQL y quedan en QUERY_CACHE: mientras
+# nadie publique ni edite, el panel no vuelve a leer la tabla.
+HAS_AUDIO  = "(ifnull(audio_url, '') <> '' OR ifnull(suno_link, '') <> '')"
+REFL_CHARS = "(length(ifnull(reflection_q1, '')) + length(ifnull(reflection_q2, '')) + length(ifnull(reflection_q3, '')))"
+
+@cached_query
+def dashboard(pool: ConnectionPool) -> Dict[str, Any]:
+    """Métricas del Panel docente: totales, por grupo y por día."""
+    with pool.connection() as con:
+        totals = con.execute(f"""
+            SELECT COUNT(*)                                          AS total,
+                   ifnull(SUM({HAS_AUDIO}), 0)                       AS with_audio,
+                   ifnull(SUM(image_count > 0), 0)                   AS with_images,
+                   ifnull(SUM(image_count > 2), 0)                   AS over_two_images,
+                   ifnull(SUM(image_count = 0 AND NOT {HAS_AUDIO}), 0) AS without_media,
+                   ifnull(SUM(image_count), 0)                       AS images,
+                   COUNT(DISTINCT grp)                               AS groups,
+                   ifnull(ROUND(AVG({REFL_CHARS})), 0)               AS reflection_chars
+            FROM entries""").fetchone()
+        by_group = con.execute(f"""
+            SELECT grp, COUNT(*) AS total, SUM({HAS_AUDIO}) AS with_audio,
+                   SUM(image_count > 0) AS with_images, ROUND(AVG({REFL_CHARS})) AS reflection_chars
+            FROM entries GROUP BY grp ORDER BY grp""").fetchall()
+        by_day = con.execute("""
+            SELECT substr(created_at, 1, 10) AS day, grp, COUNT(*) AS total
+            FROM entries GROUP BY day, grp ORDER BY day""").fetchall()
+    return {
+        "totals": dict(totals),
+        "by_group": [dict(r) for r in by_group],
+        "by_day": [dict(r) for r in by_day],
+    }
+
+
+# ---------- evaluación SPARK ----------
+SPARK_CRITERIA = ("s", "p", "a", "r", "k")
+SPARK_TOTAL = " + ".join(f"ifnull(sc.{c}, 0)" for c in SPARK_CRITERIA)
+
+
+class SparkChange(NamedTuple):
+    entry_id: int
+    version: int                       # la que tenía la fila al cargar la grilla (0 = sin evaluar)
+    scores: Dict[str, int | None]      # solo los criterios editados
+
+
+@cached_query
+def spark_grid(pool: ConnectionPool, group: str) -> List[sqlite3.Row]:
+    """Gabinetes de un grupo con sus calificaciones actuales, en una sola consulta."""
+    cols = ", ".join(f"sc.{c}" for c in SPARK_CRITERIA)
+    with pool.connection() as con:
+        return con.execute(f"""
+            SELECT e.id, e.student_name, e.artifact_title, {cols}, ifnull(sc.version, 0) AS version
+            FROM entries e LEFT JOIN spark_scores sc ON sc.entry_id = e.id
+            WHERE e.grp = ? ORDER BY e.student_name COLLATE NOCASE, e.id""", (group,)).fetchall()
+
+
+def save_spark_scores(pool: ConnectionPool, changes: List[SparkChange]) -> Tuple[int, List[int]]:
+    """Guarda todas las celdas editadas en una transacción. Devuelve (filas guardadas, ids en conflicto).
+
+    Cada fila se escribe solo si su version sigue siendo la que se cargó: si otra
+    docente la guardó entretanto, esa fila no se pisa y su id vuelve en conflictos.
+    """
+    saved, conflicts = 0, []
+    now = datetime.utcnow().isoformat()
+    with pool.transaction() as con:
+        for ch in changes:
+            cols = [c for c in SPARK_CRITERIA if c in ch.scores]
+            if not cols:
+                continue
+            values = [ch.scores[c] for c in cols]
+            if ch.version == 0:
+                # DO NOTHING solo ante la misma fila (conflicto); OR IGNORE también callaría el CHECK 0–4
+                cur = con.execute(
+                    f"INSERT INTO spark_scores(entry_id, {', '.join(cols)}, version, updated_at) "
+                    f"VALUES (?, {', '.join('?' * len(cols))}, 1, ?) ON CONFLICT(entry_id) DO NOTHING",
+                    (ch.entry_id, *values, now))
+            else:
+                cur = con.execute(
+                    f"UPDATE spark_scores SET {', '.join(f'{c} = ?' for c in cols)}, "
+                    "version = version + 1, updated_at = ? WHERE entry_id = ? AND version = ?",
+                    (*values, now, ch.entry_id, ch.version))
+            if cur.rowcount:
+                saved += 1
+            else:
+                conflicts.append(ch.entry_id)
+        if saved:
+            bump_generation(con, "spark")
+    return saved, conflicts
+
+
+@cached_query
+def spark_summary(pool: ConnectionPool) -> List[sqlite3.Row]:
+    """Resumen por grupo: gabinetes, evaluados y promedio de cada criterio y del total (0–20)."""
+    avgs = ", ".join(f"ROUND(AVG(sc.{c}), 2) AS {c}" for c in SPARK_CRITERIA)
+    with pool.connection() as con:
+        return con.execute(f"""
+            SELECT e.grp, COUNT(*) AS entries, COUNT(sc.entry_id) AS graded, {avgs},
+                   ROUND(AVG(CASE WHEN sc.entry_id IS NOT NULL THEN {SPARK_TOTAL} END), 2) AS total
+            FROM entries e LEFT JOIN spark_scores sc ON sc.entry_id = e.id
+            GROUP BY e.grp ORDER BY e.grp""").fetchall()
@@ -0,0 +1,618 @@
+# ===========================================
+# Gabinete Personal — media.py (imágenes y audio subidos)
+# ===========================================
+# Almacén por contenido: cada archivo se guarda una sola vez bajo el sha256
+# de los bytes subidos, en carpetas repartidas por prefijo:
+#   uploads/objects/ab/cd/abcd…<ext>
+# La misma foto subida en Fase 1, Fase 3 y el formulario final ocupa un solo
+# archivo; media_objects/media_refs (gabinete_db) cuentan quién la usa y el GC
+# solo borra lo que nadie referencia.
+#
+# Cada imagen se guarda en varias versiones (renditions):
+#   original  -> JPEG progresivo, tamaño completo (para exportar / ver en grande)
+#   display   -> WebP 1024 px (al abrir la tarjeta)
+#   thumb     -> WebP 320 px (tarjeta de la galería)
+# La orientación EXIF se aplica antes de re-codificar (las fotos de celular
+# llegan "acostadas" si no).
+#
+# Decodificar/redimensionar/codificar es CPU pura y Pillow solo suelta el GIL
+# a ratos, así que las imágenes de un envío se procesan en un pool de procesos
+# acotado (GABINETE_IMAGE_WORKERS, por defecto hasta 4), compartido por todas
+# las sesiones.
+#
+# El audio no viaja por el websocket: cada archivo tiene una versión de
+# streaming en static/audio/<hash>.<ext> (Streamlit la sirve con Range, así el
+# navegador solo baja lo que reproduce). Con ffmpeg en el PATH, WAV/M4A se
+# re-codifican a AAC (m4a "faststart"); sin ffmpeg se sirve el original. La
+# duración y la forma de onda se calculan al subir y quedan en audio_streams.
+# Las URLs llevan el prefijo de server.baseUrlPath (static_url). requirements.txt
+# fija streamlit>=1.65: su ruta estática deduce el Content-Type por extensión
+# (audio/mp4, audio/mpeg); versiones anteriores mandaban text/plain para lo que
+# no estaba en su lista y el navegador no lo reproducía.
+#
+# El disco local es siempre la copia de trabajo (Pillow y ffmpeg escriben ahí).
+# Si el almacén configurado es otro (GABINETE_STORAGE=s3, ver storage.py), lo
+# nuevo se sube al guardarlo y la galería usa la copia local si está o, si no
+# (tras un reinicio en Streamlit Cloud), un enlace firmado del bucket.
+#
+#   python media.py backfill   # genera versiones para las imágenes y audios ya guardados
+#   python media.py dedupe     # mueve media antigua (por fecha) al almacén por contenido
+#   python media.py gc         # borra objetos que ningún gabinete usa
+#   python media.py migrate    # copia la media existente al almacén configurado (--reverse: de vuelta al disco)
+from __future__ import annotations
+import argparse, hashlib, io, multiprocessing, os, shutil, subprocess, tempfile, wave
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import streamlit as st
+
+import gabinete_db as gdb
+import metrics
+from storage import LocalStorage, Migrator, Storage, get_storage
+
+# Pillow y NumPy se importan dentro de las funciones que los usan: las páginas
+# que solo muestran texto (y el arranque del proceso) no los cargan.
+if TYPE_CHECKING:
+    import numpy as np
+    from PIL import Image
+
+DATA_DIR    = gdb.DATA_DIR
+UPLOADS     = DATA_DIR / "uploads"
+IMG_DIR     = UPLOADS / "images"     # media antigua (nombres por fecha)
+AUDIO_DIR   = UPLOADS / "audio"
+OBJECTS_DIR = UPLOADS / "objects"
+# originales de gabinetes archivados (ver archive.py); puede ser otro disco, más barato
+COLD_DIR    = Path(os.getenv("GABINETE_COLD_DIR", DATA_DIR / "cold"))
+
+# lado mayor (px) de cada versión reducida, de la más grande a la más chica
+RENDITIONS: Dict[str, int] = {"display": 1024, "thumb": 320}
+WEBP_QUALITY = {"display": 85, "thumb": 80}
+
+# 0 o 1 = sin pool (todo en el hilo de la sesión)
+IMAGE_WORKERS = int(os.getenv("GABINETE_IMAGE_WORKERS", min(4, os.cpu_count() or 1)))
+
+CHUNK = 1024 * 1024          # lectura por bloques: el audio grande nunca está entero en memoria
+GC_GRACE = timedelta(hours=24)
+
+# audio: static/ es la carpeta que Streamlit sirve (server.enableStaticServing)
+STATIC_DIR  = gdb.BASE_DIR / "static"
+STREAM_DIR  = STATIC_DIR / "audio"
+STATIC_URL  = "app/static"           # ruta del servidor estático, bajo server.baseUrlPath (ver static_url)
+FFMPEG      = shutil.which("ffmpeg") if os.getenv("GABINETE_TRANSCODE", "1") != "0" else None
+TRANSCODE   = {".wav", ".m4a", ".aif", ".aiff", ".flac"}
+STREAM_ARGS = ["-vn", "-c:a", "aac", "-b:a", "96k", "-movflags", "+faststart"]
+AUDIO_MIME  = {".mp3": "audio/mpeg", ".m4a": "audio/mp4", ".wav": "audio/wav", ".ogg": "audio/ogg",
+               ".aif": "audio/aiff", ".aiff": "audio/aiff", ".flac": "audio/flac"}
+WAVE_POINTS = 96             # barras de la forma de onda
+PROBE_RATE  = 8000           # Hz al decodificar con ffmpeg solo para medir
+
+# copia local: claves relativas a DATA_DIR; las de streaming ("static/audio/…") van a static/
+STREAM_PREFIX  = "static/"
+DISK           = LocalStorage(DATA_DIR, mounts={STREAM_PREFIX: STATIC_DIR})
+UPLOAD_WORKERS = 4
+
+
+class Rendition(NamedTuple):
+    """Rutas relativas a DATA_DIR de las versiones de una imagen."""
+    original: str
+    display: str
+    thumb: str
+    width: int
+    height: int
+
+
+def _rel(p: Path) -> str:
+    return str(p.relative_to(DATA_DIR))
+
+
+# ---------- almacén configurado ----------
+def remote() -> Optional[Storage]:
+    """El almacén configurado si no es el disco local (None: todo queda en data/, como siempre)."""
+    store = get_storage()
+    return None if isinstance(store, LocalStorage) else store
+
+def stream_key(stream: str) -> str:
+    return STREAM_PREFIX + stream
+
+@st.cache_resource(show_spinner=False)
+def upload_executor(workers: int = UPLOAD_WORKERS) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gabinete-upload")
+
+def replicate(keys: Iterable[str]) -> List[str]:
+    """Sube al almacén configurado las copias locales que aún no están. Devuelve las claves que fallaron.
+
+    Un fallo no impide publicar: la copia local sigue sirviendo y `python media.py
+    migrate` sube lo que falte.
+    """
+    store = remote()
+    if store is None:
+        return []
+
+    def upload(key: str) -> Optional[str]:
+        try:
+            p = DISK.path(key)
+            if p.exists() and store.size(key) != p.stat().st_size:
+                store.put_file(key, p)
+        except Exception:
+            return key
+        return None
+    return [k for k in upload_executor().map(upload, dict.fromkeys(keys)) if k]
+
+def media_src(rel: str) -> Optional[str]:
+    """Para st.image/st.audio: la ruta local si el archivo está en disco (o en el archivo frío); si no, un enlace firmado del almacén."""
+    for root in (DATA_DIR, COLD_DIR):
+        p = root / rel
+        if p.exists():
+            return str(p)
+    store = remote()
+    return store.url(rel) if store else None
+
+def media_keys(pool: gdb.ConnectionPool) -> List[str]:
+    """Claves de todos los archivos que usa la base (objetos, versiones de imagen y streaming)."""
+    keys = []
+    for path, kind in gdb.media_files(pool):
+        if kind == "stream":
+            keys.append(stream_key(path))
+            continue
+        keys.append(path)
+        if kind == "image":
+            base = (DATA_DIR / path).with_suffix("")
+            keys += [_rel(_variant(base, n)) for n in RENDITIONS]
+    return list(dict.fromkeys(keys))
+
+
+# ---------- almacén por contenido ----------
+def object_base(digest: str) -> Path:
+    """Ruta (sin extensión) del objeto `digest`: objects/ab/cd/abcd…"""
+    return OBJECTS_DIR / digest[:2] / digest[2:4] / digest
+
+def _variant(base: Path, name: str) -> Path:
+    return base.with_name(f"{base.name}_{name}.webp")
+
+def hash_file(fileobj) -> str:
+    """sha256 leyendo por bloques (no carga el archivo en memoria)."""
+    h = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(CHUNK), b""):
+        h.update(block)
+    return h.hexdigest()
+
+def _hash_to_temp(fileobj) -> Tuple[str, Path, int]:
+    """Copia por bloques a un temporal dentro del almacén mientras calcula el hash."""
+    OBJECTS_DIR.mkdir(parents=True, exist_ok=True)
+    h = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=OBJECTS_DIR, suffix=".part", delete=False) as tmp:
+        for block in iter(lambda: fileobj.read(CHUNK), b""):
+            h.update(block)
+            tmp.write(block)
+            size += len(block)
+    return h.hexdigest(), Path(tmp.name), size
+
+def _place(src: Path, dest: Path) -> int:
+    """Mueve src a dest, o lo borra si dest ya existe (duplicado). Devuelve los bytes liberados."""
+    if dest.exists():
+        size = src.stat().st_size
+        src.unlink()
+        return size
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(src, dest)
+    return 0
+
+
+# ---------- versiones de imagen ----------
+def make_renditions(image: Image.Image, base: Path, original: Path | None = None) -> Rendition:
+    """Escribe original (si no se da) + versiones reducidas junto a `base` (ruta sin extensión).
+
+    Orden de escritura: original, display, thumb. La miniatura es la última, así
+    que si existe el conjunto está completo (ver _existing_renditions).
+    """
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    base.parent.mkdir(parents=True, exist_ok=True)
+    if original is None:
+        original = base.with_suffix(".jpg")
+        image.save(original, "JPEG", quality=92, optimize=True, progressive=True)
+    out: Dict[str, str] = {}
+    current = image
+    for name, size in RENDITIONS.items():
+        current = current.copy()
+        current.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+        path = _variant(base, name)
+        current.save(path, "WEBP", quality=WEBP_QUALITY[name], method=4)
+        out[name] = _rel(path)
+    return Rendition(_rel(original), out["display"], out["thumb"], image.width, image.height)
+
+def _existing_renditions(base: Path, original: Path) -> Rendition | None:
+    if not (original.exists() and _variant(base, "thumb").exists()):
+        return None
+    from PIL import Image
+    with Image.open(original) as image:          # solo lee la cabecera
+        width, height = image.size
+    return Rendition(_rel(original), _rel(_variant(base, "display")), _rel(_variant(base, "thumb")), width, height)
+
+
+# ---------- guardar media ----------
+def _render_upload(data: bytes, base: Path) -> Rendition:
+    """Trabajo de un proceso del pool: bytes subidos -> versiones en disco."""
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as image:
+        return make_renditions(image, base)
+
+@st.cache_resource(show_spinner=False)
+def image_executor(workers: int = IMAGE_WORKERS) -> ProcessPoolExecutor:
+    # "spawn": hacer fork de un servidor con hilos (Streamlit/tornado) puede colgarse
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def save_image(pool: gdb.ConnectionPool, file) -> Rendition:
+    return save_images(pool, [file])[0]
+
+@metrics.timed("media.save_images")
+def save_images(pool: gdb.ConnectionPool, files: List,
+                on_error: Optional[Callable[[object, Exception], None]] = None) -> List[Rendition]:
+    """Guarda varias imágenes en paralelo, en el orden recibido; las que fallan se reportan con on_error.
+
+    Una imagen ya presente en el almacén (mismo sha256) no se vuelve a procesar.
+    Una imagen nueva se registra en media_objects solo cuando sus versiones ya
+    están en disco: una subida corrupta no deja una fila sin archivo.
+    """
+    jobs = []
+    metrics.count("media.images", len(files))
+    for f in files:
+        data = f.getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        jobs.append((f, data, object_base(digest), digest))
+    # renueva last_seen antes de mirar el disco: el GC no puede borrar a medio envío una ya guardada
+    gdb.touch_media(pool, list({digest for *_, digest in jobs}))
+
+    done: Dict[Path, Rendition] = {}
+    todo: Dict[Path, bytes] = {}
+    for _, data, base, _ in jobs:
+        found = _existing_renditions(base, base.with_suffix(".jpg"))
+        if found:
+            done[base] = found
+        else:
+            todo.setdefault(base, data)      # la misma foto dos veces en un envío se procesa una vez
+
+    futures = {}
+    if IMAGE_WORKERS > 1 and len(todo) > 1:
+        try:
+            executor = image_executor()
+            futures = {base: executor.submit(_render_upload, data, base) for base, data in todo.items()}
+        except BrokenProcessPool:
+            image_executor.clear()
+            futures = {}
+
+    out: List[Rendition] = []
+    errors: Dict[Path, Exception] = {}
+    registered = set()
+    for f, data, base, digest in jobs:
+        try:
+            if base in errors:
+                raise errors[base]
+            if base not in registered:
+                if base in futures:
+                    try:
+                        done[base] = futures[base].result()
+                    except BrokenProcessPool:
+                        # un worker murió (p. ej. sin memoria): lo que falta va en línea y el pool se recrea
+                        image_executor.clear()
+                        futures = {}
+                if base not in done:
+                    done[base] = _render_upload(data, base)
+                gdb.register_media(pool, digest, done[base].original, "image", len(data))
+                registered.add(base)
+            out.append(done[base])
+        except Exception as ex:
+            errors[base] = ex
+            if on_error is None:
+                raise
+            on_error(f, ex)
+    metrics.count("media.images_rendered", len(todo))
+    replicate(k for r in out for k in r[:3])
+    return out
+
+@metrics.timed("media.save_audio")
+def save_audio(pool: gdb.ConnectionPool, file) -> str:
+    suffix = Path(file.name).suffix.lower() or ".mp3"
+    digest, tmp, size = _hash_to_temp(file)
+    metrics.count("media.audio_bytes", size)
+    # si ese contenido ya estaba (aunque con otra extensión) se reutiliza su ruta. Primero
+    # el archivo y después el registro: si _place falla no queda una fila sin su objeto
+    rel = gdb.media_path(pool, digest) or _rel(object_base(digest).with_suffix(suffix))
+    try:
+        _place(tmp, DATA_DIR / rel)
+    finally:
+        tmp.unlink(missing_ok=True)       # si _place falló, sin restos .part
+    registered = gdb.register_media(pool, digest, rel, "audio", size)
+    if registered != rel:                 # otra sesión registró el mismo audio con otra extensión
+        (DATA_DIR / rel).unlink(missing_ok=True)
+        rel = registered
+    replicate([rel])                      # el original (multipart si es grande) antes del streaming
+    prepare_audio(pool, digest, DATA_DIR / rel)
+    return rel
+
+
+# ---------- audio: streaming, duración y forma de onda ----------
+def _link(src: Path, dest: Path) -> None:
+    """Hard link (sin duplicar bytes); copia si static/ está en otro disco."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(dest.name + ".part")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dest)
+
+def _transcode(src: Path, dest: Path) -> bool:
+    tmp = dest.with_name(dest.stem + ".part" + dest.suffix)   # ffmpeg elige el formato por la extensión
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    done = subprocess.run(
+        [FFMPEG, "-nostdin", "-y", "-loglevel", "error", "-i", str(src), *STREAM_ARGS, str(tmp)],
+        capture_output=True,
+    )
+    if done.returncode != 0:
+        tmp.unlink(missing_ok=True)
+        return False
+    os.replace(tmp, dest)
+    return True
+
+def _peaks(levels: np.ndarray) -> bytes:
+    """Reduce niveles (0–1, uno por bloque) a WAVE_POINTS picos de un byte."""
+    if not len(levels):
+        return b""
+    import numpy as np
+    bars = [part.max() for part in np.array_split(levels, min(WAVE_POINTS, len(levels)))]
+    top = max(bars) or 1.0
+    return bytes(int(255 * b / top) for b in bars)
+
+def _pcm(frames: bytes, width: int) -> np.ndarray:
+    """Muestras PCM (cualquier ancho de WAV) como enteros con signo."""
+    import numpy as np
+    if width == 1:
+        return np.frombuffer(frames, np.uint8).astype(np.int16) - 128
+    if width == 3:
+        raw = np.frombuffer(frames, np.uint8).reshape(-1, 3)
+        return (raw[:, 0].astype(np.int32) | raw[:, 1].astype(np.int32) << 8 | raw[:, 2].astype(np.int8).astype(np.int32) << 16)
+    return np.frombuffer(frames, {2: np.int16, 4: np.int32}[width])
+
+def _probe_wav(src: Path) -> Tuple[float, bytes]:
+    import numpy as np
+    with wave.open(str(src), "rb") as w:
+        rate, width, frames = w.getframerate(), w.getsampwidth(), w.getnframes()
+        block = max(1, frames // (WAVE_POINTS * 4))
+        full = float(1 << (8 * width - 1))
+        levels = []
+        while chunk := w.readframes(block):     # por bloques: nunca el archivo entero
+            levels.append(np.abs(_pcm(chunk, width).astype(np.int64)).max() / full)
+    return frames / rate, _peaks(np.array(levels))
+
+def _probe_ffmpeg(src: Path) -> Tuple[float, bytes]:
+    import numpy as np
+    proc = subprocess.Popen(
+        [FFMPEG, "-nostdin", "-loglevel", "error", "-i", str(src), "-vn", "-ac", "1", "-ar", str(PROBE_RATE),
+         "-f", "s16le", "-"],
+        stdout=subprocess.PIPE,
+    )
+    levels, samples = [], 0
+    block = PROBE_RATE // 10 * 2                 # 0.1 s de muestras de 16 bits
+    while chunk := proc.stdout.read(block):
+        pcm = np.frombuffer(chunk[: len(chunk) // 2 * 2], np.int16)
+        samples += len(pcm)
+        if len(pcm):
+            levels.append(np.abs(pcm.astype(np.int32)).max() / 32768)
+    if proc.wait() != 0 or not samples:
+        raise OSError("ffmpeg no pudo decodificar el audio")
+    return samples / PROBE_RATE, _peaks(np.array(levels))
+
+def probe_audio(src: Path) -> Tuple[Optional[float], Optional[bytes]]:
+    """(duración en s, picos) del audio; (None, None) si no hay cómo leerlo."""
+    if src.suffix.lower() == ".wav":
+        try:
+            return _probe_wav(src)
+        except (wave.Error, EOFError, KeyError):
+            pass                                 # WAV en float/comprimido: que lo lea ffmpeg
+    if FFMPEG:
+        try:
+            return _probe_ffmpeg(src)
+        except OSError:
+            pass
+    return None, None
+
+def prepare_audio(pool: gdb.ConnectionPool, digest: str, src: Path) -> str:
+    """Deja lista la versión de streaming de un audio en static/audio/. Devuelve su ruta relativa a static/."""
+    suffix = src.suffix.lower()
+    dest = STREAM_DIR / f"{digest}{suffix}"
+    if FFMPEG and suffix in TRANSCODE:
+        coded = STREAM_DIR / f"{digest}.m4a"
+        if coded.exists() or _transcode(src, coded):
+            dest = coded
+    if not dest.exists():
+        _link(src, dest)
+    duration, peaks = probe_audio(src)
+    stream = str(dest.relative_to(STATIC_DIR))
+    replicate([stream_key(stream)])
+    gdb.set_audio_stream(pool, digest, stream, AUDIO_MIME.get(dest.suffix, "audio/mpeg"), duration, peaks)
+    return stream
+
+def static_url(rel: str) -> str:
+    """URL absoluta de un archivo de static/, con el prefijo de server.baseUrlPath (app detrás de un proxy)."""
+    base = st.get_option("server.baseUrlPath").strip("/")
+    return "/" + "/".join(p for p in (base, STATIC_URL, rel) if p)
+
+def stream_url(stream: str) -> str:
+    """URL del audio de streaming: static/ si está en este disco, si no el enlace firmado del almacén."""
+    store = remote()
+    if store and not (STATIC_DIR / stream).exists():
+        return store.url(stream_key(stream))
+    return static_url(stream)
+
+
+# ---------- backfill ----------
+def backfill(pool: gdb.ConnectionPool) -> int:
+    """Genera versiones para imágenes (y streaming para audios) que aún no las tienen. Devuelve cuántas creó."""
+    from PIL import Image
+    with pool.connection() as con:
+        rows = con.execute(
+            """SELECT e.id, e.image_urls FROM entries e
+               WHERE e.image_urls != ''
+                 AND NOT EXISTS (SELECT 1 FROM entry_images i WHERE i.entry_id = e.id)"""
+        ).fetchall()
+    made = 0
+    for row in rows:
+        renditions: List[Rendition] = []
+        for rel in [u for u in row["image_urls"].split("||") if u]:
+            src = DATA_DIR / rel
+            if not src.exists():
+                continue
+            try:
+                with Image.open(src) as image:
+                    renditions.append(make_renditions(image, src.with_suffix(""), original=src))
+            except OSError as ex:
+                print(f"  ! {rel}: {ex}")
+        replicate(k for r in renditions for k in r[:3])
+        with pool.transaction() as con:
+            gdb.set_entry_images(con, row["id"], renditions)
+        made += len(renditions)
+        print(f"gabinete {row['id']}: {len(renditions)} imagen(es)")
+    for obj in gdb.audio_without_stream(pool):
+        src = DATA_DIR / obj["path"]
+        if src.exists():
+            print(f"audio {obj['path']}: {prepare_audio(pool, obj['hash'], src)}")
+            made += 1
+    return made
+
+
+# ---------- migración a almacén por contenido ----------
+def _adopt(pool: gdb.ConnectionPool, src: Path, kind: str) -> Tuple[Path, int]:
+    """Mueve un archivo antiguo a su objeto; si el objeto ya existe lo borra. Devuelve (destino, bytes liberados)."""
+    size = src.stat().st_size
+    with open(src, "rb") as fh:
+        digest = hash_file(fh)
+    rel = gdb.media_path(pool, digest) or _rel(object_base(digest).with_suffix(src.suffix.lower()))
+    dest = DATA_DIR / rel
+    freed = _place(src, dest)             # como en save_audio: el registro va después del archivo
+    if kind == "image":
+        old_base, new_base = src.with_suffix(""), dest.with_suffix("")
+        for n in RENDITIONS:
+            if _variant(old_base, n).exists():
+                freed += _place(_variant(old_base, n), _variant(new_base, n))
+    gdb.register_media(pool, digest, rel, kind, size)
+    return dest, freed
+
+def dedupe(pool: gdb.ConnectionPool) -> Tuple[int, int]:
+    """Reescribe image_urls/audio_url de gabinetes con media por fecha. Devuelve (archivos, bytes liberados)."""
+    from PIL import Image
+    objects = _rel(OBJECTS_DIR)
+    moved: Dict[str, str] = {}
+    files = freed = 0
+    with pool.connection() as con:
+        rows = con.execute("SELECT id, image_urls, audio_url FROM entries").fetchall()
+    for row in rows:
+        images = [u for u in (row["image_urls"] or "").split("||") if u]
+        audio = row["audio_url"] or ""
+        if not any(u and not u.startswith(objects) for u in images + [audio]):
+            continue
+
+        def adopt(rel: str, kind: str) -> str:
+            nonlocal files, freed
+            if rel in moved or rel.startswith(objects) or not (DATA_DIR / rel).exists():
+                return moved.get(rel, rel)
+            dest, gained = _adopt(pool, DATA_DIR / rel, kind)
+            moved[rel] = _rel(dest)
+            files += 1
+            freed += gained
+            return moved[rel]
+
+        images = [adopt(u, "image") for u in images]
+        audio = adopt(audio, "audio") if audio else ""
+        renditions = []
+        for rel in images:
+            original = DATA_DIR / rel
+            if not original.exists():
+                continue
+            base = original.with_suffix("")
+            found = _existing_renditions(base, original)
+            if found is None:
+                with Image.open(original) as image:
+                    found = make_renditions(image, base, original=original)
+            renditions.append(found)
+        with pool.transaction() as con:
+            con.execute("UPDATE entries SET image_urls = ?, audio_url = ? WHERE id = ?",
+                        ("||".join(images), audio, row["id"]))
+            gdb.set_entry_images(con, row["id"], renditions)
+            gdb.link_media(con, row["id"], gdb.media_paths("||".join(images), audio))
+    return files, freed
+
+
+def gc(pool: gdb.ConnectionPool, grace: timedelta = GC_GRACE) -> Tuple[int, int]:
+    """Borra objetos sin referencias y sin uso en `grace`. Devuelve (objetos, bytes liberados)."""
+    cutoff = (datetime.utcnow() - grace).isoformat()
+    removed = freed = 0
+    store = remote()
+    for obj in gdb.unreferenced_media(pool, cutoff):
+        if not gdb.forget_media(pool, obj["hash"], cutoff):
+            continue                    # alguien lo volvió a usar entre medio
+        path = DATA_DIR / obj["path"]
+        base = path.with_suffix("")
+        extra = [_variant(base, n) for n in RENDITIONS] if obj["kind"] == "image" else list(STREAM_DIR.glob(f"{obj['hash']}.*"))
+        if obj["kind"] == "image":
+            keys = [obj["path"]] + [_rel(p) for p in extra]
+        else:                           # streaming: el original enlazado o la versión AAC
+            keys = [obj["path"]] + [stream_key(f"{STREAM_DIR.name}/{obj['hash']}{ext}")
+                                    for ext in {path.suffix.lower(), ".m4a"}]
+        for p in [path] + extra:
+            if p.exists():
+                freed += p.stat().st_size
+                p.unlink()
+        if store:
+            for key in keys:
+                store.delete(key)
+        removed += 1
+    return removed, freed
+
+
+def migrate(pool: gdb.ConnectionPool, reverse: bool = False, prune: bool = False) -> Migrator:
+    """Copia en segundo plano la media del disco al almacén configurado (o de vuelta con `reverse`)."""
+    store = get_storage()
+    if isinstance(store, LocalStorage):
+        raise SystemExit("El almacén configurado es el disco local: define GABINETE_STORAGE=s3 (ver storage.py).")
+    src, dst = (store, DISK) if reverse else (DISK, store)
+    m = Migrator(src, dst, media_keys(pool), prune=prune)
+    m.start()
+    return m
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Herramientas de media del Gabinete")
+    ap.add_argument("command", choices=["backfill", "dedupe", "gc", "migrate"])
+    ap.add_argument("--reverse", action="store_true", help="migrate: del almacén configurado al disco local")
+    ap.add_argument("--prune", action="store_true", help="migrate: borrar del origen lo ya copiado y verificado")
+    args = ap.parse_args()
+    cmd = args.command
+    pool = gdb.open_pool()
+    if cmd == "backfill":
+        print(f"Listo: {backfill(pool)} imagen(es)/audio(s) con versiones nuevas.")
+    elif cmd == "dedupe":
+        files, freed = dedupe(pool)
+        print(f"Listo: {files} archivo(s) al almacén por contenido, {freed / 1e6:.1f} MB liberados.")
+    elif cmd == "migrate":
+        m = migrate(pool, args.reverse, args.prune)
+        while m.is_alive():
+            m.join(2.0)
+            s = m.stats()
+            print(f"  {s['copied'] + s['skipped'] + s['missing'] + s['failed']}/{s['total']} "
+                  f"({s['bytes'] / 1e6:.1f} MB copiados)", flush=True)
+        s = m.stats()
+        print(f"Listo: {s['copied']} copiado(s), {s['skipped']} ya estaban, {s['missing']} sin origen, {s['failed']} con error.")
+        for key, err in list(m.errors.items())[:20]:
+            print(f"  ! {key}: {err}")
+    else:
+        removed, freed = gc(pool)
+        print(f"Listo: {removed} objeto(s) sin uso borrados, {freed / 1e6:.1f} MB liberados.")
+
+
+if __name__ == "__main__":
+    main()
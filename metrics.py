@@ -0,0 +1,219 @@
+# ===========================================
+# Gabinete Personal — metrics.py (tiempos y contadores del proceso)
+# ===========================================
+# Capa mínima de instrumentación, sin dependencias: spans (context manager o
+# decorador) que miden con perf_counter, contadores e histogramas por nombre y
+# etiquetas. Todo vive en memoria del proceso (METRICS, compartido por todas las
+# sesiones y páginas) y se lee desde el Panel docente › Rendimiento.
+#
+# Qué se mide:
+#   db.query        cada execute() en las conexiones del pool (ver gabinete_db)
+#   media.*         guardar imágenes (decodificar + versiones) y audio
+#   export.*        construir CSV / ZIP
+#   gallery.render  pintar la página de tarjetas de la galería
+#   page.rerun      cada rerun de app.py, etiquetado por página del sidebar
+#
+# Exportación: prometheus() (formato de texto 0.0.4) y snapshot() (JSON). dump()
+# los deja en data/metrics/ (gabinete.prom sirve tal cual para el textfile
+# collector de node_exporter); app.py lo llama al final de cada rerun, como
+# mucho cada DUMP_EVERY segundos.
+from __future__ import annotations
+import functools, json, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+BASE_DIR    = Path(__file__).parent
+METRICS_DIR = Path(os.getenv("GABINETE_DATA_DIR", BASE_DIR / "data")) / "metrics"
+PREFIX      = "gabinete"
+# segundos; el último (+Inf) se agrega al exportar
+BUCKETS     = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT      = 1024          # muestras recientes por serie para p50/p95
+SLOW_SQL    = 500           # sentencias distintas que se siguen (la SQL del repo es parametrizada)
+DUMP_EVERY  = float(os.getenv("GABINETE_METRICS_DUMP_S", "15"))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Cuenta por buckets (para Prometheus) + últimas RECENT muestras (para percentiles)."""
+
+    __slots__ = ("count", "total", "max", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent: Deque[float] = deque(maxlen=RECENT)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, q: float) -> float:
+        data = sorted(self.recent)
+        if not data:
+            return 0.0
+        return data[min(len(data) - 1, int(q * len(data)))]
+
+
+class Registry:
+    """Contadores, histogramas y estadística por sentencia SQL, seguros entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._sql: Dict[str, List[float]] = {}      # sql -> [veces, total s, máx s]
+        self._dumped = 0.0
+
+    # ----- registro -----
+    def count(self, name: str, n: float = 1, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name: str, seconds: float, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def observe_sql(self, sql: str, seconds: float) -> None:
+        """Tiempo de una sentencia: histograma db.query + acumulado por texto de la sentencia."""
+        self.observe("db.query", seconds)
+        with self._lock:
+            stat = self._sql.get(sql)
+            if stat is None:
+                if len(self._sql) >= SLOW_SQL:
+                    return
+                stat = self._sql[sql] = [0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+
+    @contextmanager
+    def span(self, name: str, **labels: Any) -> Iterator[None]:
+        """Mide el bloque (también si termina con excepción) en el histograma `name`."""
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t, **labels)
+
+    def timed(self, name: str) -> Callable[[Callable], Callable]:
+        """Decorador: cada llamada queda en el histograma `name`."""
+        def wrap(fn: Callable) -> Callable:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return wrap
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._sql.clear()
+            self.started = time.time()
+
+    # ----- lectura -----
+    def latencies(self, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Una fila por serie (nombre + etiquetas) con conteo y p50/p95/máx en ms."""
+        with self._lock:
+            items = [(k, h.count, h.total, h.max, h.percentile(.5), h.percentile(.95))
+                     for k, h in self._histograms.items() if name is None or k[0] == name]
+        return [{"name": n, "labels": dict(lb), "count": c, "total_ms": tot * 1000,
+                 "p50_ms": p50 * 1000, "p95_ms": p95 * 1000, "max_ms": mx * 1000}
+                for (n, lb), c, tot, mx, p50, p95 in sorted(items)]
+
+    def counters(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._counters.items())
+        return [{"name": n, "labels": dict(lb), "value": v} for (n, lb), v in items]
+
+    def slow_queries(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Sentencias con el peor tiempo máximo (con veces y promedio)."""
+        with self._lock:
+            items = [(sql, c, tot, mx) for sql, (c, tot, mx) in self._sql.items()]
+        items.sort(key=lambda s: s[3], reverse=True)
+        return [{"sql": sql, "count": int(c), "avg_ms": tot / c * 1000, "max_ms": mx * 1000}
+                for sql, c, tot, mx in items[:limit]]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"started": self.started, "uptime_s": time.time() - self.started,
+                "latencies": self.latencies(), "counters": self.counters(),
+                "slow_queries": self.slow_queries()}
+
+    def prometheus(self) -> str:
+        """Formato de texto de Prometheus: un histograma *_seconds por span, un *_total por contador."""
+        with self._lock:
+            hists = sorted((k, h.count, h.total, list(h.buckets)) for k, h in self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines: List[str] = []
+        typed = set()
+
+        def metric(name: str, suffix: str, kind: str) -> str:
+            full = f"{PREFIX}_{name.replace('.', '_')}{suffix}"
+            if full not in typed:
+                typed.add(full)
+                lines.append(f"# TYPE {full} {kind}")
+            return full
+
+        def fmt(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = [f'{k}="{_escape(v)}"' for k, v in labels + extra]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        for (name, labels), count, total, buckets in hists:
+            full = metric(name, "_seconds", "histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                lines.append(f"{full}_bucket{fmt(labels, (('le', repr(bound)),))} {cumulative}")
+            lines.append(f"{full}_bucket{fmt(labels, (('le', '+Inf'),))} {count}")
+            lines.append(f"{full}_sum{fmt(labels)} {total:.6f}")
+            lines.append(f"{full}_count{fmt(labels)} {count}")
+        for (name, labels), value in counters:
+            lines.append(f"{metric(name, '_total', 'counter')}{fmt(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, directory: Path = METRICS_DIR, every: float = DUMP_EVERY) -> bool:
+        """Escribe gabinete.prom y gabinete.json (reemplazo atómico) si pasaron `every` segundos."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._dumped < every:
+                return False
+            self._dumped = now
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, text in (("gabinete.prom", self.prometheus()),
+                           ("gabinete.json", json.dumps(self.snapshot(), ensure_ascii=False))):
+            tmp = directory / f".{name}.tmp"
+            tmp.write_text(text, encoding="utf-8")
+            os.replace(tmp, directory / name)
+        return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+METRICS = Registry()
+span     = METRICS.span
+timed    = METRICS.timed
+count    = METRICS.count
+observe  = METRICS.observe
@@ -1,7 +1,6 @@
-import sqlite3
-from pathlib import Path
 import streamlit as st
-from spark_patch import ensure_schema, admin_panel
+from gabinete_db import get_pool
+from spark_patch import admin_panel
 
 st.title("Evaluación SPARK")
 
@@ -12,10 +11,6 @@ if key != ADMIN_KEY:
     st.info("Introduce la clave docente para acceder.")
     st.stop()
 
-# usa la MISMA base de datos que app.py: data/gabinete.db
-DB_PATH = Path(__file__).resolve().parent.parent / "data" / "gabinete.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-ensure_schema(conn)
-
+# usa el MISMO pool (WAL) que app.py: data/gabinete.db (el esquema lo crea get_pool)
 st.markdown("---")
-admin_panel(conn)
+admin_panel(get_pool())
@@ -0,0 +1,296 @@
+# ===========================================
+# Gabinete Personal — rizoma.py (conexiones entre gabinetes, Fase 4)
+# ===========================================
+# Similitud de textos entre gabinetes: descripción, etiquetas, título y las tres
+# reflexiones se convierten en una bolsa de palabras con hashing (sin
+# vocabulario que mantener), sin stopwords del español ni acentos.
+#
+# - Los términos de cada gabinete se calculan una sola vez y quedan en
+#   entry_terms (con el rev del gabinete). La cola de escritura los calcula al
+#   publicar (write_queue.py); al refrescar solo quedan los editados por otras
+#   vías.
+# - En memoria se arma un índice invertido con NumPy (término -> gabinetes) con
+#   pesos TF-IDF normalizados (coseno). Buscar los k más parecidos a un
+#   gabinete solo recorre las listas de sus propios términos: milisegundos con
+#   10k gabinetes.
+# - Al cambiar entries el índice no se relee entero: se leen solo las filas con
+#   rev posterior al último refresco, se quitan las borradas y se recalculan
+#   IDF y pesos sobre los conteos que ya están en memoria.
+# - group_graph() resume las conexiones entre grupos (coseno entre los
+#   centroides de cada grupo) para dibujar el mapa del rizoma.
+from __future__ import annotations
+import re, threading, zlib
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+import streamlit as st
+
+import gabinete_db as gdb
+
+N_FEATURES = 1 << 20         # espacio de hashing (colisiones despreciables con este vocabulario)
+MIN_LEN = 3
+# peso de cada campo en la bolsa de palabras
+FIELDS = {"artifact_title": 2.0, "tags": 3.0, "artifact_desc": 1.0,
+          "reflection_q1": 1.0, "reflection_q2": 1.0, "reflection_q3": 1.0}
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun aunque cada casi como con contra cual
+cuales cuando de del desde donde dos el ella ellas ello ellos en entre era eran eres es esa esas ese eso esos
+esta estaba estan estar estas este esto estos estoy fue fueron fui ha habia han hasta hay la las le les lo los
+mas me mi mis mismo mucho muy nada ni no nos nosotros nuestra nuestro o otra otras otro otros para pero poco
+por porque que quien quienes se sea ser si sido siempre sin sobre solo son su sus tambien tan tanto te tiene
+tienen todo todos tu tus un una uno unos usted ya yo cosa cosas hace hacer puede pueden sus mientras
+entonces ademas cual cuya cuyo donde durante segun tras mediante
+""".split())
+
+
+# ---------- términos ----------
+def tokens(text: str) -> List[str]:
+    """Palabras sin mayúsculas ni acentos, sin stopwords ni palabras cortas."""
+    return [t for t in re.findall(r"[^\W\d_]+", gdb.normalize_tag(text or ""))
+            if len(t) >= MIN_LEN and t not in STOPWORDS]
+
+
+def _feature(term: str) -> int:
+    return zlib.crc32(term.encode()) & (N_FEATURES - 1)   # estable entre procesos (no como hash())
+
+
+def vectorize(row) -> Tuple[np.ndarray, np.ndarray]:
+    """(features uint32, conteos float32) de un gabinete, ponderados por campo."""
+    counts: Dict[int, float] = {}
+    for field, weight in FIELDS.items():
+        words = tokens(row[field])
+        if field == "tags":      # cada etiqueta también como término entero ("memoria colectiva")
+            words += ["#" + gdb.normalize_tag(t) for t in gdb.parse_tags(row[field])]
+        for w in words:
+            f = _feature(w)
+            counts[f] = counts.get(f, 0.0) + weight
+    feats = np.fromiter(counts.keys(), np.uint32, len(counts))
+    vals = np.fromiter(counts.values(), np.float32, len(counts))
+    order = np.argsort(feats)
+    return feats[order], vals[order]
+
+
+STALE_SQL = "(t.entry_id IS NULL OR t.rev < e.rev)"
+
+
+def update_terms(pool: gdb.ConnectionPool, batch: int = 500, *, ids: List[int] | None = None,
+                 since_rev: int = -1) -> int:
+    """Calcula entry_terms de los gabinetes nuevos o editados. Devuelve cuántos procesó.
+
+    `ids`: solo esos gabinetes (la cola de escritura, recién publicados);
+    `since_rev`: solo los escritos después de ese rev.
+    """
+    cols = ", ".join(f"e.{f}" for f in FIELDS)
+    where, args = f"e.rev > ? AND {STALE_SQL}", [since_rev]
+    if ids is not None:
+        where += f" AND e.id IN ({','.join('?' * len(ids))})"
+        args += ids
+    done = 0
+    while True:
+        with pool.connection() as con:
+            rows = con.execute(
+                f"""SELECT e.id, e.rev, {cols} FROM entries e LEFT JOIN entry_terms t ON t.entry_id = e.id
+                    WHERE {where} LIMIT ?""", args + [batch],
+            ).fetchall()
+        if not rows:
+            return done
+        out = []
+        for r in rows:
+            feats, vals = vectorize(r)
+            out.append((r["id"], r["rev"], feats.tobytes(), vals.tobytes()))
+        with pool.transaction() as con:
+            con.executemany("INSERT OR REPLACE INTO entry_terms(entry_id, rev, feats, counts) VALUES (?, ?, ?, ?)", out)
+        done += len(rows)
+
+
+# ---------- índice ----------
+class Related(NamedTuple):
+    entry_id: int
+    score: float
+
+
+class Index:
+    """Índice invertido TF-IDF en arreglos NumPy. Inmutable: updated() devuelve uno nuevo."""
+
+    def __init__(self) -> None:
+        self.generation = -1                      # contador de entries con que se armó
+        self.ids = np.zeros(0, np.int64)          # fila -> entry_id
+        self.groups = np.zeros(0, object)         # fila -> grupo
+        self.row_of: Dict[int, int] = {}
+        # por gabinete (CSR): términos, conteos crudos y pesos normalizados
+        self.indptr = np.zeros(1, np.int64)
+        self.feats = np.zeros(0, np.uint32)
+        self.tf = np.zeros(0, np.float32)
+        self.weights = np.zeros(0, np.float32)
+        # invertido: postings ordenados por término
+        self.post_feats = np.zeros(0, np.uint32)
+        self.post_rows = np.zeros(0, np.int32)
+        self.post_weights = np.zeros(0, np.float32)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @staticmethod
+    def _raw(rows: Iterable[Tuple[int, str, bytes, bytes]]) -> Tuple[np.ndarray, ...]:
+        """(ids, grupos, largos, términos, conteos) de filas de entry_terms."""
+        ids, groups, feats, counts = [], [], [], []
+        for entry_id, grp, f, c in rows:
+            ids.append(entry_id)
+            groups.append(grp)
+            feats.append(np.frombuffer(f, np.uint32))
+            counts.append(np.frombuffer(c, np.float32))
+        return (np.array(ids, np.int64), np.array(groups, object),
+                np.fromiter(map(len, feats), np.int64, len(feats)),
+                np.concatenate(feats) if feats else np.zeros(0, np.uint32),
+                np.concatenate(counts) if counts else np.zeros(0, np.float32))
+
+    def build(self, rows: Iterable[Tuple[int, str, bytes, bytes]]) -> None:
+        self._load(*self._raw(rows))
+
+    def updated(self, rows: Iterable[Tuple[int, str, bytes, bytes]], removed: Iterable[int] = ()) -> "Index":
+        """Índice nuevo con `rows` agregadas o reemplazadas (por entry_id) y sin `removed`.
+
+        Los conteos de las demás filas se reutilizan tal cual: solo se recalculan IDF y pesos.
+        """
+        new = self._raw(rows)
+        drop = np.fromiter({*removed, *new[0].tolist()}, np.int64)
+        keep = ~np.isin(self.ids, drop)
+        lengths = np.diff(self.indptr)
+        post_keep = np.repeat(keep, lengths)
+        index = Index()
+        index._load(np.concatenate([self.ids[keep], new[0]]), np.concatenate([self.groups[keep], new[1]]),
+                    np.concatenate([lengths[keep], new[2]]), np.concatenate([self.feats[post_keep], new[3]]),
+                    np.concatenate([self.tf[post_keep], new[4]]))
+        return index
+
+    def _load(self, ids: np.ndarray, groups: np.ndarray, lengths: np.ndarray,
+              all_feats: np.ndarray, tf: np.ndarray) -> None:
+        n = len(ids)
+        self.ids, self.groups, self.tf = ids, groups, tf
+        self.row_of = {e: i for i, e in enumerate(ids.tolist())}
+        self.indptr = np.zeros(n + 1, np.int64)
+        np.cumsum(lengths, out=self.indptr[1:])
+        rows_of_post = np.repeat(np.arange(n, dtype=np.int32), lengths)
+
+        # idf suavizado, tf sublineal y normalización L2 por gabinete
+        uniq, inverse, df = np.unique(all_feats, return_inverse=True, return_counts=True)
+        idf = (np.log((1 + n) / (1 + df)) + 1).astype(np.float32)
+        w = (1 + np.log(tf)) * idf[inverse]
+        norms = np.sqrt(np.bincount(rows_of_post, weights=w * w, minlength=n)).astype(np.float32)
+        w = (w / np.where(norms > 0, norms, 1)[rows_of_post]).astype(np.float32)
+        self.feats, self.weights = all_feats, w
+
+        order = np.argsort(all_feats, kind="stable")
+        self.post_feats = all_feats[order]
+        self.post_rows = rows_of_post[order]
+        self.post_weights = w[order]
+
+    def _scores(self, feats: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Producto punto (coseno) del vector dado contra todos los gabinetes."""
+        lo = np.searchsorted(self.post_feats, feats, "left")
+        hi = np.searchsorted(self.post_feats, feats, "right")
+        lengths = hi - lo
+        total = int(lengths.sum())
+        if not total:
+            return np.zeros(len(self), np.float32)
+        # posiciones de todas las listas concatenadas, sin bucle de Python
+        starts = np.repeat(lo - np.cumsum(lengths) + lengths, lengths)
+        pos = starts + np.arange(total)
+        contrib = self.post_weights[pos] * np.repeat(weights, lengths)
+        return np.bincount(self.post_rows[pos], weights=contrib, minlength=len(self)).astype(np.float32)
+
+    def related(self, entry_id: int, k: int = 8) -> List[Related]:
+        row = self.row_of.get(entry_id)
+        if row is None:
+            return []
+        a, b = self.indptr[row], self.indptr[row + 1]
+        scores = self._scores(self.feats[a:b], self.weights[a:b])
+        scores[row] = 0.0
+        k = min(k, len(self) - 1)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [Related(int(self.ids[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def group_graph(self) -> Tuple[List[str], np.ndarray]:
+        """(grupos, matriz de coseno entre sus centroides)."""
+        names = sorted(set(self.groups.tolist()))
+        if not names:
+            return [], np.zeros((0, 0), np.float32)
+        gidx = {g: i for i, g in enumerate(names)}
+        row_group = np.array([gidx[g] for g in self.groups], np.int64)
+        lengths = np.diff(self.indptr)
+        post_group = np.repeat(row_group, lengths)
+        # centroide de cada grupo como vector disperso: (grupo, término) -> suma de pesos
+        keys = post_group * N_FEATURES + self.feats.astype(np.int64)
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        summed = np.bincount(inverse, weights=self.weights).astype(np.float32)
+        cg, cf = uniq // N_FEATURES, uniq % N_FEATURES
+        norms = np.sqrt(np.bincount(cg, weights=summed * summed, minlength=len(names)))
+        summed /= np.where(norms > 0, norms, 1)[cg]
+        # pocos grupos: los centroides caben densos sobre los términos que aparecen
+        terms, col = np.unique(cf, return_inverse=True)
+        dense = np.zeros((len(names), len(terms)), np.float32)
+        dense[cg, col] = summed
+        sim = dense @ dense.T
+        np.fill_diagonal(sim, 1.0)
+        return names, sim
+
+
+# ---------- motor compartido ----------
+class Rizoma:
+    """Índice del proceso: se actualiza (solo lo que cambió) cuando cambia entries."""
+
+    def __init__(self, pool: gdb.ConnectionPool):
+        self.pool = pool
+        self.index = Index()
+        self._lock = threading.Lock()
+
+    def refresh(self) -> Index:
+        with self.pool.connection() as con:
+            gen = gdb.generation(con, "entries")
+        if gen == self.index.generation:
+            return self.index
+        with self._lock:
+            if gen != self.index.generation:
+                self.index = self._updated(self.index)   # las lecturas en curso siguen con el anterior
+        return self.index
+
+    def _updated(self, index: Index) -> Index:
+        """`index` más lo que cambió desde su generación: filas con rev posterior, sin las borradas."""
+        since = index.generation           # rev toma el valor del contador: rev > generación = cambió después
+        update_terms(self.pool, since_rev=since)        # casi siempre nada: la cola ya los calculó
+        cols = ", ".join(f"e.{f}" for f in FIELDS)
+        with self.pool.connection() as con:
+            con.execute("BEGIN")           # una instantánea para contador, filas y conteo
+            gen = gdb.generation(con, "entries")
+            rows = [tuple(r) for r in con.execute(
+                f"""SELECT e.id, e.grp, t.feats, t.counts FROM entries e JOIN entry_terms t ON t.entry_id = e.id
+                    WHERE e.rev > ? AND NOT {STALE_SQL}""", (since,))]
+            # publicados entre update_terms y la instantánea: se calculan aquí (entry_terms los tendrá después)
+            for r in con.execute(f"""SELECT e.id, e.grp, {cols} FROM entries e LEFT JOIN entry_terms t
+                                     ON t.entry_id = e.id WHERE e.rev > ? AND {STALE_SQL}""", (since,)):
+                feats, vals = vectorize(r)
+                rows.append((r["id"], r["grp"], feats.tobytes(), vals.tobytes()))
+            total = con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            removed: List[int] = []
+            if len(index) + sum(r[0] not in index.row_of for r in rows) != total:   # hubo borrados
+                alive = np.array([i for (i,) in con.execute("SELECT id FROM entries")], np.int64)
+                removed = index.ids[~np.isin(index.ids, alive)].tolist()
+            con.rollback()
+        new = index.updated(rows, removed)
+        new.generation = gen
+        return new
+
+    def related(self, entry_id: int, k: int = 8) -> List[Related]:
+        return self.refresh().related(entry_id, k)
+
+    def group_graph(self) -> Tuple[List[str], np.ndarray]:
+        return self.refresh().group_graph()
+
+
+@st.cache_resource(show_spinner=False)
+def get_rizoma(db_path: str = str(gdb.DB_PATH)) -> Rizoma:
+    return Rizoma(gdb.get_pool(db_path))
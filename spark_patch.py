@@ -0,0 +1,99 @@
+# ===========================================
+# Gabinete Personal — spark_patch.py (Evaluación SPARK del Panel docente)
+# ===========================================
+# Grilla editable por grupo: una fila por gabinete, una columna por criterio
+# SPARK (0–4). La grilla vive dentro de un formulario, así que editar celdas no
+# provoca reruns; "Guardar" escribe todas las filas cambiadas en una sola
+# transacción (gdb.save_spark_scores). Si alguien más guardó la misma fila
+# mientras tanto, esa fila no se pisa: se avisa y la grilla se recarga con lo
+# guardado.
+#
+# La usan el Panel docente de app.py, pages/…/98_Evaluación_SPARK.py y app_eval.py.
+from __future__ import annotations
+import csv, io
+from typing import List
+
+import streamlit as st
+
+import gabinete_db as gdb
+
+CRITERIA = {c: c.upper() for c in gdb.SPARK_CRITERIA}
+
+
+def _changes(before: List, after) -> List[gdb.SparkChange]:
+    """Filas de la grilla con algún criterio distinto al cargado (solo esas celdas)."""
+    import pandas as pd
+    out = []
+    for row, (_, edited) in zip(before, after.iterrows()):
+        scores = {}
+        for c in gdb.SPARK_CRITERIA:
+            new = None if pd.isna(edited[c]) else int(edited[c])      # vacía -> sin calificar
+            if new != row[c]:
+                scores[c] = new
+        if scores:
+            out.append(gdb.SparkChange(row["id"], row["version"], scores))
+    return out
+
+
+def summary_csv(pool: gdb.ConnectionPool) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["grupo", "gabinetes", "evaluados", *CRITERIA.values(), "total (0–20)"])
+    for r in gdb.spark_summary(pool):
+        w.writerow([r["grp"], r["entries"], r["graded"], *(r[c] for c in gdb.SPARK_CRITERIA), r["total"]])
+    return buf.getvalue().encode("utf-8")
+
+
+def admin_panel(pool: gdb.ConnectionPool) -> None:
+    import pandas as pd
+
+    summary = gdb.spark_summary(pool)
+    if not summary:
+        st.info("Aún no hay gabinetes para evaluar.")
+        return
+    group = st.selectbox("Grupo a evaluar", [r["grp"] for r in summary], key="spark_group")
+    rows = gdb.spark_grid(pool, group)
+    columns = ["id", "student_name", "artifact_title", *gdb.SPARK_CRITERIA, "version"]
+    df = pd.DataFrame([tuple(r) for r in rows], columns=columns)
+
+    # nonce en la key: tras guardar, la grilla se vuelve a crear con lo que quedó en la base
+    nonce = st.session_state.setdefault("spark_nonce", 0)
+    with st.form(f"spark_form_{group}"):
+        edited = st.data_editor(
+            df, key=f"spark_grid_{group}_{nonce}", hide_index=True, use_container_width=True,
+            disabled=["id", "student_name", "artifact_title", "version"],
+            column_order=["student_name", "artifact_title", *gdb.SPARK_CRITERIA],
+            column_config={
+                "student_name": "Estudiante", "artifact_title": "Obra",
+                **{c: st.column_config.NumberColumn(label, min_value=0, max_value=4, step=1)
+                   for c, label in CRITERIA.items()},
+            },
+        )
+        submitted = st.form_submit_button("Guardar calificaciones")
+
+    if submitted:
+        changes = _changes(rows, edited)
+        if changes:
+            saved, conflicts = gdb.save_spark_scores(pool, changes)
+            st.session_state.spark_result = (saved, conflicts)
+            st.session_state.spark_nonce = nonce + 1
+            st.rerun()
+        st.info("No hay cambios que guardar.")
+
+    if result := st.session_state.pop("spark_result", None):
+        saved, conflicts = result
+        st.success(f"{saved} gabinete(s) guardados.")
+        if conflicts:
+            names = [r["student_name"] for r in rows if r["id"] in conflicts]
+            st.warning("Alguien más guardó antes estas filas; no se sobrescribieron y ya ves sus "
+                       f"calificaciones: {', '.join(names)}. Vuelve a editarlas si hace falta.")
+
+    st.markdown("**Resumen por grupo**")
+    st.dataframe(
+        pd.DataFrame([tuple(r) for r in summary], columns=["grp", "entries", "graded", *gdb.SPARK_CRITERIA, "total"])
+        .rename(columns={"grp": "Grupo", "entries": "Gabinetes", "graded": "Evaluados",
+                         **CRITERIA, "total": "Total (0–20)"}),
+        hide_index=True, use_container_width=True,
+    )
+    st.download_button("Descargar resumen SPARK (CSV)", data=summary_csv(pool),
+                       file_name="spark_resumen.csv", mime="text/csv")
@@ -0,0 +1,376 @@
+# ===========================================
+# Gabinete Personal — storage.py (dónde viven los archivos de media)
+# ===========================================
+# El disco de Streamlit Cloud se borra en cada reinicio, así que la media puede
+# vivir en un almacén S3 (AWS, MinIO, Cloudflare R2, Supabase Storage…). Todo
+# pasa por la misma interfaz, con claves relativas a DATA_DIR
+# ("uploads/objects/ab/cd/abcd….jpg"):
+#
+#   put / get / stream / exists / size / delete / url / keys
+#
+# - LocalStorage: carpeta local (lo de siempre, data/).
+# - S3Storage: cualquier servicio compatible con S3 (requiere boto3). Los
+#   archivos grandes (audio) se suben por partes (multipart) en paralelo y
+#   url() entrega un enlace firmado temporal: el navegador descarga directo
+#   del bucket, sin pasar por el servidor de Streamlit.
+#
+# Configuración por variables de entorno (en Streamlit Cloud, las claves de
+# primer nivel de Secrets también llegan como variables de entorno):
+#   GABINETE_STORAGE=s3  GABINETE_S3_BUCKET=…  [GABINETE_S3_PREFIX=…]
+#   [GABINETE_S3_ENDPOINT=http://localhost:9000  (MinIO local)]  [GABINETE_S3_REGION=…]
+#   credenciales: las habituales de AWS (AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY)
+#
+# Migrator copia en segundo plano los archivos de un almacén a otro sin
+# detener la app (ver `python media.py migrate`).
+from __future__ import annotations
+import abc, mimetypes, os, tempfile, threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, Optional
+
+import streamlit as st
+
+import gabinete_db as gdb
+
+CHUNK = 1024 * 1024
+URL_TTL = 3600                          # segundos de validez de un enlace firmado
+MULTIPART_THRESHOLD = 8 * 1024 * 1024   # desde este tamaño se sube por partes
+PART_SIZE = 8 * 1024 * 1024             # S3 exige >= 5 MB por parte (salvo la última)
+PART_WORKERS = 4                        # partes en vuelo a la vez (memoria: PART_WORKERS * PART_SIZE)
+S3_CONNECTIONS = 16                     # conexiones HTTP reutilizadas por el cliente del proceso
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("audio/mp4", ".m4a")
+
+
+def guess_type(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+class StorageError(RuntimeError):
+    pass
+
+
+class Storage(abc.ABC):
+    """Interfaz común de los almacenes (claves relativas a DATA_DIR, con '/')."""
+
+    name = "base"
+
+    @abc.abstractmethod
+    def put(self, key: str, fileobj: IO[bytes], content_type: Optional[str] = None) -> int:
+        """Guarda el contenido de `fileobj` (leído por bloques). Devuelve los bytes escritos."""
+        raise NotImplementedError
+
+    def put_file(self, key: str, path: Path) -> int:
+        with open(path, "rb") as fh:
+            return self.put(key, fh, guess_type(key))
+
+    @abc.abstractmethod
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Bloques del archivo, del byte `start` al `end` (incluido) o hasta el final."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        return b"".join(self.stream(key))
+
+    @abc.abstractmethod
+    def size(self, key: str) -> Optional[int]:
+        """Tamaño en bytes, o None si no existe."""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.size(key) is not None
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def url(self, key: str, expires: int = URL_TTL) -> Optional[str]:
+        """Enlace que el navegador puede abrir directo; None si hay que servir los bytes desde la app."""
+        return None
+
+    @abc.abstractmethod
+    def keys(self, prefix: str = "") -> Iterator[str]:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.name}>"
+
+
+# ---------- disco local ----------
+class LocalStorage(Storage):
+    """Carpeta local. `mounts` reparte prefijos de clave en otras carpetas ({"static/": static/})."""
+
+    def __init__(self, root: Path = gdb.DATA_DIR, mounts: Optional[Dict[str, Path]] = None):
+        self.root = Path(root)
+        self.mounts = {prefix: Path(d) for prefix, d in (mounts or {}).items()}
+        self.name = f"local:{self.root}"
+
+    def _split(self, key: str):
+        for prefix, d in self.mounts.items():
+            if key.startswith(prefix):
+                return d, key[len(prefix):]
+        return self.root, key
+
+    def path(self, key: str) -> Path:
+        root, rel = self._split(key)
+        p = (root / rel).resolve()
+        if not p.is_relative_to(root.resolve()):
+            raise StorageError(f"clave fuera del almacén: {key}")
+        return p
+
+    def put(self, key: str, fileobj: IO[bytes], content_type: Optional[str] = None) -> int:
+        dest = self.path(key)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        size = 0
+        tmp = tempfile.NamedTemporaryFile(dir=dest.parent, suffix=".part", delete=False)
+        try:
+            with tmp:
+                for block in iter(lambda: fileobj.read(CHUNK), b""):
+                    tmp.write(block)
+                    size += len(block)
+            os.replace(tmp.name, dest)       # nadie ve un archivo a medio escribir
+        finally:
+            Path(tmp.name).unlink(missing_ok=True)   # si falló la lectura o el replace, sin restos .part
+        return size
+
+    def put_file(self, key: str, path: Path) -> int:
+        dest = self.path(key)
+        if Path(path).resolve() == dest:
+            return dest.stat().st_size
+        return super().put_file(key, path)
+
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with open(self.path(key), "rb") as fh:
+            fh.seek(start)
+            left = None if end is None else end - start + 1
+            while left is None or left > 0:
+                block = fh.read(CHUNK if left is None else min(CHUNK, left))
+                if not block:
+                    break
+                if left is not None:
+                    left -= len(block)
+                yield block
+
+    def size(self, key: str) -> Optional[int]:
+        p = self.path(key)
+        return p.stat().st_size if p.is_file() else None
+
+    def delete(self, key: str) -> None:
+        self.path(key).unlink(missing_ok=True)
+
+    def keys(self, prefix: str = "") -> Iterator[str]:
+        for mount, root in [("", self.root), *self.mounts.items()]:
+            for p in root.rglob("*") if root.is_dir() else ():
+                key = mount + p.relative_to(root).as_posix()
+                if key.startswith(prefix) and p.is_file() and not p.name.endswith(".part") \
+                        and (mount or self._split(key)[0] == self.root):
+                    yield key
+
+
+# ---------- S3 y compatibles ----------
+class S3Storage(Storage):
+    """Bucket S3 (o MinIO/R2/moto con `endpoint_url`). Un cliente por proceso, compartido por los hilos."""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, client: Any = None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.name = f"s3://{bucket}/{self.prefix}"
+        if client is None:
+            try:
+                import boto3
+                from botocore.config import Config
+            except ImportError as ex:
+                raise StorageError("GABINETE_STORAGE=s3 requiere boto3 (pip install boto3)") from ex
+            client = boto3.client(
+                "s3", endpoint_url=endpoint_url, region_name=region,
+                config=Config(max_pool_connections=S3_CONNECTIONS, retries={"mode": "standard"}),
+            )
+        self.client = client
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def put(self, key: str, fileobj: IO[bytes], content_type: Optional[str] = None) -> int:
+        ctype = content_type or guess_type(key)
+        first = fileobj.read(MULTIPART_THRESHOLD)
+        if len(first) < MULTIPART_THRESHOLD:
+            self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=first, ContentType=ctype)
+            return len(first)
+        return self._multipart(key, first, fileobj, ctype)
+
+    def _multipart(self, key: str, first: bytes, fileobj: IO[bytes], ctype: str) -> int:
+        """Subida por partes: hasta PART_WORKERS partes en vuelo; si algo falla, se aborta (sin restos cobrados)."""
+        upload = self.client.create_multipart_upload(Bucket=self.bucket, Key=self._key(key), ContentType=ctype)
+        upload_id = upload["UploadId"]
+
+        def send(number: int, body: bytes) -> Dict[str, Any]:
+            res = self.client.upload_part(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                                          PartNumber=number, Body=body)
+            return {"PartNumber": number, "ETag": res["ETag"]}
+
+        parts, size, number = [], 0, 0
+        pending = set()
+        buffer = first
+        try:
+            with ThreadPoolExecutor(PART_WORKERS) as pool:
+                while True:
+                    while len(buffer) < PART_SIZE and (block := fileobj.read(CHUNK)):
+                        buffer += block
+                    if not buffer:
+                        break
+                    body, buffer = buffer[:PART_SIZE], buffer[PART_SIZE:]
+                    number += 1
+                    size += len(body)
+                    if len(pending) >= PART_WORKERS:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        parts += [f.result() for f in done]
+                    pending.add(pool.submit(send, number, body))
+                parts += [f.result() for f in pending]
+            parts.sort(key=lambda p: p["PartNumber"])
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                                                  MultipartUpload={"Parts": parts})
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
+            raise
+        return size
+
+    def stream(self, key: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        args = {"Bucket": self.bucket, "Key": self._key(key)}
+        if start or end is not None:
+            args["Range"] = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(**args)["Body"]
+        try:
+            yield from body.iter_chunks(CHUNK)
+        finally:
+            body.close()
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))["ContentLength"]
+        except Exception as ex:
+            if _status(ex) == 404:
+                return None
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def url(self, key: str, expires: int = URL_TTL) -> Optional[str]:
+        # se firma en local (sin ir a la red): barato aunque se pida por cada tarjeta
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=expires)
+
+    def keys(self, prefix: str = "") -> Iterator[str]:
+        pages = self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self._key(prefix))
+        for page in pages:
+            for obj in page.get("Contents", []):
+                yield obj["Key"][len(self.prefix):]
+
+
+def _status(ex: Exception) -> Optional[int]:
+    """Código HTTP de un ClientError de botocore (sin importar botocore)."""
+    meta = getattr(ex, "response", {}).get("ResponseMetadata", {})
+    code = getattr(ex, "response", {}).get("Error", {}).get("Code")
+    return meta.get("HTTPStatusCode") or (404 if code in ("404", "NoSuchKey", "NotFound") else None)
+
+
+# ---------- configuración ----------
+def from_env(env: Optional[Dict[str, str]] = None) -> Storage:
+    env = os.environ if env is None else env
+    kind = env.get("GABINETE_STORAGE", "local").lower()
+    if kind == "local":
+        return LocalStorage(gdb.DATA_DIR)
+    if kind == "s3":
+        if not env.get("GABINETE_S3_BUCKET"):
+            raise StorageError("GABINETE_STORAGE=s3 requiere GABINETE_S3_BUCKET")
+        return S3Storage(env["GABINETE_S3_BUCKET"], env.get("GABINETE_S3_PREFIX", ""),
+                         env.get("GABINETE_S3_ENDPOINT") or None, env.get("GABINETE_S3_REGION") or None)
+    raise StorageError(f"GABINETE_STORAGE desconocido: {kind}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_storage() -> Storage:
+    """Almacén configurado; uno por proceso (el cliente S3 y sus conexiones se comparten entre sesiones)."""
+    return from_env()
+
+
+# ---------- migración en segundo plano ----------
+class Migrator(threading.Thread):
+    """Copia `keys` de `src` a `dst` en segundo plano (lo que ya está en dst con el mismo tamaño se salta).
+
+    La app sigue funcionando mientras tanto: las lecturas usan la copia local si
+    existe y si no el almacén configurado, y lo nuevo se sube al publicar. Con
+    `prune`, cada archivo se borra de `src` solo después de verificar la copia.
+    """
+
+    def __init__(self, src: Storage, dst: Storage, keys: Iterable[str], prune: bool = False, workers: int = 4):
+        super().__init__(name="gabinete-migrator", daemon=True)
+        self.src, self.dst, self.prune, self.workers = src, dst, prune, workers
+        self._keys = list(dict.fromkeys(keys))
+        self._lock = threading.Lock()
+        self._halt = threading.Event()
+        self.total = len(self._keys)
+        self.copied = self.skipped = self.missing = self.failed = 0
+        self.bytes = 0
+        self.errors: Dict[str, str] = {}
+
+    def stop(self) -> None:
+        self._halt.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"total": self.total, "copied": self.copied, "skipped": self.skipped,
+                    "missing": self.missing, "failed": self.failed, "bytes": self.bytes,
+                    "done": not self.is_alive() and self.ident is not None}
+
+    def _one(self, key: str) -> None:
+        if self._halt.is_set():
+            return
+        try:
+            size = self.src.size(key)
+            outcome = "missing"
+            if size is not None:
+                outcome = "skipped"
+                if self.dst.size(key) != size:
+                    with _reader(self.src, key) as fh:
+                        written = self.dst.put(key, fh, guess_type(key))
+                    if self.dst.size(key) != written:
+                        raise StorageError("la copia no quedó completa")
+                    outcome = "copied"
+                if self.prune:
+                    self.src.delete(key)
+            with self._lock:
+                setattr(self, outcome, getattr(self, outcome) + 1)
+                if outcome == "copied":
+                    self.bytes += size
+        except Exception as ex:
+            with self._lock:
+                self.failed += 1
+                self.errors[key] = str(ex)
+
+    def run(self) -> None:
+        with ThreadPoolExecutor(self.workers) as pool:
+            list(pool.map(self._one, self._keys))
+
+
+class _reader:
+    """Archivo de solo lectura sobre src: el propio archivo si es local, un temporal si es remoto."""
+
+    def __init__(self, storage: Storage, key: str):
+        self.storage, self.key = storage, key
+
+    def __enter__(self) -> IO[bytes]:
+        if isinstance(self.storage, LocalStorage):
+            self.fh = open(self.storage.path(self.key), "rb")
+        else:
+            self.fh = tempfile.SpooledTemporaryFile(max_size=PART_SIZE)
+            for block in self.storage.stream(self.key):
+                self.fh.write(block)
+            self.fh.seek(0)
+        return self.fh
+
+    def __exit__(self, *exc) -> None:
+        self.fh.close()
+
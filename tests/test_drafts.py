@@ -0,0 +1,36 @@
+# test_drafts.py — borradores: el token es el único secreto (gabinete_db.create_draft/load_draft)
+#
+#   python -m pytest -q tests
+from __future__ import annotations
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = gdb.open_pool(tmp_path / "gabinete.db")
+    yield pool
+    pool.close()
+
+
+def test_email_gets_a_token_only_once(pool):
+    token = gdb.create_draft(pool, "Ana@Example.com")
+    assert token
+    # otra sesión que escribe el mismo email (con otras mayúsculas o espacios) no recibe el token
+    assert gdb.create_draft(pool, " ana@example.com ") is None
+    assert gdb.load_draft(pool, token)["email"] == "ana@example.com"
+    assert gdb.load_draft(pool, "no-es-un-token") is None
+
+
+def test_save_merges_only_changed_fields(pool):
+    token = gdb.create_draft(pool, "ana@example.com")
+    other = gdb.create_draft(pool, "beto@example.com")
+    gdb.save_draft(pool, token, {"artifact_title": "Caja", "fase1_q1": "uno"})
+    gdb.save_draft(pool, token, {"fase1_q1": "uno, corregido"})
+    assert gdb.load_draft(pool, token)["data"] == {"artifact_title": "Caja", "fase1_q1": "uno, corregido"}
+    assert gdb.load_draft(pool, other)["data"] == {}
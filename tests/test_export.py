@@ -0,0 +1,124 @@
+# test_export.py — respaldos incrementales (export.delta_export) y su restauración
+#
+#   python -m pytest -q tests
+from __future__ import annotations
+import csv, io, json, sys, time
+from datetime import datetime
+from pathlib import Path
+from zipfile import ZipFile
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+import export              # noqa: E402
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(export, "DELTA_DIR", tmp_path / "exports" / "deltas")
+    return tmp_path
+
+
+@pytest.fixture
+def pool(data):
+    pool = gdb.open_pool(data / "gabinete.db")
+    yield pool
+    pool.close()
+
+
+def add_media(pool: gdb.ConnectionPool, data: Path, name: str, content: bytes) -> str:
+    rel = f"uploads/objects/{name}"
+    (data / rel).parent.mkdir(parents=True, exist_ok=True)
+    (data / rel).write_bytes(content)
+    gdb.register_media(pool, name.split(".")[0], rel, "image", len(content))
+    return rel
+
+
+def entry(name: str, images: str = "") -> dict:
+    return {"student_name": name, "email": f"{name}@example.com", "group": "Grupo A",
+            "artifact_title": f"Obra de {name}", "artifact_desc": "primera versión",
+            "tags": "luz", "image_urls": images}
+
+
+def contents(path: Path):
+    with ZipFile(path) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        rows = list(csv.DictReader(io.TextIOWrapper(zf.open("gabinetes.csv"), encoding="utf-8")))
+        media = sorted(n[len("media/"):] for n in zf.namelist() if n.startswith("media/"))
+    return manifest, {r["student_name"]: r for r in rows}, media
+
+
+def edit(pool: gdb.ConnectionPool, entry_id: int, desc: str) -> None:
+    with pool.transaction() as con:
+        con.execute("UPDATE entries SET artifact_desc = ? WHERE id = ?", (desc, entry_id))
+
+
+def test_deltas_chain_by_rev(pool, data):
+    a = add_media(pool, data, "aaa.jpg", b"A")
+    b = add_media(pool, data, "bbb.jpg", b"B")
+    gdb.insert_entry(pool, entry("ana", a))
+    gdb.insert_entry(pool, entry("beto", a))
+
+    first, _ = export.delta_export(pool)
+    manifest, rows, media = contents(first)
+    assert manifest["since_rev"] == -1 and set(rows) == {"ana", "beto"} and media == [a]
+
+    nothing, _ = export.delta_export(pool)
+    assert contents(nothing)[0]["rows"] == 0
+
+    gdb.insert_entry(pool, entry("caro", f"{a}||{b}"))
+    second, _ = export.delta_export(pool)
+    manifest, rows, media = contents(second)
+    assert manifest["since_rev"] == contents(nothing)[0]["upto_rev"]
+    assert set(rows) == {"caro"} and media == [b]              # a ya iba en el primero
+
+
+def test_date_delta_does_not_break_the_chain(pool, data):
+    ana = gdb.insert_entry(pool, entry("ana"))
+    export.delta_export(pool)
+    time.sleep(0.01)
+    edit(pool, ana, "editada antes de la fecha")
+    time.sleep(0.01)
+    by_date, _ = export.delta_export(pool, datetime.utcnow().isoformat())
+    assert contents(by_date)[0]["rows"] == 0
+
+    nxt, _ = export.delta_export(pool)                 # sigue al respaldo por rev, no al de fecha
+    _, rows, _ = contents(nxt)
+    assert rows["ana"]["artifact_desc"] == "editada antes de la fecha"
+
+
+def test_restore_applies_deltas_in_order(pool, data, tmp_path):
+    a = add_media(pool, data, "aaa.jpg", b"A")
+    ana = gdb.insert_entry(pool, entry("ana", a))
+    gdb.insert_entry(pool, entry("beto"))
+    first, _ = export.delta_export(pool)
+    edit(pool, ana, "segunda versión")
+    second, _ = export.delta_export(pool)
+
+    target = tmp_path / "restaurada" / "gabinete.db"
+    rows, files = export.restore(target, [first, second])
+    assert (rows, files) == (3, 1)
+    restored = gdb.open_pool(target)
+    with restored.connection() as con, pool.connection() as orig:
+        cols = "id, student_name, artifact_desc, image_urls"
+        assert con.execute(f"SELECT {cols} FROM entries ORDER BY id").fetchall() == \
+            orig.execute(f"SELECT {cols} FROM entries ORDER BY id").fetchall()
+        assert [r[0] for r in con.execute("SELECT entry_id FROM media_refs")] == [ana]
+        assert [r[0] for r in con.execute("SELECT tag FROM entry_tags WHERE entry_id = ?", (ana,))] == ["luz"]
+    restored.close()
+    assert (target.parent / a).read_bytes() == b"A"
+
+
+def test_restore_skips_paths_outside_data_dir(pool, tmp_path):
+    evil = tmp_path / "evil.zip"
+    with ZipFile(evil, "w") as zf:
+        zf.writestr("media/../../fuera.txt", "x")
+        zf.writestr(f"media/{tmp_path}/absoluta.txt", "x")
+        zf.writestr("media/uploads/bien.jpg", "ok")
+        zf.writestr("gabinetes.csv", ",".join(export.CSV_HEADER) + "\n")
+    target = tmp_path / "a" / "b" / "gabinete.db"
+    assert export.restore(target, [evil]) == (0, 1)
+    assert not (tmp_path / "a" / "fuera.txt").exists() and not (tmp_path / "absoluta.txt").exists()
+    assert (target.parent / "uploads" / "bien.jpg").exists()
@@ -0,0 +1,117 @@
+# test_migrations.py — una base creada por la app original sube a la última versión sin perder nada
+#
+#   python -m pytest -q tests
+from __future__ import annotations
+import sqlite3, sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+
+# esquema de app.py antes de gabinete_db (sin user_version)
+BASELINE = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    student_name TEXT NOT NULL,
+    email TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    artifact_title TEXT NOT NULL,
+    artifact_desc TEXT NOT NULL,
+    tags TEXT DEFAULT '',
+    reflection_q1 TEXT DEFAULT '',
+    reflection_q2 TEXT DEFAULT '',
+    reflection_q3 TEXT DEFAULT '',
+    image_urls TEXT DEFAULT '',
+    audio_url TEXT DEFAULT '',
+    suno_link TEXT DEFAULT ''
+);
+"""
+ROWS = [
+    ("2025-03-01T10:00:00", "Ana", "ana@x", "Grupo A", "Caja", "objeto", "Luz, sombra",
+     "Una reflexión sobre la memoria", "uploads/images/a.jpg||uploads/images/b.jpg", ""),
+    ("2025-03-02T10:00:00", "Beto", "beto@x", "Grupo B", "Mapa", "papel", "luz",
+     "", "", "uploads/audio/b.mp3"),
+    ("2025-09-01T10:00:00", "Caro", "caro@x", "Grupo A", "Nido", "ramas", "",
+     "", "uploads/images/c.jpg", ""),
+]
+
+
+@pytest.fixture
+def baseline(tmp_path) -> Path:
+    path = tmp_path / "gabinete.db"
+    con = sqlite3.connect(path)
+    con.executescript(BASELINE)
+    con.executemany(
+        """INSERT INTO entries(created_at, student_name, email, grp, artifact_title, artifact_desc, tags,
+                               reflection_q1, image_urls, audio_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", ROWS)
+    con.commit()
+    con.close()
+    return path
+
+
+def test_upgrade_from_baseline(baseline):
+    pool = gdb.open_pool(baseline)
+    with pool.connection() as con:
+        assert con.execute("PRAGMA user_version").fetchone()[0] == len(gdb.MIGRATIONS)
+        rows = con.execute("SELECT student_name, image_count, updated_at = created_at FROM entries "
+                           "ORDER BY id").fetchall()
+        assert [tuple(r) for r in rows] == [("Ana", 2, 1), ("Beto", 0, 1), ("Caro", 1, 1)]
+        assert con.execute("SELECT COUNT(*) FROM entries_fts").fetchone()[0] == len(ROWS)
+        assert con.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        assert con.execute("PRAGMA foreign_key_check").fetchall() == []
+
+    # etiquetas normalizadas, búsqueda sin acentos y filtros sobre lo migrado
+    assert dict(gdb.tag_counts(pool)) == {"Luz": 2, "sombra": 1}      # "Luz" y "luz" cuentan juntas
+    cards, _ = gdb.fetch_page(pool, search="reflexion")
+    assert [c.author for c in cards] == ["Ana"]
+    cards, _ = gdb.fetch_page(pool, group="Grupo A", tag="luz")
+    assert [c.author for c in cards] == ["Ana"]
+
+    # lo nuevo toma un rev mayor que todo lo migrado
+    new = gdb.insert_entry(pool, {"student_name": "Dani", "email": "d@x", "group": "Grupo B",
+                                  "artifact_title": "Eco", "artifact_desc": "sonido"})
+    with pool.connection() as con:
+        revs = dict(con.execute("SELECT id, rev FROM entries").fetchall())
+    assert revs[new] > max(r for i, r in revs.items() if i != new)
+    pool.close()
+
+
+def test_reopening_is_a_no_op(baseline):
+    gdb.open_pool(baseline).close()
+    con = sqlite3.connect(baseline)
+    before = con.execute("SELECT id, rev, updated_at FROM entries ORDER BY id").fetchall()
+    con.close()
+    pool = gdb.open_pool(baseline)
+    with pool.connection() as con:
+        assert gdb.migrate(con) == len(gdb.MIGRATIONS)
+        assert [tuple(r) for r in con.execute("SELECT id, rev, updated_at FROM entries ORDER BY id")] == before
+    pool.close()
+
+
+def test_failed_step_rolls_back(baseline, monkeypatch):
+    monkeypatch.setattr(gdb, "MIGRATIONS", [*gdb.MIGRATIONS, "CREATE TABLE entries (id INTEGER)"])
+    with pytest.raises(sqlite3.OperationalError):
+        gdb.open_pool(baseline)
+    con = sqlite3.connect(baseline)
+    assert con.execute("PRAGMA user_version").fetchone()[0] == 0       # ningún paso a medias
+    assert con.execute("SELECT COUNT(*) FROM entries").fetchone()[0] == len(ROWS)
+    con.close()
+
+
+def test_keyset_pages_cover_every_entry(baseline):
+    pool = gdb.open_pool(baseline)
+    for i in range(22):
+        gdb.insert_entry(pool, {"student_name": f"A{i}", "email": "", "group": "Grupo C",
+                                "artifact_title": "t", "artifact_desc": "d",
+                                "created_at": "2025-10-01T00:00:00"})       # mismas fechas: desempata el id
+    seen, after = [], None
+    while True:
+        cards, after = gdb.fetch_page(pool, group="Grupo C", after=after, limit=10)
+        seen += [c.id for c in cards]
+        if after is None:
+            break
+    assert len(seen) == 22 and seen == sorted(seen, reverse=True)
+    pool.close()
@@ -0,0 +1,56 @@
+# test_spark.py — guardado de la grilla SPARK con concurrencia optimista (gabinete_db.save_spark_scores)
+#
+#   python -m pytest -q tests
+from __future__ import annotations
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+from gabinete_db import SparkChange  # noqa: E402
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = gdb.open_pool(tmp_path / "gabinete.db")
+    yield pool
+    pool.close()
+
+
+def entries(pool, n: int):
+    return [gdb.insert_entry(pool, {"student_name": f"A{i}", "email": "", "group": "Grupo A",
+                                    "artifact_title": "t", "artifact_desc": "d"}) for i in range(n)]
+
+
+def grid(pool):
+    return {r["id"]: r for r in gdb.spark_grid(pool, "Grupo A")}
+
+
+def test_concurrent_edit_is_not_overwritten(pool):
+    a, b = entries(pool, 2)
+    assert gdb.save_spark_scores(pool, [SparkChange(a, 0, {"s": 3, "p": 2}), SparkChange(b, 0, {"k": 4})]) == (2, [])
+    loaded = grid(pool)
+    assert (loaded[a]["s"], loaded[a]["p"], loaded[a]["version"]) == (3, 2, 1)
+
+    # dos docentes con la misma grilla cargada: la segunda no pisa a la primera
+    assert gdb.save_spark_scores(pool, [SparkChange(a, 1, {"s": 4})]) == (1, [])
+    assert gdb.save_spark_scores(pool, [SparkChange(a, 1, {"s": 0}), SparkChange(b, 1, {"r": 1})]) == (1, [a])
+    after = grid(pool)
+    assert (after[a]["s"], after[a]["p"], after[a]["version"]) == (4, 2, 2)
+    assert (after[b]["k"], after[b]["r"], after[b]["version"]) == (4, 1, 2)
+
+
+def test_new_row_created_twice_conflicts(pool):
+    (a,) = entries(pool, 1)
+    assert gdb.save_spark_scores(pool, [SparkChange(a, 0, {"a": 1})]) == (1, [])
+    assert gdb.save_spark_scores(pool, [SparkChange(a, 0, {"a": 2})]) == (0, [a])
+    assert grid(pool)[a]["a"] == 1
+
+
+def test_out_of_range_score_rolls_back_the_batch(pool):
+    a, b = entries(pool, 2)
+    with pytest.raises(Exception):
+        gdb.save_spark_scores(pool, [SparkChange(a, 0, {"s": 2}), SparkChange(b, 0, {"s": 9})])
+    assert grid(pool)[a]["version"] == 0       # una sola transacción: nada a medias
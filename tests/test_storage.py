@@ -0,0 +1,137 @@
+# test_storage.py — almacenes de media (storage.py) contra un S3 simulado con moto
+#
+#   pip install "moto[s3]" boto3 pytest
+#   python -m pytest -q tests
+#
+# moto intercepta las llamadas de boto3 en el mismo proceso: no hace falta red
+# ni MinIO. Sin moto o sin boto3 las pruebas de S3 se saltan.
+from __future__ import annotations
+import io, os, sys, urllib.parse
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import storage  # noqa: E402
+
+BUCKET = "gabinete-test"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    for var, value in {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test",
+                       "AWS_DEFAULT_REGION": "us-east-1"}.items():
+        monkeypatch.setenv(var, value)
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        yield storage.S3Storage(BUCKET, prefix="media", client=client)
+
+
+@pytest.fixture
+def local(tmp_path):
+    return storage.LocalStorage(tmp_path / "data")
+
+
+def test_storage_is_abstract():
+    with pytest.raises(TypeError):
+        storage.Storage()
+
+
+def test_s3_put_get_stream_exists_delete(s3):
+    key = "uploads/objects/ab/cd/abcd.jpg"
+    data = bytes(range(256)) * 40
+    assert not s3.exists(key)
+    assert s3.put(key, io.BytesIO(data)) == len(data)
+    assert s3.exists(key) and s3.size(key) == len(data)
+    assert s3.get(key) == data
+    assert b"".join(s3.stream(key, 100, 199)) == data[100:200]
+    assert b"".join(s3.stream(key, 5000)) == data[5000:]
+    head = s3.client.head_object(Bucket=BUCKET, Key="media/" + key)
+    assert head["ContentType"] == "image/jpeg"
+    assert list(s3.keys("uploads/")) == [key]
+    s3.delete(key)
+    assert not s3.exists(key) and s3.size(key) is None
+
+
+def test_s3_presigned_url(s3):
+    key = "uploads/audio/aud.m4a"
+    s3.put(key, io.BytesIO(b"audio"))
+    url = s3.url(key, expires=120)
+    parts = urllib.parse.urlsplit(url)
+    assert parts.path.endswith("/media/" + key) and "Signature" in urllib.parse.parse_qs(parts.query)
+    # moto también responde a requests: el enlace firmado sirve sin credenciales
+    res = pytest.importorskip("requests").get(url)
+    assert res.status_code == 200 and res.content == b"audio"
+    assert res.headers["Content-Type"] == "audio/mp4"
+
+
+def test_s3_multipart_audio(s3):
+    key = "uploads/audio/largo.m4a"
+    data = os.urandom(2 * storage.PART_SIZE + 123_457)     # 3 partes, la última corta
+    assert s3.put(key, io.BytesIO(data)) == len(data)
+    head = s3.client.head_object(Bucket=BUCKET, Key="media/" + key)
+    assert head["ContentType"] == "audio/mp4"
+    assert head["ETag"].strip('"').endswith("-3")           # ETag de una subida multipart
+    assert s3.get(key) == data
+    assert s3.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+
+def test_s3_multipart_failure_aborts(s3, monkeypatch):
+    real = s3.client.upload_part
+
+    def flaky(**kw):
+        if kw["PartNumber"] == 2:
+            raise RuntimeError("corte de red")
+        return real(**kw)
+
+    monkeypatch.setattr(s3.client, "upload_part", flaky)
+    with pytest.raises(RuntimeError):
+        s3.put("uploads/audio/roto.m4a", io.BytesIO(os.urandom(2 * storage.PART_SIZE)))
+    assert not s3.exists("uploads/audio/roto.m4a")
+    assert s3.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads", []) == []
+
+
+def test_migrator_local_to_s3_round_trip(local, s3):
+    files = {f"uploads/objects/{i:02x}/obj{i}.webp": os.urandom(1000 + i) for i in range(12)}
+    for key, data in files.items():
+        local.put(key, io.BytesIO(data))
+    s3.put("uploads/objects/00/obj0.webp", io.BytesIO(files["uploads/objects/00/obj0.webp"]))   # ya copiado
+
+    mig = storage.Migrator(local, s3, [*files, "uploads/objects/ff/no-existe.webp"])
+    mig.start()
+    mig.join(30)
+    stats = mig.stats()
+    assert stats["done"] and stats["failed"] == 0, mig.errors
+    assert (stats["copied"], stats["skipped"], stats["missing"]) == (11, 1, 1)
+    assert sorted(s3.keys("uploads/")) == sorted(files)
+
+    # y de vuelta, borrando del origen lo que ya quedó verificado en el destino
+    back = storage.LocalStorage(local.root.parent / "restored")
+    mig = storage.Migrator(s3, back, list(s3.keys()), prune=True)
+    mig.start()
+    mig.join(30)
+    assert mig.stats()["copied"] == len(files) and mig.failed == 0, mig.errors
+    assert {key: back.get(key) for key in back.keys()} == files
+    assert list(s3.keys()) == []
+
+
+def test_local_put_leaves_no_part_file_on_error(local):
+    class Broken(io.RawIOBase):
+        def __init__(self):
+            self.calls = 0
+
+        def read(self, n=-1):
+            self.calls += 1
+            if self.calls > 1:
+                raise OSError("se cortó la subida")
+            return b"x" * 10
+
+    with pytest.raises(OSError):
+        local.put("uploads/audio/a.mp3", Broken())
+    folder = local.path("uploads/audio/a.mp3").parent
+    assert list(folder.iterdir()) == []
+    assert local.put("uploads/audio/a.mp3", io.BytesIO(b"ok")) == 2
+    assert list(folder.iterdir()) == [folder / "a.mp3"]
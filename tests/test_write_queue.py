@@ -0,0 +1,110 @@
+# test_write_queue.py — cola de publicaciones (write_queue.py): spool, idempotencia y Deferred
+#
+#   python -m pytest -q tests
+from __future__ import annotations
+import json, sqlite3, sys, time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import gabinete_db as gdb  # noqa: E402
+import write_queue         # noqa: E402
+
+
+def entry(name: str, **extra) -> dict:
+    return {"student_name": name, "email": f"{name}@example.com", "group": "Grupo A",
+            "artifact_title": f"Obra de {name}", "artifact_desc": "descripción", "tags": "luz, sombra", **extra}
+
+
+def count(pool: gdb.ConnectionPool) -> int:
+    with pool.connection() as con:
+        return con.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def wait_for(check, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() > deadline:
+            raise AssertionError("no ocurrió a tiempo")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = gdb.open_pool(tmp_path / "gabinete.db", pragmas={"busy_timeout": 50})
+    yield pool
+    pool.close()
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return tmp_path / "spool"
+
+
+def test_submit_returns_id_and_empties_spool(pool, spool):
+    wq = write_queue.WriteQueue(pool, spool)
+    ids = [f.result(5) for f in [wq.submit(entry(f"a{i}")) for i in range(5)]]
+    wq.close()
+    assert len(set(ids)) == 5 and count(pool) == 5
+    assert list(spool.glob("*.json")) == []
+    assert wq.stats()["written"] == 5
+
+
+def test_same_submission_id_inserts_once(pool, spool):
+    wq = write_queue.WriteQueue(pool, spool)
+    first = wq.insert(entry("ana", submission_id="envio-1"))
+    again = wq.insert(entry("ana", submission_id="envio-1"))
+    wq.close()
+    assert first == again and count(pool) == 1
+
+
+def test_recovers_spool_after_crash(pool, spool):
+    # el proceso se cayó con dos envíos en el spool; uno alcanzó a insertarse antes del unlink
+    spool.mkdir()
+    rows = [entry("ana", submission_id="s1", created_at="2025-09-01T10:00:00"),
+            entry("beto", submission_id="s2", created_at="2025-09-01T10:00:01")]
+    for row in rows:
+        (spool / f"{row['created_at'].replace(':', '')}_{row['submission_id']}.json").write_text(json.dumps(row))
+    (spool / "a_medias.part").write_text("{")
+    done = gdb.insert_entry(pool, rows[0])
+
+    wq = write_queue.WriteQueue(pool, spool)
+    wait_for(lambda: not list(spool.glob("*.json")))
+    wq.close()
+    assert wq.recovered == 2
+    with pool.connection() as con:
+        found = dict(con.execute("SELECT submission_id, id FROM entries").fetchall())
+    assert set(found) == {"s1", "s2"} and found["s1"] == done      # sin duplicado
+    assert list(spool.glob("*.part")) == []
+
+
+def test_locked_database_defers_then_publishes(pool, spool, monkeypatch):
+    monkeypatch.setattr(write_queue, "RETRY_DELAYS", (0.01, 0.01))
+    monkeypatch.setattr(write_queue, "RETRY_LATER", 0.1)
+    blocker = sqlite3.connect(pool.path, timeout=0)
+    blocker.execute("BEGIN IMMEDIATE")          # otro proceso con el lock de escritura
+    wq = write_queue.WriteQueue(pool, spool)
+    try:
+        with pytest.raises(write_queue.Deferred):
+            wq.insert(entry("ana"), timeout=5)
+        assert len(list(spool.glob("*.json"))) == 1       # el envío sigue a salvo
+        assert wq.stats()["deferred"] == 1 and wq.stats()["retries"] == 2
+    finally:
+        blocker.rollback()
+        blocker.close()
+    wait_for(lambda: count(pool) == 1)
+    wait_for(lambda: not list(spool.glob("*.json")))
+    wq.close()
+    assert wq.stats()["deferred"] == 0
+
+
+def test_invalid_row_goes_to_failed(pool, spool):
+    wq = write_queue.WriteQueue(pool, spool)
+    bad = {k: v for k, v in entry("sin-titulo").items() if k != "artifact_title"}
+    with pytest.raises(KeyError):
+        wq.insert(bad)
+    assert wq.insert(entry("ok")) > 0            # el resto del lote y lo siguiente sí entran
+    wq.close()
+    assert len(list((spool / "failed").glob("*.json"))) == 1
+    assert count(pool) == 1
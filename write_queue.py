@@ -0,0 +1,223 @@
+# ===========================================
+# Gabinete Personal — write_queue.py (cola de publicaciones)
+# ===========================================
+# Cuando un grupo entero publica en los últimos minutos antes de la entrega,
+# cada sesión competía por el lock de escritura de SQLite. Ahora las sesiones
+# solo encolan su gabinete: un único hilo escritor junta lo que llegue en una
+# ventana corta (GABINETE_WRITE_BATCH_MS, por defecto 5 ms) y lo inserta en una
+# sola transacción; cada sesión recibe su id por un Future.
+#
+# Antes de encolar, el envío se escribe en data/spool/ (un JSON por envío,
+# con fsync). Si el proceso se cae, al arrancar se reintenta lo que quedó en el
+# spool; el submission_id de cada envío evita duplicados.
+#
+# Si la base está ocupada o sin disco (sqlite3.OperationalError), el lote se
+# reintenta con espera creciente (RETRY_DELAYS). Si aun así no entra, el envío
+# sigue en el spool, vuelve a la cola cada RETRY_LATER segundos y la sesión
+# recibe Deferred: se le dice que quedó en cola, no que falló (así no lo reenvía).
+#
+# Tras cada lote, el mismo hilo calcula los términos de Rizoma (entry_terms) de
+# lo publicado, ya con las sesiones respondidas.
+from __future__ import annotations
+import json, os, queue, sqlite3, threading, time, uuid
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import streamlit as st
+
+import gabinete_db as gdb
+import metrics
+
+SPOOL_DIR    = gdb.DATA_DIR / "spool"
+BATCH_WINDOW = float(os.getenv("GABINETE_WRITE_BATCH_MS", "5")) / 1000
+MAX_BATCH    = 64
+ACK_TIMEOUT  = 60.0          # segundos que una sesión espera su id
+RETRY_DELAYS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0)   # esperas entre reintentos de un lote (s)
+RETRY_LATER  = 30.0          # después, cada cuánto vuelve a la cola lo que sigue en el spool
+
+
+class Deferred(Exception):
+    """El envío no se pudo publicar todavía; sigue en el spool y el hilo escritor lo reintentará."""
+
+
+class Pending(NamedTuple):
+    row: Dict[str, Any]
+    spool: Path
+    queued_at: float
+    done: Future
+
+
+class WriteQueue:
+    """Un hilo escritor que inserta por lotes lo que las sesiones encolan."""
+
+    def __init__(self, pool: gdb.ConnectionPool, spool_dir: Path = SPOOL_DIR,
+                 batch_window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH):
+        self.pool = pool
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[Optional[Pending]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self.written = self.failed = self.retries = self.batches = 0
+        self._deferred: set = set()      # submission_id de los que esperan en el spool
+        self.last_batch = 0
+        self.last_latency = self.max_latency = 0.0
+        self._latency_sum = 0.0
+        self.recovered = self._recover()
+        self._thread = threading.Thread(target=self._run, name="gabinete-writer", daemon=True)
+        self._thread.start()
+
+    # ---------- sesiones ----------
+    def submit(self, row: Dict[str, Any]) -> "Future[int]":
+        """Guarda el envío en el spool y lo encola. El Future entrega el id del gabinete."""
+        row = {**row, "submission_id": row.get("submission_id") or uuid.uuid4().hex,
+               "created_at": row.get("created_at") or datetime.utcnow().isoformat()}
+        spool = self._spool(row)
+        pending = Pending(row, spool, time.monotonic(), Future())
+        self._queue.put(pending)
+        return pending.done
+
+    def insert(self, row: Dict[str, Any], timeout: float = ACK_TIMEOUT) -> int:
+        return self.submit(row).result(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "written": self.written,
+                "failed": self.failed,
+                "deferred": len(self._deferred),
+                "retries": self.retries,
+                "batches": self.batches,
+                "last_batch": self.last_batch,
+                "avg_batch": self.written / self.batches if self.batches else 0.0,
+                "last_latency_ms": self.last_latency * 1000,
+                "avg_latency_ms": self._latency_sum / self.written * 1000 if self.written else 0.0,
+                "max_latency_ms": self.max_latency * 1000,
+                "recovered": self.recovered,
+            }
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Termina lo encolado y detiene el hilo (lo que no alcance queda en el spool)."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # ---------- spool ----------
+    def _spool(self, row: Dict[str, Any]) -> Path:
+        path = self.spool_dir / f"{row['created_at'].replace(':', '')}_{row['submission_id']}.json"
+        tmp = path.with_suffix(".part")
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(row, fh, ensure_ascii=False)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def _recover(self) -> int:
+        """Vuelve a encolar (en orden de llegada) los envíos que quedaron en el spool."""
+        for stale in self.spool_dir.glob("*.part"):
+            stale.unlink()               # nunca se confirmó el encolado: la sesión ya vio el error
+        found = sorted(self.spool_dir.glob("*.json"))
+        for path in found:
+            with open(path, encoding="utf-8") as fh:
+                row = json.load(fh)
+            self._queue.put(Pending(row, path, time.monotonic(), Future()))
+        return len(found)
+
+    # ---------- hilo escritor ----------
+    def _next_batch(self) -> List[Pending]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)    # cerrar después de este lote
+                break
+            batch.append(item)
+        return batch
+
+    def _insert(self, batch: List[Pending]) -> List[Any]:
+        """Inserta el lote; las filas que fallan por OperationalError se reintentan con espera creciente."""
+        results: List[Any] = [None] * len(batch)
+        todo = list(range(len(batch)))
+        for delay in (*RETRY_DELAYS, None):
+            try:
+                res = gdb.insert_entries(self.pool, [batch[i].row for i in todo])
+            except Exception as ex:      # la transacción entera falló (p. ej. base bloqueada)
+                res = [ex] * len(todo)
+            for i, r in zip(todo, res):
+                results[i] = r
+            todo = [i for i in todo if isinstance(results[i], sqlite3.OperationalError)]
+            if not todo or delay is None:
+                return results
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+        return results
+
+    def _requeue(self, p: Pending) -> None:
+        timer = threading.Timer(RETRY_LATER, self._queue.put, args=(Pending(p.row, p.spool, p.queued_at, Future()),))
+        timer.daemon = True
+        timer.start()
+
+    def _run(self) -> None:
+        while batch := self._next_batch():
+            results = self._insert(batch)
+            now = time.monotonic()
+            with self._lock:
+                self.batches += 1
+                self.last_batch = len(batch)
+                for p, res in zip(batch, results):
+                    if isinstance(res, sqlite3.OperationalError):
+                        self._deferred.add(p.row["submission_id"])
+                        continue
+                    self._deferred.discard(p.row["submission_id"])
+                    if isinstance(res, BaseException):
+                        self.failed += 1
+                        continue
+                    latency = now - p.queued_at
+                    self.written += 1
+                    self.last_latency = latency
+                    self.max_latency = max(self.max_latency, latency)
+                    self._latency_sum += latency
+            for p, res in zip(batch, results):
+                if isinstance(res, sqlite3.OperationalError):
+                    # base ocupada/sin disco tras los reintentos: queda en el spool y vuelve a la cola
+                    self._requeue(p)
+                    deferred = Deferred(f"envío {p.row['submission_id']} en cola: {res}")
+                    deferred.__cause__ = res
+                    p.done.set_exception(deferred)
+                elif isinstance(res, BaseException):
+                    # un envío inválido se aparta a spool/failed para revisarlo a mano
+                    (self.spool_dir / "failed").mkdir(exist_ok=True)
+                    os.replace(p.spool, self.spool_dir / "failed" / p.spool.name)
+                    p.done.set_exception(res)
+                else:
+                    p.spool.unlink(missing_ok=True)
+                    p.done.set_result(res)
+            self._index_terms([res for res in results if isinstance(res, int)])
+
+    def _index_terms(self, ids: List[int]) -> None:
+        """Términos de Rizoma de lo recién publicado: abrir la Fase 4 no los calcula todos de golpe."""
+        if not ids:
+            return
+        try:
+            import rizoma                # NumPy: solo en el hilo escritor, no en el arranque de la app
+            rizoma.update_terms(self.pool, ids=ids)
+        except Exception:
+            metrics.count("writer.terms_errors")     # Rizoma.refresh los calculará al necesitarlos
+
+
+@st.cache_resource(show_spinner=False)
+def get_write_queue(db_path: str = str(gdb.DB_PATH)) -> WriteQueue:
+    """Cola única por proceso (todas las sesiones de Streamlit comparten el hilo escritor)."""
+    return WriteQueue(gdb.get_pool(db_path))